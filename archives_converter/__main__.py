@@ -1,7 +1,17 @@
-from utils.dialog import dialog
+import sys
+
 
 def main():
+    # Any argument selects the headless command line, none the interactive menu
+    if len(sys.argv) > 1:
+        from utils.cli import run_cli
+
+        sys.exit(run_cli(sys.argv[1:]))
+
+    from utils.dialog import dialog
+
     dialog()
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
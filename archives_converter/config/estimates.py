@@ -0,0 +1,42 @@
+# Cost model of the dry-run planner. These are rough defaults, adjust them to
+# the hardware the conversion runs on.
+
+# Output size as a fraction of the input size
+output_size_ratios = {
+    "AIP": {
+        "image": 3.0,
+        "video": 5.0,
+        "audio": 4.0,
+        "dvd": 2.5,
+        "pdf": 1.1,
+        "document": 1.5,
+        "other": 1.0,
+    },
+    "DIP": {
+        "image": 0.5,
+        "video": 0.4,
+        "audio": 0.8,
+        "dvd": 0.3,
+        "pdf": 1.1,
+        "document": 1.5,
+        "other": 1.0,
+    },
+}
+
+# Media seconds converted per wall second by one job
+media_speed = {
+    "AIP": {"video": 1.0, "audio": 100.0, "dvd": 1.5},
+    "DIP": {"video": 2.0, "audio": 60.0, "dvd": 2.5},
+}
+
+# Bytes per media second, used when the duration cannot be probed
+fallback_bitrates = {"video": 1.5e6, "audio": 32e3, "dvd": 1.0e6}
+
+# Input bytes converted per wall second by one job
+byte_speed = {"image": 20e6, "pdf": 5e6}
+
+# Wall seconds per document converted by LibreOffice
+document_seconds = 8.0
+
+# Bytes copied per second while cloning
+copy_speed = 100e6
@@ -0,0 +1,69 @@
+import os
+
+# Total number of CPU cores the converter scheduler may hand out at once
+default_core_budget = os.cpu_count() or 1
+
+# Worker lanes of the converter scheduler.
+# max_jobs: number of jobs the lane may run at once (None = only bound by the core budget)
+converter_lanes = {
+    "ffmpeg": {"max_jobs": None},
+    "pillow": {"max_jobs": None},
+    "ghostscript": {"max_jobs": None},
+    # unoconv kills any running soffice.bin before starting, so never run two at once
+    "libreoffice": {"max_jobs": 1},
+    # files that are skipped or left untouched, no external tool involved
+    "other": {"max_jobs": 4},
+}
+
+# CPU cores reserved by one job, also passed to ffmpeg as -threads
+job_cores = {
+    "video": 4,
+    "dvd": 8,
+    "audio": 1,
+    "image": 1,
+    "pdf": 1,
+    "document": 1,
+    "other": 0,
+}
+
+# Number of images sent to an image worker process at once
+image_batch_size = 16
+
+# Size of the conversion cache (--cache-dir), least recently used outputs are
+# evicted beyond it
+conversion_cache_bytes = 500 * 1024**3
+
+# Slowest throughput expected from the external tools of each cost class, in
+# media seconds encoded per second for audio, video and DVDs, in megabytes read
+# per second for PDFs and documents. A tool run may take timeout_factor times the
+# time its input needs at that rate, or at the rate measured during the run when
+# slower, and never less than minimum_tool_timeout seconds.
+minimum_throughput = {
+    "audio": 5.0,
+    "video": 0.25,
+    "dvd": 0.25,
+    "pdf": 0.2,
+    "document": 0.05,
+}
+timeout_factor = 3
+minimum_tool_timeout = 120
+
+# Seconds a tool reporting its progress (ffmpeg, Ghostscript) may go without
+# advancing before it is considered stalled and stopped
+stall_timeout = 300
+
+# Seconds a stopped or cancelled tool gets to exit before it is killed
+termination_grace = 5
+
+# Files copied at once while cloning, parallel streams are much faster on a NAS
+clone_threads = 8
+# Bytes copied per system call while cloning, progress moves by this much
+copy_chunk_bytes = 64 * 1024**2
+# Files from this size are copied in checksummed chunks to a partial file, an
+# interrupted clone resumes them from the last chunk that checks out
+resumable_copy_bytes = 1024**3
+resumable_chunk_bytes = 64 * 1024**2
+# Cloning hashes every file it copies, so bags get their manifest without
+# reading the payload again. Reflinked and in-kernel copies read the source once
+# more for it: turn it off for clones that are never bagged
+hash_while_copying = True
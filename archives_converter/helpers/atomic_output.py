@@ -0,0 +1,40 @@
+import os
+
+from helpers.digests import record_output_digest
+
+# Converters write to a hidden temporary name next to the final output and
+# rename it once complete, so a finished output is never confused with a
+# half-written one after a crash.
+TEMP_PREFIX = ".partial_"
+
+
+def temp_output_path(output_path):
+    folder, name = os.path.split(output_path)
+    return os.path.join(folder, f"{TEMP_PREFIX}{name}")
+
+
+def commit_output(temp_path, output_path):
+    os.replace(temp_path, output_path)
+    # Outputs in a destination that records digests get theirs for the bag
+    record_output_digest(output_path)
+
+
+def discard_output(temp_path):
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_outputs(folder):
+    """Removes temporary outputs left in a folder by an interrupted conversion."""
+    removed = 0
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return removed
+    for name in names:
+        if name.startswith(TEMP_PREFIX):
+            discard_output(os.path.join(folder, name))
+            removed += 1
+    return removed
@@ -1,11 +1,16 @@
 import os
 import pkg_resources
 import mimetypes
+import tempfile
 from datetime import datetime
 import bagit
 import glob
 from rich import print
 
+from helpers.digests import file_digest, recorded_digest
+
+PAYLOAD_MANIFEST = "manifest-sha256.txt"
+
 
 def detect_formats(bag_dir):
     """Detects the file format types in a directory."""
@@ -93,7 +98,79 @@ Checksum-Algorithm: SHA-256
         print(f"❌ Error creating bag-info.txt: {e}")
 
 
-def update_bag_info(bag_path, current_files):
+def _manifest_path(path):
+    # Characters a manifest line cannot hold, encoded as in bagit
+    return (
+        path.replace("%", "%25")
+        .replace("\n", "%0A")
+        .replace("\r", "%0D")
+        .replace(os.sep, "/")
+    )
+
+
+def write_payload_manifest(bag_dir, digests):
+    """Writes manifest-sha256.txt from the recorded digests of the payload.
+
+    Only the files without a digest, or changed since it was recorded, are
+    read. Returns the payload bytes, files and the number of files hashed.
+    """
+    total_bytes = 0
+    total_files = 0
+    hashed_files = 0
+    entries = []
+    data_folder = os.path.join(bag_dir, "data")
+    for root, dirs, files in os.walk(data_folder):
+        for file in files:
+            file_path = os.path.join(root, file)
+            sha256 = recorded_digest(digests, file_path)
+            if sha256 is None:
+                sha256 = file_digest(file_path)
+                hashed_files += 1
+            relative_path = os.path.relpath(file_path, bag_dir)
+            entries.append((_manifest_path(relative_path), sha256))
+            total_bytes += os.path.getsize(file_path)
+            total_files += 1
+    with open(os.path.join(bag_dir, PAYLOAD_MANIFEST), "w", encoding="utf-8") as f:
+        for relative_path, sha256 in sorted(entries):
+            f.write(f"{sha256}  {relative_path}\n")
+    return total_bytes, total_files, hashed_files
+
+
+def print_manifest_stats(bag_dir, total_files, hashed_files):
+    print(
+        f"[bold cyan]Manifest:[/bold cyan] {os.path.basename(bag_dir)}, "
+        f"{total_files - hashed_files} files from recorded digests, "
+        f"{hashed_files} hashed"
+    )
+
+
+def make_bag(bag_dir, digests):
+    """Turns bag_dir into a bag whose payload manifest comes from digests.
+
+    Like bagit.make_bag, the content moves into data/, but the payload is
+    only read for the files without a recorded digest, and bag.save then
+    only hashes the tag files into the tag manifest.
+    """
+    temp_data = tempfile.mkdtemp(dir=bag_dir)
+    for name in os.listdir(bag_dir):
+        path = os.path.join(bag_dir, name)
+        if path != temp_data:
+            os.rename(path, os.path.join(temp_data, name))
+    data_folder = os.path.join(bag_dir, "data")
+    os.rename(temp_data, data_folder)
+    # mkdtemp made it private, the payload folder gets the mode of the bag
+    os.chmod(data_folder, os.stat(bag_dir).st_mode)
+
+    total_bytes, total_files, hashed_files = write_payload_manifest(bag_dir, digests)
+    create_bagit_txt(bag_dir)
+    create_bag_info(bag_dir)
+    bag = bagit.Bag(bag_dir)
+    bag.info["Payload-Oxum"] = f"{total_bytes}.{total_files}"
+    bag.save()
+    print_manifest_stats(bag_dir, total_files, hashed_files)
+
+
+def update_bag_info(bag_path, current_files, digests=None):
     bag = bagit.Bag(bag_path)
     modification_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -126,4 +203,10 @@ def update_bag_info(bag_path, current_files):
         bag.info[f"￭-{modification_date}-New-Files-Count"] = len(new_files)
         bag.info[f"￭-{modification_date}-New-Files"] = multiline_value
 
-    bag.save(manifests=True)
+    if digests is None or set(bag.algorithms) != {"sha256"}:
+        bag.save(manifests=True)
+        return
+    total_bytes, total_files, hashed_files = write_payload_manifest(bag_path, digests)
+    bag.info["Payload-Oxum"] = f"{total_bytes}.{total_files}"
+    bag.save()
+    print_manifest_stats(bag_path, total_files, hashed_files)
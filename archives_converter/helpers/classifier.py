@@ -0,0 +1,228 @@
+import os
+import threading
+from collections import namedtuple
+
+from config.formats import (
+    image_extensions,
+    video_extensions,
+    audio_extensions,
+    text_extensions,
+)
+
+# Sniffing is configured through the environment so the image worker processes
+# and the workers of other hosts pick it up as well
+SNIFF_VARIABLE = "ARCHIVES_CONVERTER_SNIFF"
+# Every signature below is found in the first bytes of a file
+SNIFF_BYTES = 8192
+# Sniffed files remembered by (device, inode, mtime), cleared when full
+SNIFF_CACHE_ENTRIES = 1_000_000
+
+DVD_EXTENSIONS = (".vob", ".ifo", ".bup")
+
+_media_classes = {
+    **{ext.lower(): "image" for ext in image_extensions},
+    **{ext.lower(): "video" for ext in video_extensions},
+    **{ext.lower(): "audio" for ext in audio_extensions},
+    **{ext.lower(): "text" for ext in text_extensions},
+    **{ext: "dvd" for ext in DVD_EXTENSIONS},
+}
+
+# media_class None: not a media file, converters leave it alone
+Classification = namedtuple("Classification", ["media_class", "extension"])
+
+# What the content of a file is: its media class, its usual extension, the
+# extensions that name it correctly and whether the signature is strong enough
+# to override an extension (weak ones only name files without extension)
+Sniffed = namedtuple("Sniffed", ["media_class", "extension", "extensions", "strong"])
+
+_ISO_MEDIA_MP4 = (".mp4", ".m4v", ".m4a", ".mov", ".3gp", ".3g2")
+# ftyp major brand -> sniffed content
+_ISO_MEDIA_BRANDS = {
+    b"qt  ": Sniffed("video", ".mov", (".mov",), True),
+    b"M4A ": Sniffed("audio", ".m4a", (".m4a", ".mp4"), True),
+    b"M4B ": Sniffed("audio", ".m4a", (".m4a", ".mp4"), True),
+    b"M4V ": Sniffed("video", ".m4v", (".m4v", ".mp4"), True),
+    b"heic": Sniffed("image", ".heic", (".heic",), True),
+    b"heix": Sniffed("image", ".heic", (".heic",), True),
+    b"hevc": Sniffed("image", ".heic", (".heic",), True),
+    b"mif1": Sniffed("image", ".heic", (".heic",), True),
+    b"msf1": Sniffed("image", ".heic", (".heic",), True),
+}
+_QUICKTIME_ATOMS = (b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot")
+
+
+def _sniff_iso_media(head):
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in _ISO_MEDIA_BRANDS:
+            return _ISO_MEDIA_BRANDS[brand]
+        if brand.startswith(b"3g2"):
+            return Sniffed("video", ".3g2", (".3g2", ".3gp", ".mp4"), True)
+        if brand.startswith(b"3gp"):
+            return Sniffed("video", ".3gp", (".3gp", ".3g2", ".mp4"), True)
+        return Sniffed("video", ".mp4", _ISO_MEDIA_MP4, True)
+    # QuickTime files older than ftyp start with a plain atom
+    if head[4:8] in _QUICKTIME_ATOMS:
+        return Sniffed("video", ".mov", _ISO_MEDIA_MP4, False)
+    return None
+
+
+def _sniff_riff(head):
+    kind = head[8:12]
+    if kind == b"WAVE":
+        return Sniffed("audio", ".wav", (".wav",), True)
+    if kind == b"AVI ":
+        return Sniffed("video", ".avi", (".avi",), True)
+    if kind == b"WEBP":
+        return Sniffed("image", ".webp", (".webp",), True)
+    return None
+
+
+def _sniff_zip(head):
+    # Office files are zip archives naming their content first
+    if b"mimetypeapplication/vnd.oasis.opendocument.text" in head:
+        return Sniffed("text", ".odt", (".odt",), True)
+    if b"word/" in head:
+        return Sniffed("text", ".docx", (".docx",), True)
+    return None
+
+
+def _sniff_mpeg_audio(head):
+    # Frame sync of an MP3 without ID3 tag, layer and bitrate must be valid
+    if len(head) > 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        if head[1] & 0x06 and head[2] & 0xF0 != 0xF0:
+            return Sniffed("audio", ".mp3", (".mp3",), False)
+    return None
+
+
+def _sniff_mpeg_transport(head):
+    # Sync byte of consecutive 188 byte packets
+    if head[:1] == b"\x47" and head[188:189] == b"\x47":
+        return Sniffed("video", ".mpeg", (".mpeg", ".mpg", ".m2ts", ".mts"), False)
+    return None
+
+
+def _sniff_form(head):
+    if head[8:12] in (b"AIFF", b"AIFC"):
+        return Sniffed("audio", ".aiff", (".aiff", ".aif"), True)
+    return None
+
+
+def _sniff_matroska(head):
+    if b"webm" in head[:64]:
+        return Sniffed("video", ".webm", (".webm", ".mkv"), True)
+    return Sniffed("video", ".mkv", (".mkv", ".webm"), True)
+
+
+# (prefix, sniffed content or a function of the head for shared prefixes)
+_SIGNATURES = [
+    (b"\xff\xd8\xff", Sniffed("image", ".jpg", (".jpg", ".jpeg"), True)),
+    (b"\x89PNG\r\n\x1a\n", Sniffed("image", ".png", (".png",), True)),
+    (b"GIF87a", Sniffed("image", ".gif", (".gif",), True)),
+    (b"GIF89a", Sniffed("image", ".gif", (".gif",), True)),
+    # Camera raw files are TIFF as well, only files without extension are named
+    (b"II*\x00", Sniffed("image", ".tif", (".tif", ".tiff"), False)),
+    (b"MM\x00*", Sniffed("image", ".tif", (".tif", ".tiff"), False)),
+    (b"BM", Sniffed("image", ".bmp", (".bmp",), False)),
+    (b"RIFF", _sniff_riff),
+    (b"FORM", _sniff_form),
+    (b"fLaC", Sniffed("audio", ".flac", (".flac",), True)),
+    (b"OggS", Sniffed("audio", ".ogg", (".ogg",), True)),
+    (b"ID3", Sniffed("audio", ".mp3", (".mp3", ".aac"), True)),
+    (b"\xff\xf1", Sniffed("audio", ".aac", (".aac",), True)),
+    (b"\xff\xf9", Sniffed("audio", ".aac", (".aac",), True)),
+    (b"\x1aE\xdf\xa3", _sniff_matroska),
+    (b"FLV\x01", Sniffed("video", ".flv", (".flv",), True)),
+    (b"0&\xb2u\x8ef\xcf\x11", Sniffed("video", ".wmv", (".wmv",), True)),
+    (b"\x00\x00\x01\xba", Sniffed("video", ".mpg", (".mpg", ".mpeg", ".vob"), True)),
+    (b"\x00\x00\x01\xb3", Sniffed("video", ".mpg", (".mpg", ".mpeg"), True)),
+    (b"DVDVIDEO-", Sniffed("dvd", ".ifo", (".ifo", ".bup"), True)),
+    (b"%PDF-", Sniffed("text", ".pdf", (".pdf",), True)),
+    (b"{\\rtf", Sniffed("text", ".rtf", (".rtf",), True)),
+    (b"PK\x03\x04", _sniff_zip),
+    # Word, but Excel and PowerPoint files are OLE as well
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", Sniffed("text", ".doc", (".doc",), False)),
+]
+
+
+def sniff_head(head):
+    """Content of a file from its first bytes, None when no signature matches."""
+    for prefix, sniffed in _SIGNATURES:
+        if head.startswith(prefix):
+            if callable(sniffed):
+                sniffed = sniffed(head)
+            if sniffed is not None:
+                return sniffed
+    for sniff in (_sniff_iso_media, _sniff_mpeg_audio, _sniff_mpeg_transport):
+        sniffed = sniff(head)
+        if sniffed is not None:
+            return sniffed
+    return None
+
+
+def media_class(name):
+    """Media type of a file name from its extension, None when it is not media."""
+    return _media_classes.get(os.path.splitext(name)[1].lower())
+
+
+def sniffing_enabled():
+    return bool(os.environ.get(SNIFF_VARIABLE))
+
+
+def configure_sniffing(enabled=True):
+    """Turns content sniffing on for this process and the processes it starts."""
+    if enabled:
+        os.environ[SNIFF_VARIABLE] = "1"
+    else:
+        os.environ.pop(SNIFF_VARIABLE, None)
+
+
+_sniffed = {}
+_sniffed_lock = threading.Lock()
+
+
+def sniff_file(path):
+    """Sniffed content of a file, read once per (device, inode, mtime)."""
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+    with _sniffed_lock:
+        if key in _sniffed:
+            return _sniffed[key]
+    with open(path, "rb") as input_file:
+        sniffed = sniff_head(input_file.read(SNIFF_BYTES))
+    with _sniffed_lock:
+        if len(_sniffed) >= SNIFF_CACHE_ENTRIES:
+            _sniffed.clear()
+        _sniffed[key] = sniffed
+    return sniffed
+
+
+def classify(path, name=None):
+    """Media class and effective extension of a file.
+
+    The extension of the name decides, unless sniffing is on and the content
+    says otherwise: a QuickTime movie named .mp4 is classified .mov, a camera
+    dump without extension gets the extension of its content.
+    """
+    name = name or os.path.basename(path)
+    extension = os.path.splitext(name)[1].lower()
+    by_name = Classification(_media_classes.get(extension), extension)
+    if not sniffing_enabled():
+        return by_name
+    try:
+        if os.path.isdir(path):
+            return by_name
+        sniffed = sniff_file(path)
+    except OSError:
+        # Not there (yet), planned outputs are named after their input
+        return by_name
+    if sniffed is None or extension in sniffed.extensions:
+        return by_name
+    if extension and not sniffed.strong:
+        return by_name
+    return Classification(sniffed.media_class, sniffed.extension)
+
+
+def is_selected(media, selected_media_types):
+    """Files that are not media are always kept, media only of a selected type."""
+    return media is None or media in selected_media_types
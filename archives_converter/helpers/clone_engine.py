@@ -0,0 +1,356 @@
+import os
+import time
+import errno
+import hashlib
+import shutil
+import threading
+import concurrent.futures
+from rich import print
+from rich.progress import (
+    Progress,
+    BarColumn,
+    TextColumn,
+    TimeRemainingColumn,
+    TransferSpeedColumn,
+    SpinnerColumn,
+)
+
+from helpers.file_links import reflink, REFLINK
+from helpers.bagit import format_bag_size
+from helpers.journal import DONE, FAILED
+from helpers.atomic_output import temp_output_path, discard_output
+from config.resources import (
+    clone_threads,
+    copy_chunk_bytes,
+    resumable_copy_bytes,
+    resumable_chunk_bytes,
+)
+
+COPY_FILE_RANGE = "copy_file_range"
+SENDFILE = "sendfile"
+BUFFERED = "buffered"
+# Buffered in checksummed chunks, resumable
+CHUNKED = "chunked"
+# Next to the partial copy of a large file: the size, mtime and chunk size of
+# its source, then the SHA-256 of every chunk written
+CHUNKS_SUFFIX = ".chunks"
+# Cheapest first: shared extents, then in-kernel copies, then through Python
+COPY_METHODS = (REFLINK, COPY_FILE_RANGE, SENDFILE, BUFFERED)
+
+# Errors meaning a method does not work between two filesystems, not that the
+# file cannot be copied
+_UNSUPPORTED_ERRORS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+}
+
+# (method, source device, destination device) that failed once, not tried again
+_unsupported = set()
+
+
+def _copy_file_range(source_file, target_file, on_bytes):
+    while True:
+        copied = os.copy_file_range(
+            source_file.fileno(), target_file.fileno(), copy_chunk_bytes
+        )
+        if not copied:
+            return
+        on_bytes(copied)
+
+
+def _sendfile(source_file, target_file, on_bytes):
+    offset = 0
+    while True:
+        copied = os.sendfile(
+            target_file.fileno(), source_file.fileno(), offset, copy_chunk_bytes
+        )
+        if not copied:
+            return
+        offset += copied
+        on_bytes(copied)
+
+
+def _buffered(source_file, target_file, on_bytes, digest=None):
+    buffer = bytearray(min(copy_chunk_bytes, 8 * 1024 * 1024))
+    view = memoryview(buffer)
+    while True:
+        read = source_file.readinto(buffer)
+        if not read:
+            return
+        target_file.write(view[:read])
+        if digest is not None:
+            digest.update(view[:read])
+        on_bytes(read)
+
+
+def _verified_chunks(partial_path, chunks_path, header, digest=None):
+    """Checksums of the chunks of a partial copy that still match its data.
+
+    Nothing is kept when the partial copy was made from another version of
+    the source. The kept chunks are fed to digest.
+    """
+    try:
+        with open(chunks_path) as chunks_file:
+            lines = chunks_file.read().splitlines()
+    except FileNotFoundError:
+        return []
+    if not lines or lines[0] != header or not os.path.exists(partial_path):
+        return []
+    verified = []
+    with open(partial_path, "rb") as partial_file:
+        for checksum in lines[1:]:
+            chunk = partial_file.read(resumable_chunk_bytes)
+            if len(chunk) != resumable_chunk_bytes:
+                # Only whole chunks are kept, a short one is copied again
+                break
+            if hashlib.sha256(chunk).hexdigest() != checksum:
+                break
+            if digest is not None:
+                digest.update(chunk)
+            verified.append(checksum)
+    return verified
+
+
+def _chunked(source, destination, source_stat, on_bytes, digest=None):
+    """Copies a large file to a partial file chunk by chunk, resuming earlier copies.
+
+    The checksum of every chunk is written next to the partial file once the
+    chunk is, the partial file takes the place of destination when complete.
+    """
+    partial_path = temp_output_path(destination)
+    chunks_path = partial_path + CHUNKS_SUFFIX
+    header = (
+        f"{source_stat.st_size} {source_stat.st_mtime_ns} {resumable_chunk_bytes}"
+    )
+    verified = _verified_chunks(partial_path, chunks_path, header, digest)
+    offset = len(verified) * resumable_chunk_bytes
+    if offset:
+        print(
+            f"[bold cyan]Resuming copy:[/bold cyan] {os.path.basename(destination)} "
+            f"from {format_bag_size(offset)}"
+        )
+        on_bytes(offset)
+
+    buffer = bytearray(min(resumable_chunk_bytes, 8 * 1024 * 1024))
+    view = memoryview(buffer)
+    with open(source, "rb") as source_file, open(
+        partial_path, "r+b" if offset else "wb"
+    ) as target_file, open(chunks_path, "w") as chunks_file:
+        chunks_file.write("\n".join([header, *verified]) + "\n")
+        chunks_file.flush()
+        source_file.seek(offset)
+        target_file.seek(offset)
+        target_file.truncate()
+        while True:
+            chunk_digest = hashlib.sha256()
+            chunk_size = 0
+            while chunk_size < resumable_chunk_bytes:
+                read = source_file.readinto(
+                    view[: min(len(buffer), resumable_chunk_bytes - chunk_size)]
+                )
+                if not read:
+                    break
+                target_file.write(view[:read])
+                chunk_digest.update(view[:read])
+                if digest is not None:
+                    digest.update(view[:read])
+                chunk_size += read
+                on_bytes(read)
+            if not chunk_size:
+                break
+            # The checksum is only written once its chunk has left Python
+            target_file.flush()
+            chunks_file.write(f"{chunk_digest.hexdigest()}\n")
+            chunks_file.flush()
+            if chunk_size < resumable_chunk_bytes:
+                break
+    shutil.copystat(source, partial_path)
+    os.replace(partial_path, destination)
+    discard_output(chunks_path)
+    return CHUNKED
+
+
+def _hash_file(path, digest):
+    buffer = bytearray(min(copy_chunk_bytes, 8 * 1024 * 1024))
+    view = memoryview(buffer)
+    with open(path, "rb") as input_file:
+        while True:
+            read = input_file.readinto(buffer)
+            if not read:
+                return
+            digest.update(view[:read])
+
+
+_STREAM_COPIES = {
+    COPY_FILE_RANGE: _copy_file_range if hasattr(os, "copy_file_range") else None,
+    SENDFILE: _sendfile if hasattr(os, "sendfile") else None,
+    BUFFERED: _buffered,
+}
+
+
+def copy_file(source, destination, on_bytes=None, methods=COPY_METHODS, digest=None):
+    """Copies source to destination like shutil.copy2, returns the method used.
+
+    Methods that are not supported between the two filesystems are skipped,
+    and not tried again for the following files. on_bytes(count) is called as
+    the data is copied, with a negative count when a method fails midway.
+    A hashlib digest is updated with the buffers of a buffered or chunked
+    copy as they are written; after a reflink or an in-kernel copy the source
+    is read once more to hash it, which still costs less than copying through
+    Python. Files of resumable_copy_bytes or more are copied in resumable
+    chunks unless they can be reflinked.
+    """
+    on_bytes = on_bytes or (lambda count: None)
+    source_stat = os.stat(source)
+    devices = (
+        source_stat.st_dev,
+        os.stat(os.path.dirname(destination) or ".").st_dev,
+    )
+    if source_stat.st_size >= resumable_copy_bytes:
+        # A reflink copies no data, there is nothing to resume then
+        if REFLINK in methods and (REFLINK, *devices) not in _unsupported:
+            if reflink(source, destination):
+                on_bytes(source_stat.st_size)
+                shutil.copystat(source, destination)
+                if digest is not None:
+                    _hash_file(source, digest)
+                return REFLINK
+            _unsupported.add((REFLINK, *devices))
+        return _chunked(source, destination, source_stat, on_bytes, digest)
+    for method in methods:
+        if (method, *devices) in _unsupported:
+            continue
+        if method == REFLINK:
+            if reflink(source, destination):
+                on_bytes(source_stat.st_size)
+                shutil.copystat(source, destination)
+                if digest is not None:
+                    _hash_file(source, digest)
+                return REFLINK
+            _unsupported.add((method, *devices))
+            continue
+        stream_copy = _STREAM_COPIES.get(method)
+        if stream_copy is None:
+            continue
+        copied = [0]
+
+        def count(size):
+            copied[0] += size
+            on_bytes(size)
+
+        try:
+            with open(source, "rb") as source_file, open(
+                destination, "wb"
+            ) as target_file:
+                if method == BUFFERED:
+                    stream_copy(source_file, target_file, count, digest)
+                else:
+                    stream_copy(source_file, target_file, count)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS or method == BUFFERED:
+                raise
+            on_bytes(-copied[0])
+            _unsupported.add((method, *devices))
+            continue
+        shutil.copystat(source, destination)
+        if digest is not None and method != BUFFERED:
+            _hash_file(source, digest)
+        return method
+    raise OSError(f"No copy method could copy {source}")
+
+
+def copy_files(
+    pairs, threads=None, event_log=None, description="Copying folder...", digests=None
+):
+    """Copies (source, destination) pairs on a thread pool, with byte progress.
+
+    Missing destination folders are created. Every copy is written to
+    event_log with its method when one is given. With a DigestStore, files are
+    hashed as they are copied and their digests recorded in it. Returns the
+    clone statistics.
+    """
+    start_time = time.perf_counter()
+    stats = {"files": 0, "bytes": 0, "failed": 0, "failed_files": [], "methods": {}}
+    stats_lock = threading.Lock()
+    created_folders = set()
+    for _, destination in pairs:
+        folder = os.path.dirname(destination)
+        if folder not in created_folders:
+            os.makedirs(folder, exist_ok=True)
+            created_folders.add(folder)
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+    ) as progress:
+        total = sum(os.path.getsize(source) for source, _ in pairs)
+        task = progress.add_task(description, total=max(1, total))
+
+        def copy(pair):
+            source, destination = pair
+            file_start = time.perf_counter()
+            digest = hashlib.sha256() if digests is not None else None
+            try:
+                method = copy_file(
+                    source,
+                    destination,
+                    lambda count: progress.advance(task, count),
+                    digest=digest,
+                )
+            except PermissionError as e:
+                print(f"Permission denied: {e.filename}")
+                with stats_lock:
+                    stats["failed"] += 1
+                    stats["failed_files"].append(source)
+                if event_log:
+                    event_log.emit(destination, "clone", FAILED, error=str(e))
+                return
+            if digest is not None:
+                digests.record(destination, digest.hexdigest())
+            size = os.path.getsize(destination)
+            with stats_lock:
+                stats["files"] += 1
+                stats["bytes"] += size
+                method_stats = stats["methods"].setdefault(
+                    method, {"files": 0, "bytes": 0}
+                )
+                method_stats["files"] += 1
+                method_stats["bytes"] += size
+            if event_log:
+                event_log.emit(
+                    destination,
+                    "clone",
+                    DONE,
+                    method,
+                    time.perf_counter() - file_start,
+                )
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads or clone_threads
+        ) as executor:
+            # Raises the first unexpected error, like a sequential copy would
+            for _ in executor.map(copy, pairs):
+                pass
+
+    stats["seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+def format_clone_stats(stats):
+    seconds = stats["seconds"]
+    rate = stats["bytes"] / seconds if seconds else 0
+    methods = ", ".join(
+        f"{method} {method_stats['files']}"
+        for method, method_stats in sorted(stats["methods"].items())
+    )
+    failed = f", {stats['failed']} failed" if stats["failed"] else ""
+    return (
+        f"{stats['files']} files, {format_bag_size(stats['bytes'])} in "
+        f"{seconds:.1f}s ({format_bag_size(int(rate))}/s){failed} [{methods}]"
+    )
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+
+from helpers.state import state_path, has_state, STATE_FOLDER
+from helpers.folders import should_copy_file
+
+CLONE_INDEX_NAME = "clone_index.sqlite"
+
+
+def payload_root(folder):
+    """The data folder of a bag, where its files live, or the folder itself."""
+    data_folder = os.path.join(folder, "data")
+    if os.path.isfile(os.path.join(folder, "bagit.txt")) and os.path.isdir(
+        data_folder
+    ):
+        return data_folder
+    return folder
+
+
+def scan_source(source_folder, selected_media_types):
+    """Size and mtime of every file to clone, by path relative to the payload.
+
+    One scandir pass, the tag files of a bagged source are left out.
+    """
+    root = payload_root(source_folder)
+    scanned = {}
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != STATE_FOLDER:
+                        folders.append(entry.path)
+                elif entry.name != ".DS_Store" and should_copy_file(
+                    entry.name, selected_media_types, entry.path
+                ):
+                    stat = entry.stat()
+                    scanned[os.path.relpath(entry.path, root)] = (
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    )
+    return scanned
+
+
+def diff_source(scanned, indexed):
+    """Returns the added, changed and removed paths of a scan against the index."""
+    added = []
+    changed = []
+    for path, (size, mtime_ns) in scanned.items():
+        entry = indexed.get(path)
+        if entry is None:
+            added.append(path)
+        elif entry[:2] != (size, mtime_ns):
+            changed.append(path)
+    removed = [path for path in indexed if path not in scanned]
+    return sorted(added), sorted(changed), sorted(removed)
+
+
+class CloneIndex:
+    """Source files cloned into a destination, with their size, mtime, clone and output.
+
+    An update compares one scan of the source with the index instead of
+    probing the destination for every source file. A source file whose size
+    or mtime differs from the index is cloned again.
+    """
+
+    def __init__(self, destination_root):
+        self.root = destination_root
+        self.path = state_path(destination_root, CLONE_INDEX_NAME)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                source TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                output TEXT,
+                cloned_at REAL,
+                clone TEXT
+            );
+            """
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def exists(destination_root):
+        return has_state(destination_root, CLONE_INDEX_NAME)
+
+    def entries(self):
+        """(size, mtime_ns, output, clone) of every cloned file by source path.
+
+        clone is None for files indexed before it was recorded.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT source, size, mtime_ns, output, clone FROM files"
+            ).fetchall()
+        return {source: tuple(entry) for source, *entry in rows}
+
+    def record(self, files):
+        """Stores (source, size, mtime_ns, output, clone) rows of cloned files."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files"
+                " (source, size, mtime_ns, output, clone, cloned_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in files],
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from helpers.file_links import link_or_copy
+from helpers.digests import file_digest
+from helpers.atomic_output import temp_output_path, commit_output, discard_output
+from config.resources import conversion_cache_bytes
+
+# The cache is configured through the environment so the image worker processes
+# and the workers of other hosts pick it up as well
+CACHE_FOLDER_VARIABLE = "ARCHIVES_CONVERTER_CACHE"
+CACHE_SIZE_VARIABLE = "ARCHIVES_CONVERTER_CACHE_SIZE"
+# Bump when the command lines of the converters change, older outputs no longer match
+CACHE_VERSION = 1
+
+INDEX_NAME = "index.sqlite"
+OBJECTS_FOLDER = "objects"
+# Eviction goes below the limit by this much, not to evict on every store
+EVICTION_MARGIN = 0.9
+STAT_KEYS = ["hits", "misses", "stores", "evictions", "saved_bytes", "stored_bytes"]
+
+_SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value):
+    """Bytes of a size such as 500G, 20M or 1048576."""
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in _SIZE_UNITS:
+        return int(float(value[:-1]) * _SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def converter_fingerprint(converter):
+    """Everything about a converter that shapes its output: name, profile, parameters."""
+    convert = converter["convert"]
+    function = getattr(convert, "func", convert)
+    return {
+        "name": converter["name"],
+        "convert_type": converter["convert_type"],
+        "output_extension": converter["output_extension"],
+        "function": f"{function.__module__}.{function.__qualname__}",
+        "parameters": {
+            key: repr(value)
+            for key, value in sorted(getattr(convert, "keywords", {}).items())
+        },
+    }
+
+
+class ConversionCache:
+    """Outputs of past conversions, keyed by input content and converter.
+
+    On a hit the stored output is reflinked, hardlinked or copied into place
+    instead of converting again. The least recently used outputs are evicted
+    once the cache grows past max_bytes. A hardlinked output shares its inode,
+    and so its timestamps, with the cached copy.
+    """
+
+    def __init__(self, folder, max_bytes=conversion_cache_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(folder, OBJECTS_FOLDER), exist_ok=True)
+        self._lock = threading.Lock()
+        # Image workers and other hosts share the index
+        self._connection = sqlite3.connect(
+            os.path.join(folder, INDEX_NAME), timeout=60, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO stats VALUES (?, 0)", [(key,) for key in STAT_KEYS]
+        )
+        self._connection.commit()
+
+    def key(self, input_path, converter):
+        content = {
+            "version": CACHE_VERSION,
+            "input": file_digest(input_path),
+            "extension": os.path.splitext(input_path)[1].lower(),
+            "converter": converter_fingerprint(converter),
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def _object_path(self, key, output_path):
+        extension = os.path.splitext(output_path)[1]
+        return os.path.join(self.folder, OBJECTS_FOLDER, key[:2], key + extension)
+
+    def _count(self, **increments):
+        self._connection.executemany(
+            "UPDATE stats SET value = value + ? WHERE key = ?",
+            [(value, key) for key, value in increments.items()],
+        )
+
+    def fetch(self, key, output_path):
+        """Puts the cached output of key at output_path, False on a miss."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT path, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            with self._lock, self._connection:
+                if row is not None:
+                    # Removed behind the index's back
+                    self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._count(stored_bytes=-row[1])
+                self._count(misses=1)
+            return False
+
+        path, size = row
+        temp_path = temp_output_path(output_path)
+        try:
+            link_or_copy(path, temp_path)
+            commit_output(temp_path, output_path)
+        except OSError as e:
+            discard_output(temp_path)
+            logging.warning(f"Could not use the cached output of {output_path}: {e}")
+            with self._lock, self._connection:
+                self._count(misses=1)
+            return False
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self._count(hits=1, saved_bytes=size)
+        return True
+
+    def store(self, key, output_path):
+        """Adds a fresh output to the cache, evicting old ones beyond max_bytes."""
+        object_path = self._object_path(key, output_path)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temp_path = temp_output_path(object_path)
+        try:
+            link_or_copy(output_path, temp_path)
+            os.replace(temp_path, object_path)
+        except OSError as e:
+            discard_output(temp_path)
+            logging.warning(f"Could not cache {output_path}: {e}")
+            return False
+        size = os.path.getsize(object_path)
+        now = time.time()
+        with self._lock, self._connection:
+            previous = self._connection.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, 0)",
+                (key, object_path, size, now, now),
+            )
+            self._count(stores=1, stored_bytes=size - (previous[0] if previous else 0))
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes least recently used outputs until the cache fits in max_bytes."""
+        with self._lock, self._connection:
+            stored_bytes = self.stats()["stored_bytes"]
+            if stored_bytes <= self.max_bytes:
+                return 0
+            evicted = 0
+            rows = self._connection.execute(
+                "SELECT key, path, size FROM entries ORDER BY last_used"
+            )
+            for key, path, size in rows.fetchall():
+                if stored_bytes <= self.max_bytes * EVICTION_MARGIN:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                stored_bytes -= size
+                evicted += 1
+                self._count(evictions=1, stored_bytes=-size)
+        return evicted
+
+    def stats(self):
+        return dict(self._connection.execute("SELECT key, value FROM stats").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_conversion_cache():
+    """The cache configured in the environment for this process, None when off."""
+    global _cache
+    folder = os.environ.get(CACHE_FOLDER_VARIABLE)
+    if not folder:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.folder != folder:
+            size = os.environ.get(CACHE_SIZE_VARIABLE)
+            _cache = ConversionCache(
+                folder, parse_size(size) if size else conversion_cache_bytes
+            )
+    return _cache
+
+
+def configure_conversion_cache(folder, size=None):
+    """Enables the cache for this process and the processes it starts."""
+    os.environ[CACHE_FOLDER_VARIABLE] = os.path.abspath(folder)
+    if size:
+        os.environ[CACHE_SIZE_VARIABLE] = str(parse_size(size))
+
+
+def stats_since(before, after):
+    return {key: after.get(key, 0) - before.get(key, 0) for key in STAT_KEYS}
+
+
+def format_cache_stats(stats):
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    return (
+        f"{stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%}), "
+        f"{stats['saved_bytes'] / 1e6:.1f} MB not converted again, "
+        f"{stats['stores']} stored, {stats['evictions']} evicted"
+    )
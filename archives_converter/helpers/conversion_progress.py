@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from helpers.bagit import format_bag_size
+from helpers.tool_runner import reporting_progress
+
+
+def input_size(path):
+    """Size of a file, or of all files of a folder input (VIDEO_TS)."""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(path)
+            for name in files
+        )
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ConversionProgress:
+    """Byte weighted progress of a conversion run, with throughput and ETA.
+
+    Every file weighs its input size. While a converter runs, its file moves
+    forward by the fraction the tool reports (ffmpeg out_time, Ghostscript
+    pages). The ETA is computed from the throughput measured per converter,
+    as the converters run side by side.
+    """
+
+    def __init__(self, progress, task, files, sizes=None):
+        """files: (path, converter name) of every file that will be converted.
+
+        sizes maps paths to their input bytes when they are already known.
+        """
+        self._progress = progress
+        self._task = task
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._files = {}
+        self.converters = {}
+        for path, converter in files:
+            size = sizes[path] if sizes and path in sizes else input_size(path)
+            self._files[path] = {
+                "converter": converter,
+                "bytes": size,
+                "fraction": 0.0,
+            }
+            stats = self.converters.setdefault(
+                converter,
+                {
+                    "files": 0,
+                    "total_bytes": 0,
+                    "done_bytes": 0.0,
+                    "media_seconds": 0.0,
+                    "started": None,
+                },
+            )
+            stats["files"] += 1
+            stats["total_bytes"] += size
+        self.total_bytes = sum(
+            stats["total_bytes"] for stats in self.converters.values()
+        )
+        self.done_bytes = 0.0
+        progress.update(
+            task, total=max(1, self.total_bytes), throughput="", eta="--:--"
+        )
+
+    def set_current(self, text):
+        self._progress.update(self._task, current_file=text)
+
+    def start(self, path):
+        with self._lock:
+            file_state = self._files.get(path)
+            if file_state is None:
+                return
+            stats = self.converters[file_state["converter"]]
+            if stats["started"] is None:
+                stats["started"] = time.monotonic()
+
+    @contextmanager
+    def tracking(self, path):
+        """Follows the progress reported by the tools converting path."""
+        media_state = {"seconds": 0.0}
+
+        def on_progress(fraction, media_seconds=None):
+            media_delta = 0.0
+            if media_seconds is not None:
+                media_delta = media_seconds - media_state["seconds"]
+                media_state["seconds"] = media_seconds
+            self._advance(path, fraction, media_delta)
+
+        self.start(path)
+        with reporting_progress(on_progress):
+            try:
+                yield
+            finally:
+                self._advance(path, 1.0)
+
+    def complete(self, path, media_seconds=0.0):
+        self._advance(path, 1.0, media_seconds)
+
+    def _advance(self, path, fraction, media_seconds=0.0):
+        with self._lock:
+            file_state = self._files.get(path)
+            if file_state is None or fraction <= file_state["fraction"]:
+                return
+            stats = self.converters[file_state["converter"]]
+            done = (fraction - file_state["fraction"]) * file_state["bytes"]
+            file_state["fraction"] = fraction
+            stats["done_bytes"] += done
+            stats["media_seconds"] += max(0.0, media_seconds)
+            self.done_bytes += done
+            self._progress.update(
+                self._task,
+                completed=self.done_bytes,
+                throughput=self.format_throughput(),
+                eta=format_duration(self.eta()),
+            )
+
+    def _rate(self, stats, now):
+        elapsed = now - stats["started"] if stats["started"] else 0
+        return stats["done_bytes"] / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds left from the throughput of each converter, None until measured."""
+        now = time.monotonic()
+        elapsed = now - self._start_time
+        overall_rate = self.done_bytes / elapsed if elapsed > 0 else 0.0
+        seconds_left = 0.0
+        for stats in self.converters.values():
+            remaining = stats["total_bytes"] - stats["done_bytes"]
+            if remaining <= 0:
+                continue
+            rate = self._rate(stats, now) or overall_rate
+            if not rate:
+                return None
+            seconds_left = max(seconds_left, remaining / rate)
+        return seconds_left
+
+    def format_throughput(self):
+        elapsed = time.monotonic() - self._start_time
+        if elapsed <= 0:
+            return ""
+        throughput = f"{self.done_bytes / elapsed / 1e6:.1f} MB/s"
+        media_seconds = sum(
+            stats["media_seconds"] for stats in self.converters.values()
+        )
+        if media_seconds:
+            throughput += f", {media_seconds / elapsed:.1f} media-s/s"
+        return throughput
+
+    def format_converter_stats(self):
+        now = time.monotonic()
+        lines = []
+        for name, stats in sorted(self.converters.items()):
+            line = (
+                f"{name}: {stats['files']} files, "
+                f"{format_bag_size(int(stats['done_bytes']))} at "
+                f"{self._rate(stats, now) / 1e6:.1f} MB/s"
+            )
+            if stats["media_seconds"] and stats["started"]:
+                media_rate = stats["media_seconds"] / (now - stats["started"])
+                line += f", {media_rate:.1f} media-s/s"
+            lines.append(line)
+        return lines
@@ -1,25 +1,27 @@
 import os
 import subprocess
 import logging
+from helpers.atomic_output import temp_output_path, commit_output, discard_output
+from helpers.converters.errors import ConversionError
+from helpers.tool_runner import run_ffmpeg
+from config.formats import audio_extensions
 # from helpers.metadata import extract_metadata, append_metadata
 
+_audio_extensions = {ext.lower() for ext in audio_extensions}
 
-def convert_wav(files, root):
-    return convert_audio(files, root, "wav", "pcm_s16le", 44100)
 
+def convert_wav(files, root, threads=0):
+    return convert_audio(files, root, "wav", "pcm_s16le", 44100, threads)
 
-def convert_mp3(files, root):
-    return convert_audio(files, root, "mp3", "libmp3lame", 44100)
 
+def convert_mp3(files, root, threads=0):
+    return convert_audio(files, root, "mp3", "libmp3lame", 44100, threads)
 
-def convert_audio(files, root, target_format, codec, sample_rate):
+
+def convert_audio(files, root, target_format, codec, sample_rate, threads=0):
     # metadata_file = os.path.join(root, "metadata.json")
     audio_files = [
-        f
-        for f in files
-        if f.lower().endswith(
-            (".wav", ".mp3", ".aac", ".m4a", ".flac", ".ogg", ".aif", ".aiff")
-        )
+        f for f in files if os.path.splitext(f)[1].lower() in _audio_extensions
     ]
     conversion_performed = False
     for audio_file in audio_files:
@@ -37,46 +39,58 @@ def convert_audio(files, root, target_format, codec, sample_rate):
                 )
                 counter += 1
 
-        # metadata_file = os.path.join(os.path.dirname(input_path), "metadata.json")
         try:
-            # Get original file's timestamps
-            original_stat = os.stat(input_path)
-
-            # Extract metadata before conversion
-            # metadata = extract_metadata(input_path)
-
-            ffmpeg_command = [
-                "ffmpeg",
-                "-i",
-                input_path,
-                "-map_metadata",
-                "0",
-                "-acodec",
-                codec,
-                "-ar",
-                str(sample_rate),
-                output_path,
-            ]
-
-            subprocess.run(
-                ffmpeg_command,
-                check=True,
-                timeout=300,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-            )
-
-            # Set the new file's timestamps to match the original
-            os.utime(output_path, (original_stat.st_atime, original_stat.st_mtime))
-
-            # append_metadata(metadata, metadata_file, output_path)
-
-            os.remove(input_path)  # Remove the original audio file
-            conversion_performed = True
-        except subprocess.CalledProcessError as e:
-            logging.error(
-                f"Error converting {audio_file} to {target_format.upper()}: {e.stderr}"
-            )
+            if convert_audio_file(input_path, output_path, codec, sample_rate, threads):
+                os.remove(input_path)  # Remove the original audio file
+                conversion_performed = True
+        except ConversionError as e:
+            logging.error(f"{e}: {e.stderr}")
         except OSError as e:
             logging.error(f"OS error occurred while processing {audio_file}: {e}")
     return conversion_performed
+
+
+def convert_audio_file(input_path, output_path, codec, sample_rate, threads=0):
+    """Encodes input_path to output_path with ffmpeg, leaving the input in place."""
+    # metadata_file = os.path.join(os.path.dirname(input_path), "metadata.json")
+    audio_file = os.path.basename(input_path)
+    temp_path = temp_output_path(output_path)
+    try:
+        # Get original file's timestamps
+        original_stat = os.stat(input_path)
+
+        # Extract metadata before conversion
+        # metadata = extract_metadata(input_path)
+
+        ffmpeg_command = [
+            "ffmpeg",
+            "-y",
+            "-i",
+            input_path,
+            "-map_metadata",
+            "0",
+            "-acodec",
+            codec,
+            "-ar",
+            str(sample_rate),
+            "-threads",
+            str(threads),
+            temp_path,
+        ]
+
+        run_ffmpeg(ffmpeg_command, cost_class="audio")
+
+        # Set the new file's timestamps to match the original
+        os.utime(temp_path, (original_stat.st_atime, original_stat.st_mtime))
+        commit_output(temp_path, output_path)
+
+        # append_metadata(metadata, metadata_file, output_path)
+        return True
+    except subprocess.CalledProcessError as e:
+        discard_output(temp_path)
+        raise ConversionError(
+            f"Error converting {audio_file} with {codec}", e.returncode, e.stderr
+        ) from e
+    except Exception:
+        discard_output(temp_path)
+        raise
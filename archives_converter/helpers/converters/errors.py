@@ -0,0 +1,22 @@
+# Only the end of stderr is kept, ffmpeg and Ghostscript print the cause last
+STDERR_LIMIT = 2000
+
+
+def truncate_stderr(stderr, limit=STDERR_LIMIT):
+    if not stderr:
+        return stderr
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", errors="replace")
+    stderr = stderr.strip()
+    if len(stderr) <= limit:
+        return stderr
+    return "..." + stderr[-limit:]
+
+
+class ConversionError(Exception):
+    """A converter failed, with the exit code and stderr of the tool it ran."""
+
+    def __init__(self, message, exit_code=None, stderr=None):
+        super().__init__(message)
+        self.exit_code = exit_code
+        self.stderr = truncate_stderr(stderr)
@@ -0,0 +1,129 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers.converters.errors import ConversionError
+
+_registry = None
+
+
+def _warm_up_worker():
+    # Import Pillow, register the HEIF opener and load the converter registry
+    # (plugins included) once for the lifetime of the worker
+    global _registry
+    from helpers.converters import registry
+
+    _registry = registry
+
+
+def _convert_batch(paths, convert_type, selected_media_types, outputs=None):
+    start_time = time.perf_counter()
+    results = []
+    for path, output in zip(paths, outputs or [None] * len(paths)):
+        result = {"path": path, "converted": False, "converter": None, "error": None}
+        file_start_time = time.perf_counter()
+        file_cpu_time = time.process_time()
+        result["input_bytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+        try:
+            converter = _registry.find_converter(
+                os.path.basename(path), selected_media_types, convert_type, path
+            )
+            if converter is not None:
+                result["converter"] = converter["name"]
+                output_path = _registry.run_converter(
+                    converter, path, output_path=output
+                )
+                result["converted"] = bool(output_path)
+                if output_path:
+                    result["output_path"] = output_path
+                    result["output_bytes"] = os.path.getsize(output_path)
+        except ConversionError as e:
+            result.update(error=str(e), exit_code=e.exit_code, stderr=e.stderr)
+        except Exception as e:
+            result["error"] = str(e)
+        result["duration"] = time.perf_counter() - file_start_time
+        result["cpu_time"] = time.process_time() - file_cpu_time
+        results.append(result)
+    return os.getpid(), time.perf_counter() - start_time, results
+
+
+class ImageEngine:
+    """Converts images on a pool of long-lived worker processes, a batch at a time."""
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # spawn: the parent already runs threads (progress bar, scheduler lanes)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up_worker,
+        )
+        self.worker_stats = {}
+
+    def convert_batch(self, paths, convert_type, selected_media_types, outputs=None):
+        """Converts the images and returns one result dict per path.
+
+        outputs are the output paths of images read from the source folder,
+        in the order of paths.
+
+        Results hold path, converted, converter, duration, cpu_time,
+        input_bytes, output_bytes and error, plus exit_code and stderr when a
+        ConversionError was raised.
+        """
+        pid, elapsed, results = self._executor.submit(
+            _convert_batch, paths, convert_type, selected_media_types, outputs
+        ).result()
+        stats = self.worker_stats.setdefault(pid, {"images": 0, "time": 0.0})
+        stats["images"] += len(results)
+        stats["time"] += elapsed
+        return results
+
+    def format_worker_stats(self):
+        return [
+            f"worker {pid}: {stats['images']} images, "
+            f"{stats['images'] / stats['time'] if stats['time'] else 0:.1f} images/s"
+            for pid, stats in sorted(self.worker_stats.items())
+        ]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def batch_image_jobs(jobs, batch_size):
+    """Groups the pillow lane jobs into batches, leaving the other jobs untouched.
+
+    Images of different conversions never share a batch.
+    """
+    other_jobs = [job for job in jobs if job["lane"] != "pillow"]
+    image_jobs = {}
+    for job in jobs:
+        if job["lane"] == "pillow":
+            image_jobs.setdefault(id(job.get("conversion")), []).append(job)
+
+    batches = []
+    for group in image_jobs.values():
+        for index in range(0, len(group), batch_size):
+            batch = group[index : index + batch_size]
+            batches.append(
+                {
+                    "root": batch[0]["root"],
+                    "name": f"{len(batch)} images",
+                    "lane": "pillow",
+                    "cores": 1,
+                    "conversion": batch[0].get("conversion"),
+                    "paths": [os.path.join(job["root"], job["name"]) for job in batch],
+                    "outputs": [job.get("output") for job in batch],
+                    # The images of a batch are converted one after the other
+                    "estimated_seconds": sum(
+                        job.get("estimated_seconds") or 0.0 for job in batch
+                    ),
+                }
+            )
+    return other_jobs + batches
@@ -1,6 +1,9 @@
 import os
 import logging
 import shutil
+from helpers.atomic_output import temp_output_path, commit_output, discard_output
+from helpers.converters.errors import ConversionError
+from config.formats import image_extensions
 
 # from helpers.metadata import extract_metadata, append_metadata
 from PIL import Image
@@ -9,6 +12,8 @@ from pillow_heif import register_heif_opener
 # Register HEIF/HEIC format support
 register_heif_opener()
 
+_image_extensions = {ext.lower() for ext in image_extensions}
+
 
 def convert_tiff(files, root):
     return convert_image(files, root, "tiff")
@@ -19,17 +24,9 @@ def convert_jpg(files, root):
 
 
 def convert_image(files, root, output_format, quality=None):
-    image_extensions = (
-        ".jpg",
-        ".jpeg",
-        ".tif",
-        ".tiff",
-        ".png",
-        ".gif",
-        ".bmp",
-        ".heic",
-    )
-    image_files = [f for f in files if f.lower().endswith(image_extensions)]
+    image_files = [
+        f for f in files if os.path.splitext(f)[1].lower() in _image_extensions
+    ]
     conversion_performed = False
 
     for img_file in image_files:
@@ -37,67 +34,87 @@ def convert_image(files, root, output_format, quality=None):
         output_ext = ".tiff" if output_format == "tiff" else ".jpg"
         extension = os.path.splitext(input_path)[1].lower().lstrip(".")
         output_path = os.path.splitext(input_path)[0] + f"_{extension}{output_ext}"
-        # metadata_file = os.path.join(os.path.dirname(input_path), "metadata.json")
 
         if not os.path.exists(input_path):
             logging.warning(f"Skipping {img_file}: File not found")
             continue
 
-        original_stat = os.stat(input_path)
-        # metadata = extract_metadata(input_path)
-
-        if output_format == "tiff" and img_file.lower().endswith(".tif"):
-            # Copy file first, verify copy succeeded, then remove original
-            try:
-                shutil.copy2(input_path, output_path)
-                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                    os.remove(input_path)
-                    conversion_performed = True
-                else:
-                    raise Exception(
-                        "Failed to copy file - destination file missing or empty"
-                    )
-            except Exception as e:
-                logging.error(f"Error copying {input_path} to {output_path}: {str(e)}")
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                continue  # Skip the rest of the processing for this file
-        elif output_format == "jpg" and img_file.lower().endswith((".jpeg", ".jpg")):
-            extension = os.path.splitext(input_path)[1].lower().lstrip(".")
-            output_path = os.path.splitext(input_path)[0] + f"_{extension}.jpg"
-            shutil.copy2(input_path, output_path)
+        try:
+            converted = convert_image_file(
+                input_path, output_path, output_format, quality
+            )
+        except ConversionError as e:
+            logging.error(str(e))
+            continue
+        if converted:
+            # Remove input file after successful conversion
             os.remove(input_path)
             conversion_performed = True
-        else:
-            # Open image with Pillow to preserve color profiles
-            with Image.open(input_path) as pil_img:
-                # Save with appropriate parameters
-                if output_format == "jpg":
-                    jpeg_quality = 95 if quality is None else quality
-                    pil_img.save(
-                        output_path,
-                        format="JPEG",
-                        quality=jpeg_quality,
-                        icc_profile=pil_img.info.get("icc_profile"),
-                    )
-                elif output_format == "tiff":
-                    # Preserve ICC profile for TIFF files
-                    pil_img.save(
-                        output_path,
-                        format="TIFF",
-                        compression="tiff_lzw",
-                        icc_profile=pil_img.info.get("icc_profile"),
-                    )
-
-            os.chmod(output_path, 0o644)
-
-            # Preserve original file's metadata
-            os.utime(output_path, (original_stat.st_atime, original_stat.st_mtime))
-            # append_metadata(metadata, metadata_file, output_path)
-
-            # Remove input file after successful conversion
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                os.remove(input_path)
-                conversion_performed = True
 
     return conversion_performed
+
+
+def convert_image_file(
+    input_path, output_path, output_format, quality=None, threads=0
+):
+    """Writes input_path to output_path in the given format, keeping the input."""
+    # metadata_file = os.path.join(os.path.dirname(input_path), "metadata.json")
+    original_stat = os.stat(input_path)
+    # metadata = extract_metadata(input_path)
+    input_extension = os.path.splitext(input_path)[1].lower()
+    temp_path = temp_output_path(output_path)
+
+    if output_format == "tiff" and input_extension == ".tif":
+        # Copy file first, verify copy succeeded
+        try:
+            shutil.copy2(input_path, temp_path)
+            if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+                commit_output(temp_path, output_path)
+                return True
+            raise Exception("Failed to copy file - destination file missing or empty")
+        except Exception as e:
+            discard_output(temp_path)
+            raise ConversionError(
+                f"Error copying {input_path} to {output_path}: {str(e)}"
+            ) from e
+
+    if output_format == "jpg" and input_extension in (".jpeg", ".jpg"):
+        shutil.copy2(input_path, temp_path)
+        commit_output(temp_path, output_path)
+        return True
+
+    try:
+        # Open image with Pillow to preserve color profiles
+        with Image.open(input_path) as pil_img:
+            # Save with appropriate parameters
+            if output_format == "jpg":
+                jpeg_quality = 95 if quality is None else quality
+                pil_img.save(
+                    temp_path,
+                    format="JPEG",
+                    quality=jpeg_quality,
+                    icc_profile=pil_img.info.get("icc_profile"),
+                )
+            elif output_format == "tiff":
+                # Preserve ICC profile for TIFF files
+                pil_img.save(
+                    temp_path,
+                    format="TIFF",
+                    compression="tiff_lzw",
+                    icc_profile=pil_img.info.get("icc_profile"),
+                )
+    except Exception:
+        discard_output(temp_path)
+        raise
+
+    if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+        discard_output(temp_path)
+        return False
+
+    os.chmod(temp_path, 0o644)
+
+    # Preserve original file's metadata
+    os.utime(temp_path, (original_stat.st_atime, original_stat.st_mtime))
+    # append_metadata(metadata, metadata_file, output_path)
+    commit_output(temp_path, output_path)
+    return True
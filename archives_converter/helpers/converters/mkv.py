@@ -5,27 +5,22 @@ import concurrent.futures
 import re
 from rich import print
 
+from helpers.atomic_output import temp_output_path, commit_output, discard_output
+from helpers.probe import probe_duration
+from helpers.tool_runner import run_ffmpeg, tool_timeout, ToolCancelled
 
-def convert_vob_to_output(input_file, output_file, output_format):
+
+def convert_vob_to_output(input_file, output_file, output_format, threads=0):
     # Check the duration of the VOB file
-    duration_command = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration",
-        "-of",
-        "default=noprint_wrappers=1:nokey=1",
-        input_file,
-    ]
-    duration_output = subprocess.check_output(duration_command).decode("utf-8").strip()
+    duration = probe_duration(input_file)
 
-    if duration_output == "N/A" or float(duration_output) < 5:
+    if duration is None or duration < 5:
         return None
 
     # FFmpeg command to convert each VOB file to the desired format
     ffmpeg_command = [
         "ffmpeg",
+        "-y",
         "-i",
         input_file,
         "-map_metadata",
@@ -56,7 +51,7 @@ def convert_vob_to_output(input_file, output_file, output_format):
                 "-slicecrc",
                 "1",
                 "-threads",
-                "0",
+                str(threads),
                 "-c:a",
                 "flac",
                 "-c:s",
@@ -79,32 +74,42 @@ def convert_vob_to_output(input_file, output_file, output_format):
                 "-c:s",
                 "mov_text",
                 "-threads",
-                "0",
+                str(threads),
             ]
         )
 
-    ffmpeg_command.append(output_file)
+    temp_file = temp_output_path(output_file)
+    ffmpeg_command.append(temp_file)
 
     try:
         print(f"[bold yellow]Converting file:[/bold yellow] {input_file}")
-        subprocess.run(
-            ffmpeg_command,
-            timeout=1200,
-            check=True,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        # The timeout follows the duration of the VOB, long titles get more time
+        run_ffmpeg(ffmpeg_command, timeout=tool_timeout("dvd", duration))
+        commit_output(temp_file, output_file)
         print(f"[bold green]Converted file:[/bold green] {input_file}")
         return output_file
     except subprocess.CalledProcessError as e:
+        discard_output(temp_file)
         print(
             f"[bold salmon1]Warning:[/bold salmon1] FFmpeg encountered an error processing {os.path.basename(input_file)}: {e.stderr}"
         )
         print("[bold yellow]Attempting to continue processing...[/bold yellow]")
         return None
+    except Exception:
+        discard_output(temp_file)
+        raise
 
 
-def convert_dvd_to_format(video_ts_paths, output_folder, output_format):
+def convert_dvd_to_format(video_ts_paths, output_folder, output_format, threads=0):
+    # Split the cores granted to this DVD between concurrent VOB encodes, two
+    # threads each. Without a grant, keep one VOB per core with ffmpeg picking threads.
+    if threads:
+        vob_workers = max(1, threads // 2)
+        vob_threads = max(1, threads // vob_workers)
+    else:
+        vob_workers = max(1, (os.cpu_count() or 2) - 1)
+        vob_threads = 0
+
     conversion_performed = False
     for video_ts_path in video_ts_paths:
         # Ensure we're looking inside the VIDEO_TS folder
@@ -135,20 +140,30 @@ def convert_dvd_to_format(video_ts_paths, output_folder, output_format):
                 output_file = (
                     os.path.splitext(input_file)[0] + f"_{extension}.{output_format}"
                 )
-                conversion_tasks.append((input_file, output_file, output_format))
+                conversion_tasks.append(
+                    (input_file, output_file, output_format, vob_threads)
+                )
 
             # Convert VOB files concurrently
-            with concurrent.futures.ThreadPoolExecutor(
-                max_workers=os.cpu_count() - 1
-            ) as executor:
-                converted_files = list(
-                    filter(
-                        None,
-                        executor.map(
-                            lambda x: convert_vob_to_output(*x), conversion_tasks
-                        ),
+            try:
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=vob_workers
+                ) as executor:
+                    converted_files = list(
+                        filter(
+                            None,
+                            executor.map(
+                                lambda x: convert_vob_to_output(*x), conversion_tasks
+                            ),
+                        )
                     )
-                )
+            except ToolCancelled:
+                # Roll back to the untouched VIDEO_TS folder
+                for task in conversion_tasks:
+                    if os.path.exists(task[1]):
+                        os.remove(task[1])
+                shutil.rmtree(subfolder, ignore_errors=True)
+                raise
 
             if converted_files:
                 if len(converted_files) == 1:
@@ -191,17 +206,12 @@ def convert_dvd_to_format(video_ts_paths, output_folder, output_format):
                         "-c",
                         "copy",
                         "-threads",
-                        "0",
+                        str(threads),
                         merged_output,
                     ]
 
                     try:
-                        subprocess.run(
-                            merge_command,
-                            check=True,
-                            stderr=subprocess.PIPE,
-                            universal_newlines=True,
-                        )
+                        run_ffmpeg(merge_command, cost_class="dvd")
 
                         # Move the merged file to the root folder
                         output_suffix = (
@@ -240,6 +250,12 @@ def convert_dvd_to_format(video_ts_paths, output_folder, output_format):
                         print(
                             f"Error merging {output_format.upper()} files: {e.stderr}"
                         )
+                    except ToolCancelled:
+                        for mkv_file in converted_files:
+                            if os.path.exists(mkv_file):
+                                os.remove(mkv_file)
+                        shutil.rmtree(subfolder, ignore_errors=True)
+                        raise
                 conversion_performed = True
             else:
                 # If no converted files were created (e.g., all were too short), still try to delete VIDEO_TS
@@ -261,9 +277,15 @@ def convert_dvd_to_format(video_ts_paths, output_folder, output_format):
     return conversion_performed
 
 
-def convert_dvd_to_mkv(video_ts_paths, output_folder):
-    return convert_dvd_to_format(video_ts_paths, output_folder, "mkv")
+def convert_dvd_to_mkv(video_ts_paths, output_folder, threads=0):
+    return convert_dvd_to_format(video_ts_paths, output_folder, "mkv", threads)
+
+
+def convert_dvd_to_mp4(video_ts_paths, output_folder, threads=0):
+    return convert_dvd_to_format(video_ts_paths, output_folder, "mp4", threads)
 
 
-def convert_dvd_to_mp4(video_ts_paths, output_folder):
-    return convert_dvd_to_format(video_ts_paths, output_folder, "mp4")
+def convert_video_ts(video_ts_folder, output_path=None, output_format="mkv", threads=0):
+    """Converts the DVD of a VIDEO_TS folder, the output is named after its parent."""
+    parent_folder = os.path.dirname(video_ts_folder)
+    return convert_dvd_to_format([parent_folder], parent_folder, output_format, threads)
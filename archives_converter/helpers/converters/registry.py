@@ -0,0 +1,271 @@
+import os
+import logging
+from functools import partial
+from importlib import import_module
+from importlib.metadata import entry_points
+
+from helpers.converters.images import convert_image_file
+from helpers.converters.audio import convert_audio_file
+from helpers.converters.videos import convert_video_file
+from helpers.converters.text import convert_pdfa_file
+from helpers.converters.mkv import convert_video_ts
+from helpers.conversion_cache import get_conversion_cache
+from helpers.classifier import classify
+from config.formats import (
+    image_extensions,
+    video_extensions,
+    audio_extensions,
+    text_extensions,
+    text_files_to_ignore,
+)
+
+# Installed packages can add converters by exposing a callable in this entry point
+# group, it is called once with register_converter as its only argument
+ENTRY_POINT_GROUP = "archives_converter.converters"
+# Comma separated modules imported at start-up, they call register_converter themselves
+PLUGIN_MODULES_VARIABLE = "ARCHIVES_CONVERTER_PLUGINS"
+
+# normalized extension -> convert type -> converter
+_extension_converters = {}
+# folder name -> convert type -> converter, for inputs that are whole folders (DVDs)
+_folder_converters = {}
+_ignored_names = {name.lower() for name in text_files_to_ignore}
+
+
+def normalize_extension(extension):
+    return "." + extension.lower().lstrip(".")
+
+
+def register_converter(
+    name,
+    media_type,
+    convert_type,
+    convert,
+    lane,
+    extensions=(),
+    folder_names=(),
+    output_extension=None,
+    cost_class=None,
+    cacheable=True,
+):
+    """Registers convert(input_path, output_path, threads=0) for a set of inputs.
+
+    media_type is the selectable media type enabling the converter (image, audio,
+    video, text, dvd), cost_class the job_cores/estimates key (defaults to
+    media_type) and lane the scheduler lane it runs in. File converters write
+    output_path and leave the input in place, returning True once the output
+    exists. Folder converters get output_path=None and handle their input
+    themselves. A later registration replaces the converter of an extension.
+    Outputs of file converters go to the conversion cache, when one is set up,
+    unless cacheable is False (outputs depending on more than the input).
+    """
+    converter = {
+        "name": name,
+        "media_type": media_type,
+        "cost_class": cost_class or media_type,
+        "convert_type": convert_type,
+        "lane": lane,
+        "output_extension": output_extension,
+        "convert": convert,
+        "cacheable": cacheable and output_extension is not None,
+    }
+    for extension in extensions:
+        _extension_converters.setdefault(normalize_extension(extension), {})[
+            convert_type
+        ] = converter
+    for folder_name in folder_names:
+        _folder_converters.setdefault(folder_name, {})[convert_type] = converter
+    return converter
+
+
+def find_converter(name, selected_media_types, convert_type, path=None):
+    """Returns the converter of a file or folder name, None when nothing converts it.
+
+    With the path of the file, its content is sniffed when sniffing is on.
+    """
+    if name.lower() in _ignored_names:
+        return None
+    converters = _folder_converters.get(name)
+    if converters is None:
+        if path:
+            extension = classify(path, name).extension
+        else:
+            extension = os.path.splitext(name)[1]
+        if not extension:
+            return None
+        converters = _extension_converters.get(normalize_extension(extension))
+    if not converters:
+        return None
+    converter = converters.get(convert_type)
+    if converter is None or converter["media_type"] not in selected_media_types:
+        return None
+    return converter
+
+
+def registered_converters():
+    converters = {}
+    for by_convert_type in list(_extension_converters.values()) + list(
+        _folder_converters.values()
+    ):
+        for converter in by_convert_type.values():
+            converters[id(converter)] = converter
+    return list(converters.values())
+
+
+def output_path_for(input_path, converter, extension=None):
+    """Output of a file converter, named after the lowercased input extension.
+
+    A sniffed extension is used instead when the content tells otherwise,
+    extension gives it for inputs that are not there yet.
+    """
+    base_path = os.path.splitext(input_path)[0]
+    extension = (extension or classify(input_path).extension).lstrip(".")
+    return f"{base_path}_{extension}{converter['output_extension']}"
+
+
+def unique_output_path(output_path):
+    # Two inputs may only differ by the case of their extension
+    if not os.path.exists(output_path):
+        return output_path
+    base_path, output_extension = os.path.splitext(output_path)
+    base_path, suffix = base_path.rsplit("_", 1)
+    counter = 0
+    while os.path.exists(output_path):
+        output_path = f"{base_path}_{counter}_{suffix}{output_extension}"
+        counter += 1
+    return output_path
+
+
+def run_converter(converter, input_path, threads=0, output_path=None):
+    """Converts one input and removes it once its output is in place.
+
+    An input converted to a given output_path is read from the source folder
+    and kept. Returns the output path of file converters, False when nothing
+    was written.
+    """
+    if converter["output_extension"] is None:
+        return converter["convert"](input_path, None, threads=threads)
+
+    keep_input = output_path is not None
+    output_path = unique_output_path(
+        output_path or output_path_for(input_path, converter)
+    )
+    cache = get_conversion_cache() if converter.get("cacheable") else None
+    cache_key = None
+    if cache is not None:
+        try:
+            cache_key = cache.key(input_path, converter)
+            if cache.fetch(cache_key, output_path):
+                if not keep_input:
+                    os.remove(input_path)
+                return output_path
+        except Exception as e:
+            # The cache only saves time, a broken one must not fail conversions
+            logging.warning(f"Conversion cache unavailable for {input_path}: {e}")
+            cache_key = None
+    if not converter["convert"](input_path, output_path, threads=threads):
+        return False
+    if cache_key is not None:
+        try:
+            cache.store(cache_key, output_path)
+        except Exception as e:
+            logging.warning(f"Could not cache {output_path}: {e}")
+    if not keep_input:
+        os.remove(input_path)
+    return output_path
+
+
+def register_default_converters():
+    for convert_type, output_format, output_extension in (
+        ("AIP", "tiff", ".tiff"),
+        ("DIP", "jpg", ".jpg"),
+    ):
+        register_converter(
+            f"convert_{output_format}",
+            "image",
+            convert_type,
+            partial(convert_image_file, output_format=output_format),
+            lane="pillow",
+            extensions=image_extensions,
+            output_extension=output_extension,
+        )
+
+    for convert_type, output_format, codec in (
+        ("AIP", "wav", "pcm_s16le"),
+        ("DIP", "mp3", "libmp3lame"),
+    ):
+        register_converter(
+            f"convert_{output_format}",
+            "audio",
+            convert_type,
+            partial(convert_audio_file, codec=codec, sample_rate=44100),
+            lane="ffmpeg",
+            extensions=audio_extensions,
+            output_extension=f".{output_format}",
+        )
+
+    for convert_type, name, codec, output_extension in (
+        ("AIP", "convert_ffv1", "ffv1", ".mkv"),
+        ("DIP", "convert_mp4", "libx264", ".mp4"),
+    ):
+        register_converter(
+            name,
+            "video",
+            convert_type,
+            partial(convert_video_file, video_codec=codec),
+            lane="ffmpeg",
+            extensions=video_extensions,
+            output_extension=output_extension,
+        )
+
+    text_documents = [ext for ext in text_extensions if ext.lower() != ".pdf"]
+    for convert_type in ("AIP", "DIP"):
+        register_converter(
+            "convert_pdfa",
+            "text",
+            convert_type,
+            convert_pdfa_file,
+            lane="ghostscript",
+            extensions=[".pdf"],
+            output_extension=".pdf",
+            cost_class="pdf",
+        )
+        register_converter(
+            "convert_pdfa",
+            "text",
+            convert_type,
+            convert_pdfa_file,
+            lane="libreoffice",
+            extensions=text_documents,
+            output_extension=".pdf",
+            cost_class="document",
+        )
+
+    for convert_type, output_format in (("AIP", "mkv"), ("DIP", "mp4")):
+        register_converter(
+            f"convert_dvd_to_{output_format}",
+            "dvd",
+            convert_type,
+            partial(convert_video_ts, output_format=output_format),
+            lane="ffmpeg",
+            folder_names=["VIDEO_TS"],
+        )
+
+
+def load_plugin_converters():
+    for module_name in os.environ.get(PLUGIN_MODULES_VARIABLE, "").split(","):
+        if module_name.strip():
+            try:
+                import_module(module_name.strip())
+            except Exception as e:
+                logging.error(f"Could not load converter plugin {module_name}: {e}")
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            entry_point.load()(register_converter)
+        except Exception as e:
+            logging.error(f"Could not load converter plugin {entry_point.name}: {e}")
+
+
+register_default_converters()
+load_plugin_converters()
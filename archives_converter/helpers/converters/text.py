@@ -2,11 +2,19 @@ import os
 import subprocess
 import time
 import shutil
+from helpers.atomic_output import temp_output_path, commit_output, discard_output
+from helpers.converters.errors import ConversionError
+from helpers.tool_runner import (
+    run_tool,
+    run_ghostscript,
+    tool_timeout,
+    input_megabytes,
+)
+from config.resources import minimum_tool_timeout
 # from helpers.metadata import extract_metadata, append_metadata
 
 
 def convert_pdfa(files, root):
-    metadata_file = os.path.join(root, "metadata.json")
     conversion_performed = False
     for file in files:
         if file.lower() in [
@@ -23,25 +31,40 @@ def convert_pdfa(files, root):
         extension = os.path.splitext(input_path)[1].lower().lstrip(".")
         output_path = os.path.splitext(input_path)[0] + f"_{extension}.pdf"
 
-        if file.lower().endswith(".pdf"):
-            conversion_performed = (
-                convert_pdf_to_pdfa(input_path, output_path, metadata_file)
-                or conversion_performed
-            )
-        elif file.lower().endswith((".txt", ".doc", ".docx", ".rtf", ".odt")):
-            conversion_performed = (
-                convert_to_pdf(input_path, output_path, metadata_file)
-                or conversion_performed
-            )
-
-        original_file = output_path.replace(".pdf", ".pdf_original")
-        if os.path.exists(original_file):
-            os.remove(original_file)
+        try:
+            converted = convert_pdfa_file(input_path, output_path)
+        except ConversionError as e:
+            print(f"{e}: {e.stderr}")
+            continue
+        except Exception as e:
+            print(f"Unexpected error converting {input_path}: {str(e)}")
+            continue
+        if converted:
+            os.remove(input_path)
+            conversion_performed = True
 
     return conversion_performed
 
 
+def convert_pdfa_file(input_path, output_path, threads=0):
+    """Writes input_path to output_path as PDF/A, leaving the input in place."""
+    metadata_file = os.path.join(os.path.dirname(input_path), "metadata.json")
+    extension = os.path.splitext(input_path)[1].lower()
+    converted = False
+    if extension == ".pdf":
+        converted = convert_pdf_to_pdfa(input_path, output_path, metadata_file)
+    elif extension in (".txt", ".doc", ".docx", ".rtf", ".odt"):
+        converted = convert_to_pdf(input_path, output_path, metadata_file)
+
+    original_file = output_path.replace(".pdf", ".pdf_original")
+    if os.path.exists(original_file):
+        os.remove(original_file)
+
+    return converted
+
+
 def convert_to_pdf(input_path, output_path, metadata_file):
+    temp_path = temp_output_path(output_path)
     try:
         # Kill any lingering soffice.bin processes before starting unoconv
         subprocess.run(["pkill", "-f", "soffice.bin"], check=False, capture_output=True)
@@ -64,15 +87,14 @@ def convert_to_pdf(input_path, output_path, metadata_file):
             "-eSelectPdfVersion=2",
             "-ePDFACompliance=2",
             "-o",
-            output_path,
+            temp_path,
             input_path,
         ]
-        subprocess.run(
+        # unoconv prints no progress, only its timeout stops it
+        run_tool(
             unoconv_command,
-            timeout=100,
-            check=True,
-            capture_output=True,
-            text=True,
+            timeout=tool_timeout("document", input_megabytes(input_path))
+            or minimum_tool_timeout,
         )
 
         original_stat = os.stat(input_path)
@@ -82,32 +104,37 @@ def convert_to_pdf(input_path, output_path, metadata_file):
             "-tagsFromFile",
             input_path,
             "-all:all",
-            output_path,
+            "-overwrite_original",
+            temp_path,
         ]
         try:
-            subprocess.run(
-                exiftool_command, timeout=60, check=True, capture_output=True, text=True
-            )
+            run_tool(exiftool_command, timeout=60)
         except subprocess.CalledProcessError as e:
             print(f"Exiftool command failed for {input_path}: {e.stderr.strip()}")
             raise
 
-        shutil.chown(output_path, original_stat.st_uid, original_stat.st_gid)
-        os.chmod(output_path, original_stat.st_mode)
-        os.utime(output_path, (original_stat.st_atime, original_stat.st_mtime))
-
-        os.remove(input_path)
+        shutil.chown(temp_path, original_stat.st_uid, original_stat.st_gid)
+        os.chmod(temp_path, original_stat.st_mode)
+        os.utime(temp_path, (original_stat.st_atime, original_stat.st_mtime))
+        commit_output(temp_path, output_path)
         return True
-    except Exception as e:
-        print(f"Unexpected error converting {input_path}: {str(e)}")
-    return False
+    except subprocess.CalledProcessError as e:
+        discard_output(temp_path)
+        raise ConversionError(
+            f"Error converting {input_path} to PDF/A with {e.cmd[0]}",
+            e.returncode,
+            e.stderr,
+        ) from e
+    except Exception:
+        discard_output(temp_path)
+        raise
 
 
 def convert_pdf_to_pdfa(input_path, output_path, metadata_file):
+    temp_path = temp_output_path(output_path)
     try:
         original_stat = os.stat(input_path)
 
-        timeout = 300
         gs_command = [
             "gs",
             "-dPDFA=2",
@@ -118,59 +145,43 @@ def convert_pdf_to_pdfa(input_path, output_path, metadata_file):
             "-sDEVICE=pdfwrite",
             "-dPDFACompatibilityPolicy=1",
             "-dOverwritePDFMark=true",
-            f"-sOutputFile={output_path}",
+            f"-sOutputFile={temp_path}",
             input_path,
         ]
 
-        subprocess.run(
-            gs_command,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            check=True,
-        )
+        run_ghostscript(gs_command, cost_class="pdf", input_path=input_path)
 
         exiftool_command = [
             "exiftool",
             "-tagsFromFile",
             input_path,
             "-all:all",
-            output_path,
+            "-overwrite_original",
+            temp_path,
         ]
         try:
-            subprocess.run(
-                exiftool_command,
-                timeout=300,
-                check=True,
-                capture_output=True,
-                text=True,
-            )
+            run_tool(exiftool_command, timeout=300)
         except subprocess.CalledProcessError as e:
             print(f"Exiftool command failed for {input_path}: {e.stderr.strip()}")
             raise
 
-        shutil.chown(output_path, original_stat.st_uid, original_stat.st_gid)
-        os.chmod(output_path, original_stat.st_mode)
-        os.utime(output_path, (original_stat.st_atime, original_stat.st_mtime))
-
-        try:
-            if os.path.exists(input_path):
-                os.remove(input_path)
-            else:
-                print(f"Original file not found for deletion: {input_path}")
-        except PermissionError:
-            print(f"Permission denied when trying to delete: {input_path}")
-            raise
-        except Exception as e:
-            print(f"Error deleting original file {input_path}: {str(e)}")
-            raise
-
+        shutil.chown(temp_path, original_stat.st_uid, original_stat.st_gid)
+        os.chmod(temp_path, original_stat.st_mode)
+        os.utime(temp_path, (original_stat.st_atime, original_stat.st_mtime))
+        commit_output(temp_path, output_path)
         return True
 
-    except subprocess.TimeoutExpired:
-        print(f"Ghostscript command timed out after {timeout} seconds for {input_path}")
+    except subprocess.TimeoutExpired as e:
+        discard_output(temp_path)
+        raise ConversionError(
+            f"{e.cmd[0]} command timed out after {e.timeout} seconds for {input_path}",
+            stderr=e.stderr,
+        ) from e
     except subprocess.CalledProcessError as e:
-        print(f"Error in Ghostscript command for {input_path}: {e.stderr}")
-    except Exception as e:
-        print(f"Unexpected error converting {input_path}: {str(e)}")
-    return False
+        discard_output(temp_path)
+        raise ConversionError(
+            f"Error in {e.cmd[0]} command for {input_path}", e.returncode, e.stderr
+        ) from e
+    except Exception:
+        discard_output(temp_path)
+        raise
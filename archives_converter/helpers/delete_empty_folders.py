@@ -1,13 +1,37 @@
 import os
+import errno
 import logging
 
-def delete_empty_folders(folder, progress=None, task=None):
-    for root, dirs, files in os.walk(folder, topdown=False):
-        if not files and not os.listdir(root):
+from helpers.state import STATE_FOLDER
+
+
+def delete_empty_folders(folder, progress=None, task=None, tree=None):
+    # The state folder holds the bookkeeping of other workers (queue lanes)
+    state_folder = os.path.join(folder, STATE_FOLDER)
+    if tree:
+        walk = tree.walk(folder, topdown=False)
+    else:
+        walk = os.walk(folder, topdown=False)
+    for root, dirs, files in walk:
+        if root == state_folder or root.startswith(state_folder + os.sep):
+            continue
+        if tree:
+            # Emptied subfolders were removed from the index as they went
+            entry = tree.get(root)
+            empty = entry is not None and not entry.children
+        else:
+            empty = not files and not os.listdir(root)
+        if empty:
             try:
                 os.rmdir(root)
+                if tree:
+                    tree.remove(root)
                 if progress and task:
                     progress.advance(task)
                 logging.info(f"Deleted empty folder: {root}")
             except OSError as e:
+                if tree and e.errno == errno.ENOTEMPTY:
+                    # Written behind the back of the index, it is not empty
+                    tree.refresh(root)
+                    continue
                 logging.error(f"Error deleting folder {root}: {e}")
@@ -0,0 +1,145 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from helpers.state import state_path, has_state, STATE_FOLDER
+
+DIGESTS_NAME = "digests.sqlite"
+DIGEST_CHUNK_BYTES = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(DIGEST_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DigestStore:
+    """SHA-256 of the files written into a destination, computed as they are written.
+
+    Entries are keyed by device and inode, so they follow a file through
+    renames and its move into the data folder of a bag. A digest only counts
+    while the size and mtime of the file are those it was recorded with.
+    """
+
+    def __init__(self, destination_root):
+        self.root = destination_root
+        self.path = state_path(destination_root, DIGESTS_NAME)
+        self._lock = threading.Lock()
+        # Copy threads, image workers and other hosts write to it
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS digests (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (device, inode)
+            );
+            """
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def exists(destination_root):
+        return has_state(destination_root, DIGESTS_NAME)
+
+    def record(self, path, sha256):
+        """Stores the digest of path, as the file is now."""
+        stat = os.stat(path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, sha256),
+            )
+
+    def entries(self):
+        """(size, mtime_ns, sha256) of every recorded file by (device, inode)."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT device, inode, size, mtime_ns, sha256 FROM digests"
+            ).fetchall()
+        return {
+            (device, inode): (size, mtime_ns, sha256)
+            for device, inode, size, mtime_ns, sha256 in rows
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def recorded_digests(destination_root):
+    """Entries of the store of a destination, empty when it has none."""
+    if not DigestStore.exists(destination_root):
+        return {}
+    store = DigestStore(destination_root)
+    try:
+        return store.entries()
+    finally:
+        store.close()
+
+
+def recorded_digest(entries, path):
+    """Digest of path from DigestStore.entries, None when it changed since."""
+    stat = os.stat(path)
+    entry = entries.get((stat.st_dev, stat.st_ino))
+    if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return entry[2]
+
+
+# Folder -> store of the destination holding it (None outside destinations),
+# per process: image workers look their store up themselves
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def digest_store_for(path):
+    """The store of the destination a path is in, None when it has none."""
+    folder = os.path.dirname(os.path.abspath(path))
+    with _stores_lock:
+        if folder in _stores:
+            return _stores[folder]
+        store = None
+        candidate = folder
+        while True:
+            if candidate in _stores:
+                store = _stores[candidate]
+                break
+            if DigestStore.exists(candidate):
+                store = DigestStore(candidate)
+                _stores[candidate] = store
+                break
+            parent = os.path.dirname(candidate)
+            if parent == candidate or os.path.basename(candidate) == STATE_FOLDER:
+                break
+            candidate = parent
+        _stores[folder] = store
+        return store
+
+
+def record_output_digest(output_path):
+    """Hashes a freshly written output for the bag manifest, while it is cached.
+
+    Converters hand their output to external tools that seek back into it
+    (ffmpeg headers, TIFF directories), so it is hashed right after it is
+    committed, from the page cache, rather than from the written stream.
+    """
+    try:
+        store = digest_store_for(output_path)
+        if store is not None:
+            store.record(output_path, file_digest(output_path))
+    except (OSError, sqlite3.Error) as e:
+        # Without a digest the bag hashes the file itself
+        logging.warning(f"Could not record the digest of {output_path}: {e}")
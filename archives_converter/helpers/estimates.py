@@ -0,0 +1,101 @@
+import os
+import heapq
+import concurrent.futures
+
+from helpers.probe import probe_duration
+from helpers.conversion_progress import input_size
+from config.estimates import (
+    media_speed,
+    fallback_bitrates,
+    byte_speed,
+    document_seconds,
+)
+
+# ffprobe runs at once while estimating the jobs of a conversion
+PROBE_WORKERS = 8
+
+
+def estimate_seconds(media_type, convert_type, input_bytes, duration=None):
+    """Wall seconds one job of media_type takes, from config/estimates.py."""
+    if media_type in media_speed[convert_type]:
+        if duration is None:
+            duration = input_bytes / fallback_bitrates[media_type]
+        return duration / media_speed[convert_type][media_type]
+    if media_type in byte_speed:
+        return input_bytes / byte_speed[media_type]
+    if media_type == "document":
+        return document_seconds
+    return 0.0
+
+
+def estimate_jobs(jobs, convert_type_of):
+    """Sets estimated_seconds on the jobs lacking it, probing media durations.
+
+    convert_type_of(job) gives the convert type (AIP, DIP) of a job.
+    """
+    to_estimate = [
+        job
+        for job in jobs
+        if job.get("estimated_seconds") is None and job["lane"] != "other"
+    ]
+    to_probe = []
+    for job in to_estimate:
+        path = os.path.join(job["root"], job["name"])
+        if job.get("bytes") is None:
+            job["bytes"] = input_size(path)
+        job["duration"] = None
+        # A VIDEO_TS folder has no container to probe, its size is used instead
+        if job["media_type"] in media_speed[convert_type_of(job)] and os.path.isfile(
+            path
+        ):
+            to_probe.append(job)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        durations = executor.map(
+            lambda job: probe_duration(os.path.join(job["root"], job["name"])),
+            to_probe,
+        )
+        for job, duration in zip(to_probe, durations):
+            job["duration"] = duration
+
+    for job in to_estimate:
+        job["estimated_seconds"] = estimate_seconds(
+            job["media_type"], convert_type_of(job), job["bytes"], job["duration"]
+        )
+    return jobs
+
+
+def longest_first(jobs):
+    """Orders jobs by decreasing estimate, walk order among equal ones."""
+    return sorted(jobs, key=lambda job: -(job.get("estimated_seconds") or 0.0))
+
+
+def predict_makespan(jobs, total_cores, lane_slots):
+    """Wall seconds the jobs take when started in order, from their estimates.
+
+    Every job waits for a free worker of its lane and for its cores, jobs start
+    in order as the core budget hands them out. lane_slots maps each lane to
+    its number of workers.
+    """
+    free_cores = total_cores
+    # (end time, cores) of the running jobs
+    running = []
+    # End times of the busy workers of each lane
+    lanes = {lane: [0.0] * slots for lane, slots in lane_slots.items()}
+    now = 0.0
+    makespan = 0.0
+    for job in jobs:
+        seconds = job.get("estimated_seconds") or 0.0
+        slots = lanes.get(job["lane"]) or lanes.get("other")
+        now = max(now, heapq.heappop(slots))
+        cores = min(job.get("cores", 0), total_cores)
+        while running and (running[0][0] <= now or free_cores < cores):
+            end, released = heapq.heappop(running)
+            now = max(now, end)
+            free_cores += released
+        if cores:
+            free_cores -= cores
+            heapq.heappush(running, (now + seconds, cores))
+        heapq.heappush(slots, now + seconds)
+        makespan = max(makespan, now + seconds)
+    return makespan
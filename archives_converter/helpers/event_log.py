@@ -0,0 +1,119 @@
+import csv
+import json
+import queue
+import threading
+import time
+
+from helpers.converters.errors import truncate_stderr
+from helpers.journal import FAILED
+
+SKIPPED = "skipped"
+
+ERROR_REPORT_FIELDS = ["File", "Error", "Stage", "Converter", "Exit code"]
+
+_CLOSE = object()
+
+
+class EventLog:
+    """Writes conversion events as JSON Lines from a dedicated writer thread.
+
+    Converter threads only put events on a queue. The writer drains it in
+    batches and flushes the file every flush_interval seconds.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._write_events, daemon=True)
+        self._thread.start()
+
+    def emit(
+        self,
+        file,
+        stage,
+        status,
+        converter=None,
+        duration=None,
+        exit_code=None,
+        stderr=None,
+        error=None,
+    ):
+        self._queue.put(
+            {
+                "time": time.time(),
+                "file": file,
+                "stage": stage,
+                "status": status,
+                "converter": converter,
+                "duration": round(duration, 3) if duration is not None else None,
+                "exit_code": exit_code,
+                "stderr": truncate_stderr(stderr),
+                "error": error,
+            }
+        )
+
+    def _write_events(self):
+        closing = False
+        while not closing:
+            lines = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(lines) < self.batch_size:
+                try:
+                    event = self._queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if event is _CLOSE:
+                    closing = True
+                    break
+                lines.append(json.dumps(event, ensure_ascii=False))
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+        self._file.close()
+
+    def close(self):
+        """Writes the pending events and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as event_file:
+        for line in event_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_error_report(events_path, report_path):
+    """Writes the failed events as the conversion_errors CSV, returns their count.
+
+    No file is written when nothing failed.
+    """
+    failures = [
+        event for event in read_events(events_path) if event["status"] == FAILED
+    ]
+    if not failures:
+        return 0
+    with open(report_path, mode="w", newline="") as error_file:
+        writer = csv.writer(error_file)
+        writer.writerow(ERROR_REPORT_FIELDS)
+        for event in failures:
+            error = event["error"]
+            if event["stderr"]:
+                error = f"{error}: {event['stderr']}"
+            writer.writerow(
+                [
+                    event["file"],
+                    error,
+                    event["stage"],
+                    event["converter"] or "",
+                    "" if event["exit_code"] is None else event["exit_code"],
+                ]
+            )
+    return len(failures)
@@ -0,0 +1,55 @@
+import os
+import sys
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl sharing the extents of a file with another (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY = "copy"
+
+
+def reflink(source, destination):
+    """Clones source to destination without copying data, False where unsupported."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(source, "rb") as source_file, open(destination, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source_file.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(destination)
+        except FileNotFoundError:
+            pass
+        return False
+
+
+def link_or_copy(source, destination, methods=(REFLINK, HARDLINK, COPY)):
+    """Puts source at destination with the cheapest of methods, returns the one used.
+
+    A reflink is an independent copy sharing blocks until written to, a
+    hardlink shares the file itself. Both need source and destination on the
+    same filesystem, a plain copy works everywhere.
+    """
+    for method in methods:
+        if method == REFLINK and reflink(source, destination):
+            # Same timestamps and mode as a hardlink or copy2 would give
+            shutil.copystat(source, destination)
+            return REFLINK
+        if method == HARDLINK:
+            try:
+                os.link(source, destination)
+                return HARDLINK
+            except OSError:
+                continue
+        if method == COPY:
+            shutil.copy2(source, destination)
+            return COPY
+    raise OSError(f"Could not link or copy {source} to {destination}")
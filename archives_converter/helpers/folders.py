@@ -1,18 +1,9 @@
 import os
-import shutil
-from rich.progress import (
-    Progress,
-    BarColumn,
-    TextColumn,
-    TimeRemainingColumn,
-    SpinnerColumn,
-)
-from config.formats import (
-    image_extensions,
-    video_extensions,
-    audio_extensions,
-    text_extensions,
-)
+
+from helpers.clone_engine import copy_files
+from helpers.classifier import classify, media_class, is_selected
+from helpers.to_snake_case import snake_case_names
+from helpers.state import STATE_FOLDER
 
 
 def count_files_and_folders(folder, selected_media_types):
@@ -21,83 +12,82 @@ def count_files_and_folders(folder, selected_media_types):
     for root, dirs, files in os.walk(folder):
         total_folders += len(dirs)
         for file in files:
-            if should_copy_file(file, selected_media_types):
+            if should_copy_file(file, selected_media_types, os.path.join(root, file)):
                 total_files += 1
     return total_files, total_folders
 
 
-def should_copy_file(file, selected_media_types):
-    lower_file = file.lower()
-    # All known extensions
-    known_exts = set(
-        [
-            ext.lower()
-            for ext in audio_extensions
-            + video_extensions
-            + image_extensions
-            + text_extensions
-        ]
-        + [".vob", ".ifo", ".bup"]
-    )
+def should_copy_file(file, selected_media_types, path=None):
+    """Media files are copied when their type is selected, other files always.
 
-    # If file matches a known extension, only copy if its type is selected
-    if lower_file.endswith(tuple(known_exts)):
-        if "dvd" in selected_media_types and lower_file.endswith(
-            (".vob", ".ifo", ".bup")
-        ):
-            return True
-        if "audio" in selected_media_types and any(
-            lower_file.endswith(ext.lower()) for ext in audio_extensions
-        ):
-            return True
-        if "video" in selected_media_types and any(
-            lower_file.endswith(ext.lower()) for ext in video_extensions
-        ):
-            return True
-        if "image" in selected_media_types and any(
-            lower_file.endswith(ext.lower()) for ext in image_extensions
-        ):
-            return True
-        if "text" in selected_media_types and any(
-            lower_file.endswith(ext.lower()) for ext in text_extensions
-        ):
-            return True
-        return False  # Known extension but not selected
-    # If file does not match any known extension, always copy
-    return True
+    The content of path decides over the extension when sniffing is on.
+    """
+    media = classify(path, file).media_class if path else media_class(file)
+    return is_selected(media, selected_media_types)
 
 
-def copy_folder_with_progress(source, destination, selected_media_types):
-    total_files, total_folders = count_files_and_folders(source, selected_media_types)
-    total_items = total_files + total_folders
+def clone_tree(source, selected_media_types, snake_case=True):
+    """Folders and selected files of source, with the paths of their clones.
+
+    Returns (folders, files), lists of (source path, path relative to the
+    clone) in walk order. With snake_case the clone paths are the names the
+    renaming would give, collisions included.
+    """
+    # Source folder -> its clone, named before what it holds
+    clone_folders = {source: ""}
+    folders = []
+    clone_files = []
+    for root, dirs, files in os.walk(source):
+        clone_root = clone_folders[root]
+        selected_files = [
+            file
+            for file in files
+            if should_copy_file(file, selected_media_types, os.path.join(root, file))
+        ]
+        # The renaming leaves the bookkeeping of the converter alone
+        names = (
+            snake_case_names(selected_files, dirs)
+            if snake_case
+            and STATE_FOLDER not in os.path.relpath(root, source).split(os.sep)
+            else {}
+        )
+        for dir in dirs:
+            clone_folder = os.path.join(clone_root, names.get(dir, dir))
+            clone_folders[os.path.join(root, dir)] = clone_folder
+            folders.append((os.path.join(root, dir), clone_folder))
+        for file in selected_files:
+            clone_path = os.path.join(clone_root, names.get(file, file))
+            clone_files.append((os.path.join(root, file), clone_path))
+    return folders, clone_files
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeRemainingColumn(),
-    ) as progress:
-        task = progress.add_task("Copying folder...", total=total_items)
 
-        for root, dirs, files in os.walk(source):
-            # Create directories in the destination folder
-            for dir in dirs:
-                src_dir = os.path.join(root, dir)
-                dst_dir = os.path.join(destination, os.path.relpath(src_dir, source))
-                os.makedirs(dst_dir, exist_ok=True)
-                progress.advance(task)
+def copy_folder_with_progress(
+    source,
+    destination,
+    selected_media_types,
+    threads=None,
+    event_log=None,
+    digests=None,
+    snake_case=False,
+):
+    """Copies the selected files of source to destination, returns the clone stats.
 
-            # Copy files to the destination folder
-            for file in files:
-                if should_copy_file(file, selected_media_types):
-                    src_file = os.path.join(root, file)
-                    dst_file = os.path.join(
-                        destination, os.path.relpath(src_file, source)
-                    )
+    With snake_case, files and folders are copied straight to the names the
+    renaming would give them and stats["clones"] maps every source file to
+    its copy.
+    """
+    # The destination exists even when the source holds no folder
+    os.makedirs(destination, exist_ok=True)
+    folders, files = clone_tree(source, selected_media_types, snake_case)
+    # Create directories in the destination folder, empty ones included
+    for _, clone_folder in folders:
+        os.makedirs(os.path.join(destination, clone_folder), exist_ok=True)
+    pairs = [
+        (source_file, os.path.join(destination, clone_path))
+        for source_file, clone_path in files
+    ]
 
-                    try:
-                        shutil.copy2(src_file, dst_file)
-                    except PermissionError as e:
-                        print(f"Permission denied: {e.filename}")
-                    progress.advance(task)
+    stats = copy_files(pairs, threads, event_log, digests=digests)
+    if snake_case:
+        stats["clones"] = dict(pairs)
+    return stats
@@ -0,0 +1,131 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+from helpers.state import state_path, has_state
+
+JOURNAL_NAME = "journal.sqlite"
+
+PLANNED = "planned"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ConversionJournal:
+    """Records the state of every file of a conversion run in a SQLite file.
+
+    The journal lives in the state folder of the destination so an interrupted
+    run can be resumed without walking, renaming or checking the tree again.
+    """
+
+    def __init__(self, destination_root):
+        self.root = destination_root
+        self.path = state_path(destination_root, JOURNAL_NAME)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                root TEXT NOT NULL,
+                name TEXT NOT NULL,
+                lane TEXT,
+                cores INTEGER,
+                state TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL,
+                output TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_state ON files (state);
+            """
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def exists(destination_root):
+        return has_state(destination_root, JOURNAL_NAME)
+
+    def start_run(self, jobs, **meta):
+        """Forgets any previous run and records the jobs of a new one as planned.
+
+        Jobs converted from the source folder keep their output path.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("DELETE FROM meta")
+            self._connection.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in meta.items()],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                [
+                    (
+                        os.path.join(job["root"], job["name"]),
+                        job["root"],
+                        job["name"],
+                        job.get("lane"),
+                        job.get("cores", 0),
+                        PLANNED,
+                        now,
+                        job.get("output"),
+                    )
+                    for job in jobs
+                ],
+            )
+
+    def meta(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT key, value FROM meta").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def mark(self, paths, state, error=None):
+        if isinstance(paths, str):
+            paths = [paths]
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE files SET state = ?, error = ?, updated_at = ? WHERE path = ?",
+                [(state, error, now, path) for path in paths],
+            )
+
+    def unfinished_jobs(self):
+        """Returns the jobs that were planned, interrupted or failed."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT root, name, lane, cores, state, output FROM files "
+                "WHERE state != ?",
+                (DONE,),
+            ).fetchall()
+        return [
+            {
+                "root": root,
+                "name": name,
+                "lane": lane,
+                "cores": cores,
+                "state": state,
+                "output": output,
+            }
+            for root, name, lane, cores, state, output in rows
+        ]
+
+    def counts(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM files GROUP BY state"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
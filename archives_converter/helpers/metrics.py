@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from helpers.state import state_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_NAME = "metrics"
+PROMETHEUS_PREFIX = "archives_converter"
+
+
+def _process_io():
+    # Logical bytes read and written by this process, Linux only
+    try:
+        with open("/proc/self/io") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _snapshot():
+    return {
+        "wall": time.perf_counter(),
+        "self": resource.getrusage(resource.RUSAGE_SELF) if resource else None,
+        "children": (
+            resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        ),
+        "io": _process_io(),
+    }
+
+
+def _cpu_seconds(rusage):
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def max_rss_bytes(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+class RunMetrics:
+    """Wall time, CPU time, IO and file counts of the stages and converters of a run.
+
+    Stages are measured on the whole process (threads and children included),
+    converters per file and external tools from the rusage of each child.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = threading.local()
+        self.output_folder = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}
+            self.converters = {}
+            self.tools = {}
+            self.cache = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Measures a pipeline stage, the yielded dict takes its file count."""
+        counts = {"files": 0}
+        before = _snapshot()
+        try:
+            yield counts
+        finally:
+            after = _snapshot()
+            with self._lock:
+                stats = self.stages.setdefault(
+                    name,
+                    {
+                        "runs": 0,
+                        "wall_seconds": 0.0,
+                        "cpu_seconds": 0.0,
+                        "children_cpu_seconds": 0.0,
+                        "read_bytes": 0,
+                        "write_bytes": 0,
+                        "children_read_bytes": 0,
+                        "children_write_bytes": 0,
+                        "files": 0,
+                    },
+                )
+                stats["runs"] += 1
+                stats["wall_seconds"] += after["wall"] - before["wall"]
+                stats["files"] += counts["files"]
+                if after["self"]:
+                    stats["cpu_seconds"] += _cpu_seconds(
+                        after["self"]
+                    ) - _cpu_seconds(before["self"])
+                    children, children_before = after["children"], before["children"]
+                    stats["children_cpu_seconds"] += _cpu_seconds(
+                        children
+                    ) - _cpu_seconds(children_before)
+                    # Block counts are in 512 byte units
+                    stats["children_read_bytes"] += 512 * (
+                        children.ru_inblock - children_before.ru_inblock
+                    )
+                    stats["children_write_bytes"] += 512 * (
+                        children.ru_oublock - children_before.ru_oublock
+                    )
+                if after["io"] and before["io"]:
+                    stats["read_bytes"] += after["io"][0] - before["io"][0]
+                    stats["write_bytes"] += after["io"][1] - before["io"][1]
+
+    def add_stage_files(self, name, files):
+        with self._lock:
+            if name in self.stages:
+                self.stages[name]["files"] += files
+
+    def _converter_stats(self, name):
+        return self.converters.setdefault(
+            name,
+            {
+                "files": 0,
+                "failures": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "tool_cpu_seconds": 0.0,
+                "input_bytes": 0,
+                "output_bytes": 0,
+            },
+        )
+
+    @contextmanager
+    def converter(self, name):
+        """Attributes the tools run by this thread to the converter name."""
+        self._current.converter = name
+        try:
+            yield
+        finally:
+            self._current.converter = None
+
+    def record_conversion(
+        self,
+        converter,
+        wall_seconds,
+        cpu_seconds,
+        input_bytes=0,
+        output_bytes=0,
+        failed=False,
+    ):
+        with self._lock:
+            stats = self._converter_stats(converter)
+            stats["files"] += 1
+            stats["failures"] += 1 if failed else 0
+            stats["wall_seconds"] += wall_seconds
+            stats["cpu_seconds"] += cpu_seconds
+            stats["input_bytes"] += input_bytes
+            stats["output_bytes"] += output_bytes
+
+    def record_tool(self, tool, wall_seconds, rusage):
+        """Records one external tool run, rusage as returned by os.wait4 (or None)."""
+        with self._lock:
+            stats = self.tools.setdefault(
+                tool,
+                {
+                    "runs": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "max_rss_bytes": 0,
+                    "read_bytes": 0,
+                    "write_bytes": 0,
+                },
+            )
+            stats["runs"] += 1
+            stats["wall_seconds"] += wall_seconds
+            if rusage is None:
+                return
+            cpu_seconds = _cpu_seconds(rusage)
+            stats["cpu_seconds"] += cpu_seconds
+            stats["max_rss_bytes"] = max(stats["max_rss_bytes"], max_rss_bytes(rusage))
+            stats["read_bytes"] += 512 * rusage.ru_inblock
+            stats["write_bytes"] += 512 * rusage.ru_oublock
+            converter = getattr(self._current, "converter", None)
+            if converter:
+                self._converter_stats(converter)["tool_cpu_seconds"] += cpu_seconds
+
+    def record_cache(self, stats):
+        """Adds the conversion cache counters of a run, see stats_since."""
+        with self._lock:
+            for key, value in stats.items():
+                self.cache[key] = self.cache.get(key, 0) + value
+
+    def summary(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "finished": time.time(),
+                "stages": self.stages,
+                "converters": self.converters,
+                "tools": self.tools,
+                "cache": self.cache,
+            }
+
+    def prometheus_text(self, summary=None):
+        summary = summary or self.summary()
+        lines = []
+        for section, label in (
+            ("stages", "stage"),
+            ("converters", "converter"),
+            ("tools", "tool"),
+        ):
+            keys = sorted(
+                {key for stats in summary[section].values() for key in stats}
+            )
+            for key in keys:
+                metric = f"{PROMETHEUS_PREFIX}_{label}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                for name, stats in sorted(summary[section].items()):
+                    lines.append(f'{metric}{{{label}="{name}"}} {stats[key]}')
+        for key, value in sorted(summary.get("cache", {}).items()):
+            metric = f"{PROMETHEUS_PREFIX}_cache_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        metric = f"{PROMETHEUS_PREFIX}_run_finished_timestamp_seconds"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {summary['finished']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, destination_root=None, name=METRICS_NAME):
+        """Writes <name>.json and <name>.prom to the state folder of the destination.
+
+        They are written to output_folder as well when one is set, and only
+        there without a destination.
+        """
+        summary = self.summary()
+        folders = []
+        if destination_root is not None:
+            folders.append(os.path.dirname(state_path(destination_root, name)))
+        if self.output_folder:
+            os.makedirs(self.output_folder, exist_ok=True)
+            folders.append(self.output_folder)
+        for folder in folders:
+            with open(os.path.join(folder, f"{name}.json"), "w") as json_file:
+                json.dump(summary, json_file, indent=2)
+            with open(os.path.join(folder, f"{name}.prom"), "w") as prom_file:
+                prom_file.write(self.prometheus_text(summary))
+        return folders
+
+
+def format_stage_stats(summary):
+    return [
+        f"{name}: {stats['wall_seconds']:.1f}s wall, "
+        f"{stats['cpu_seconds']:.1f}s CPU, "
+        f"{stats['children_cpu_seconds']:.1f}s tools CPU, "
+        f"{stats['files']} files"
+        for name, stats in summary["stages"].items()
+    ]
+
+
+# Metrics of the current run, shared by all stages
+metrics = RunMetrics()
@@ -1,3 +1,4 @@
+import os
 from config.formats import (
     image_extensions,
     video_extensions,
@@ -7,28 +8,35 @@ from config.formats import (
 )
 from .to_snake_case import to_snake_case
 
+_image_extensions = {ext.lower() for ext in image_extensions}
+_video_extensions = {ext.lower() for ext in video_extensions}
+_audio_extensions = {ext.lower() for ext in audio_extensions}
+_text_extensions = {ext.lower() for ext in text_extensions}
+
 
 def predict_name_based_on_extension(input_name, convert_type):
     # get file extension
     if "." not in input_name:
         return to_snake_case(input_name)
-    extension = "." + input_name.split(".")[-1]
-    name_extension = input_name.split(".")[-1]
+    base_name, extension = os.path.splitext(input_name)
+    # converters always name their output after the lowercased extension
+    extension = extension.lower()
+    name_extension = extension.lstrip(".")
     # replace extension based on the conversion
-    if extension in image_extensions and convert_type == "AIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.tiff")
-    elif extension in image_extensions and convert_type == "DIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.jpg")
-    elif extension in video_extensions and convert_type == "AIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.mkv")
-    elif extension in video_extensions and convert_type == "DIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.mp4")
-    elif extension in audio_extensions and convert_type == "AIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.wav")
-    elif extension in audio_extensions and convert_type == "DIP":
-        input_name = input_name.replace(extension, f"_{name_extension}.mp3")
-    elif extension in text_extensions:
-        input_name = input_name.replace(extension, f"_{name_extension}.pdf")
+    if extension in _image_extensions and convert_type == "AIP":
+        input_name = f"{base_name}_{name_extension}.tiff"
+    elif extension in _image_extensions and convert_type == "DIP":
+        input_name = f"{base_name}_{name_extension}.jpg"
+    elif extension in _video_extensions and convert_type == "AIP":
+        input_name = f"{base_name}_{name_extension}.mkv"
+    elif extension in _video_extensions and convert_type == "DIP":
+        input_name = f"{base_name}_{name_extension}.mp4"
+    elif extension in _audio_extensions and convert_type == "AIP":
+        input_name = f"{base_name}_{name_extension}.wav"
+    elif extension in _audio_extensions and convert_type == "DIP":
+        input_name = f"{base_name}_{name_extension}.mp3"
+    elif extension in _text_extensions:
+        input_name = f"{base_name}_{name_extension}.pdf"
     elif extension in text_files_to_ignore:
         return input_name
 
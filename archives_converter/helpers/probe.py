@@ -0,0 +1,25 @@
+import subprocess
+
+
+def probe_duration(path):
+    """Returns the media duration in seconds read from the container, or None."""
+    duration_command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        path,
+    ]
+    try:
+        output = subprocess.run(
+            duration_command,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        ).stdout.strip()
+        return float(output)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
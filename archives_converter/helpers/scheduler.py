@@ -0,0 +1,227 @@
+import os
+import queue
+import threading
+import time
+import logging
+from collections import deque
+
+from config.resources import converter_lanes, default_core_budget, termination_grace
+from helpers.state import STATE_FOLDER
+from helpers.tool_runner import (
+    cancel_running_tools,
+    reset_cancellation,
+    ToolCancelled,
+)
+from helpers.estimates import longest_first, predict_makespan
+
+# Seconds the workers get to roll back their outputs once their tools stopped
+ROLLBACK_SECONDS = 10
+
+
+def collect_jobs(folder, selected_media_types, tree=None):
+    """Enumerates every file and folder of the tree once, in os.walk order.
+
+    The tree index is walked instead of the filesystem when one is given.
+    """
+    jobs = []
+    for root, dirs, files in tree.walk(folder) if tree else os.walk(folder):
+        if STATE_FOLDER in dirs:
+            dirs.remove(STATE_FOLDER)
+        for name in files + dirs:
+            if name == ".DS_Store":
+                continue
+            jobs.append({"root": root, "name": name})
+        # VIDEO_TS folders are converted as a whole, their content must not be queued
+        if "dvd" in selected_media_types and "VIDEO_TS" in dirs:
+            dirs.remove("VIDEO_TS")
+    return jobs
+
+
+class CoreBudget:
+    """Hands out CPU cores first come, first served so big jobs are not starved.
+
+    A job further back may start first when its cores are free and it is
+    expected to end before the first waiting job could start anyway, so small
+    jobs fill the gaps a big job leaves while it waits for its cores.
+    """
+
+    def __init__(self, total):
+        self.total = max(1, total)
+        self.available = self.total
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        # thread id -> (cores, expected end) of the running jobs
+        self._running = {}
+
+    def _head_start(self, now):
+        """Earliest time the first waiting job can get its cores."""
+        missing = self._waiting[0][1] - self.available
+        if missing <= 0:
+            return now
+        # Jobs without an estimate, or past it, may end any moment
+        for end, cores in sorted(
+            (max(now, end or now), cores) for cores, end in self._running.values()
+        ):
+            missing -= cores
+            if missing <= 0:
+                return end
+        return now
+
+    def _may_start(self, ticket, cores, estimated_seconds):
+        if self.available < cores:
+            return False
+        if self._waiting[0][0] is ticket:
+            return True
+        if not estimated_seconds:
+            return False
+        now = time.monotonic()
+        return now + estimated_seconds <= self._head_start(now)
+
+    def acquire(self, cores, estimated_seconds=None):
+        cores = min(cores, self.total)
+        if cores <= 0:
+            return 0
+        ticket = (object(), cores)
+        with self._condition:
+            self._waiting.append(ticket)
+            while not self._may_start(ticket[0], cores, estimated_seconds):
+                self._condition.wait()
+            self._waiting.remove(ticket)
+            self.available -= cores
+            now = time.monotonic()
+            self._running[threading.get_ident()] = (
+                cores,
+                now + estimated_seconds if estimated_seconds else None,
+            )
+            self._condition.notify_all()
+        return cores
+
+    def release(self, cores):
+        if cores <= 0:
+            return
+        with self._condition:
+            self.available += cores
+            self._running.pop(threading.get_ident(), None)
+            self._condition.notify_all()
+
+
+def join_workers(threads, stop):
+    """Waits for the worker threads, cancelling the run on Ctrl-C.
+
+    Tools run in their own process group and do not see the interrupt: they are
+    terminated with their children, and the workers get a moment to discard
+    their partial outputs before the interrupt goes on.
+    """
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        stoppers = cancel_running_tools()
+        deadline = time.monotonic() + termination_grace + ROLLBACK_SECONDS
+        for thread in stoppers + threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        raise
+
+
+def run_jobs(jobs, worker, core_budget=None, lanes=None):
+    """Runs worker(job) for every job through per-lane worker pools sharing one core budget.
+
+    Each job names its lane ("lane") and the cores it needs ("cores"). The number of
+    cores actually granted is written back to job["cores"] before the worker runs, so
+    it can be passed on to the external tool. Jobs with an estimated_seconds are
+    started longest first, so a big file found last does not run alone at the
+    end. Returns timing statistics of the batch, with the makespan predicted
+    from the estimates.
+    """
+    # A run cancelled earlier in this process (dialog, job file) must not
+    # cancel this one
+    reset_cancellation()
+    lanes = lanes or converter_lanes
+    budget = CoreBudget(core_budget or default_core_budget)
+
+    jobs = longest_first(jobs)
+    lane_queues = {}
+    for job in jobs:
+        lane = job.get("lane", "other")
+        if lane not in lanes:
+            lane = "other"
+        job["lane"] = lane
+        lane_queues.setdefault(lane, queue.SimpleQueue()).put(job)
+
+    lane_stats = {
+        lane: {"jobs": 0, "workers": 0, "busy_time": 0.0} for lane in lane_queues
+    }
+    stats_lock = threading.Lock()
+    reserved_time = [0.0]
+    start_time = time.perf_counter()
+    stop = threading.Event()
+
+    def drain(lane):
+        work_queue = lane_queues[lane]
+        while not stop.is_set():
+            try:
+                job = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            granted = budget.acquire(
+                job.get("cores", 0), job.get("estimated_seconds")
+            )
+            job["cores"] = granted
+            job_start = time.perf_counter()
+            try:
+                worker(job)
+            except ToolCancelled:
+                return
+            except Exception as e:
+                logging.error(f"Unhandled error while processing {job['name']}: {e}")
+            finally:
+                duration = time.perf_counter() - job_start
+                budget.release(granted)
+                with stats_lock:
+                    lane_stats[lane]["jobs"] += 1
+                    lane_stats[lane]["busy_time"] += duration
+                    reserved_time[0] += duration * granted
+
+    threads = []
+    for lane, work_queue in lane_queues.items():
+        max_jobs = lanes[lane].get("max_jobs") or budget.total
+        worker_count = max(1, min(max_jobs, budget.total, work_queue.qsize()))
+        lane_stats[lane]["workers"] = worker_count
+        for _ in range(worker_count):
+            threads.append(threading.Thread(target=drain, args=(lane,), daemon=True))
+    predicted_makespan = predict_makespan(
+        jobs,
+        budget.total,
+        {lane: stats["workers"] for lane, stats in lane_stats.items()},
+    )
+    for thread in threads:
+        thread.start()
+    join_workers(threads, stop)
+
+    wall_time = time.perf_counter() - start_time
+    capacity = wall_time * budget.total
+    return {
+        "jobs": len(jobs),
+        "workers": len(threads),
+        "cores": budget.total,
+        "wall_time": wall_time,
+        "busy_time": sum(lane["busy_time"] for lane in lane_stats.values()),
+        "idle_time": max(0.0, capacity - reserved_time[0]),
+        "utilization": reserved_time[0] / capacity if capacity else 0.0,
+        "predicted_makespan": predicted_makespan,
+        "lanes": lane_stats,
+    }
+
+
+def format_scheduler_stats(stats):
+    lanes = ", ".join(
+        f"{lane} {lane_stats['jobs']} jobs/{lane_stats['workers']} workers"
+        for lane, lane_stats in stats["lanes"].items()
+    )
+    return (
+        f"{stats['jobs']} jobs on {stats['cores']} cores in {stats['wall_time']:.1f}s "
+        f"(predicted {stats['predicted_makespan']:.1f}s), "
+        f"idle core time {stats['idle_time']:.1f}s "
+        f"({stats['utilization']:.0%} utilization) [{lanes}]"
+    )
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# Hidden folder at the root of an AIP/DIP holding the converter's own bookkeeping
+STATE_FOLDER = ".archives_converter"
+
+
+def state_path(destination_root, name):
+    """Returns the path of a bookkeeping file, creating the state folder if needed."""
+    state_folder = os.path.join(destination_root, STATE_FOLDER)
+    os.makedirs(state_folder, exist_ok=True)
+    return os.path.join(state_folder, name)
+
+
+def state_root(folder):
+    """The folder whose state folder folder uses: the bag, for its data folder."""
+    folder = os.path.abspath(folder)
+    parent = os.path.dirname(folder)
+    if os.path.basename(folder) == "data" and os.path.isfile(
+        os.path.join(parent, "bagit.txt")
+    ):
+        return parent
+    return folder
+
+
+def has_state(destination_root, name):
+    return os.path.exists(os.path.join(destination_root, STATE_FOLDER, name))
+
+
+@contextmanager
+def set_aside_state(bag_dir):
+    """Moves the state folder out of a bag while BagIt builds its manifests.
+
+    bagit.make_bag moves everything into data/ and bag.save hashes every file
+    outside data/ into the tag manifest, so the state folder must not be there.
+    """
+    state_folder = os.path.join(bag_dir, STATE_FOLDER)
+    if not os.path.isdir(state_folder):
+        yield
+        return
+
+    parking = tempfile.mkdtemp(prefix=".state_", dir=os.path.dirname(bag_dir))
+    parked_state = os.path.join(parking, STATE_FOLDER)
+    os.rename(state_folder, parked_state)
+    try:
+        yield
+    finally:
+        os.rename(parked_state, state_folder)
+        shutil.rmtree(parking, ignore_errors=True)
@@ -29,3 +29,49 @@ def to_snake_case(file_path):
         snake_str = re.sub(r"_+", "_", snake_str)
 
         return snake_str + ext
+
+
+def keeps_name(name, is_dir):
+    """Hidden entries, tag files and VIDEO_TS folders are not renamed."""
+    if name.startswith("."):  # .DS_Store and the state folder included
+        return True
+    if is_dir:
+        return name == "VIDEO_TS"
+    return name in text_files_to_ignore
+
+
+def _numbered(name, number, is_dir):
+    stem, extension = (name, "") if is_dir else os.path.splitext(name)
+    return f"{stem}_{number}{extension}"
+
+
+def snake_case_names(files, dirs, taken=()):
+    """{old name: new name} of the entries of one folder whose name changes.
+
+    Names that would end up the same, or the same as another entry's or one
+    of taken, get _1, _2... in the order of their original names, so a retry
+    renames the same way. Names are compared ignoring case, as macOS and
+    Windows do. A name with nothing left once in snake_case is kept.
+    """
+    entries = [(name, False) for name in files] + [(name, True) for name in dirs]
+    # The original names stay taken, the entries are renamed one at a time
+    taken = {name.casefold() for name in taken}
+    taken.update(name.casefold() for name, _ in entries)
+    renames = {}
+    for name, is_dir in sorted(entries):
+        if keeps_name(name, is_dir):
+            continue
+        new_name = to_snake_case(name)
+        if new_name == name:
+            continue
+        # Nothing left of the name but its extension, it would become hidden
+        if not new_name or new_name.startswith("."):
+            continue
+        candidate = new_name
+        number = 0
+        while candidate.casefold() in taken:
+            number += 1
+            candidate = _numbered(new_name, number, is_dir)
+        taken.add(candidate.casefold())
+        renames[name] = candidate
+    return renames
@@ -0,0 +1,361 @@
+import os
+import re
+import sys
+import time
+import signal
+import subprocess
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from helpers.metrics import metrics
+from config.resources import (
+    minimum_throughput,
+    timeout_factor,
+    minimum_tool_timeout,
+    stall_timeout,
+    termination_grace,
+)
+
+# Lines of output kept for error reports, long encodes print a lot of warnings
+OUTPUT_LINES_KEPT = 200
+# Seconds between two checks of the deadline of a running tool
+WATCH_INTERVAL = 1.0
+
+_ffmpeg_duration = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_gs_page_count = re.compile(r"Processing pages \d+ through (\d+)")
+_gs_page = re.compile(r"^Page (\d+)")
+
+_reporter = threading.local()
+
+# Tools running in this process, terminated together on cancellation
+_running = set()
+_running_lock = threading.Lock()
+_cancelled = threading.Event()
+
+# cost class -> [work done, seconds taken] by the tool runs that succeeded
+_throughput = {}
+_throughput_lock = threading.Lock()
+
+
+class ToolStalled(subprocess.TimeoutExpired):
+    """A tool stopped reporting progress for longer than its stall timeout."""
+
+    def __str__(self):
+        return (
+            f"Command '{self.cmd[0]}' made no progress for {self.timeout:.0f} seconds"
+        )
+
+
+class ToolCancelled(Exception):
+    """The conversion was cancelled while the tool was running."""
+
+
+def record_throughput(cost_class, work, seconds):
+    """Adds a successful run, work in the units of minimum_throughput."""
+    if not cost_class or work <= 0 or seconds <= 0:
+        return
+    with _throughput_lock:
+        totals = _throughput.setdefault(cost_class, [0.0, 0.0])
+        totals[0] += work
+        totals[1] += seconds
+
+
+def tool_timeout(cost_class, work):
+    """Seconds a tool may take for work (media seconds or megabytes) of a cost class.
+
+    None when nothing is known of the work, the tool then only stops on stalls.
+    """
+    rate = minimum_throughput.get(cost_class)
+    if not rate or not work:
+        return None
+    with _throughput_lock:
+        done, seconds = _throughput.get(cost_class, (0.0, 0.0))
+    if done and seconds:
+        # A slow machine or NAS gets more time, never less than configured
+        rate = min(rate, done / seconds)
+    return max(minimum_tool_timeout, timeout_factor * work / rate)
+
+
+def input_megabytes(path):
+    try:
+        return os.path.getsize(path) / 1e6
+    except OSError:
+        return None
+
+
+class ToolWatch:
+    """Deadline and stall detection of one tool run.
+
+    The timeout counts from the start of the run and can be set once the work
+    is known (ffmpeg prints the input duration first). The stall timeout only
+    applies to tools calling progressed() as their output advances.
+    """
+
+    def __init__(self, timeout=None, stall_timeout=None):
+        self.started = time.monotonic()
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.last_progress = self.started
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def progressed(self):
+        self.last_progress = time.monotonic()
+
+    def expired(self, command, output=None, stderr=None):
+        """The TimeoutExpired to raise when the run is over its limits, else None."""
+        now = time.monotonic()
+        if self.timeout and now - self.started > self.timeout:
+            return subprocess.TimeoutExpired(command, self.timeout, output, stderr)
+        if self.stall_timeout and now - self.last_progress > self.stall_timeout:
+            return ToolStalled(command, self.stall_timeout, output, stderr)
+        return None
+
+
+def _session_options():
+    # Each tool leads its own process group so its children are stopped with it
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _signal_tree(process, kill):
+    try:
+        if sys.platform == "win32":
+            if kill:
+                subprocess.run(
+                    ["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                    capture_output=True,
+                )
+            else:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def terminate_process_tree(process, exited=None, grace=termination_grace):
+    """Asks a tool and its children to stop, kills them after grace seconds.
+
+    exited is an Event set once the process was waited for, the process is
+    polled otherwise.
+    """
+    _signal_tree(process, kill=False)
+    if exited is not None:
+        stopped = exited.wait(grace)
+    else:
+        try:
+            process.wait(grace)
+            stopped = True
+        except subprocess.TimeoutExpired:
+            stopped = False
+    # Children may outlive their parent, the group is killed either way
+    _signal_tree(process, kill=True)
+    return stopped
+
+
+def cancel_running_tools():
+    """Stops every tool of this process and refuses to start new ones.
+
+    Returns the threads terminating them, done once every tree is killed.
+    """
+    _cancelled.set()
+    with _running_lock:
+        running = list(_running)
+    stoppers = [
+        threading.Thread(
+            target=terminate_process_tree, args=(process, exited), daemon=True
+        )
+        for process, exited in running
+    ]
+    for stopper in stoppers:
+        stopper.start()
+    return stoppers
+
+
+def reset_cancellation():
+    """Lets tools start again, for a new run after a cancelled one."""
+    _cancelled.clear()
+
+
+@contextmanager
+def reporting_progress(callback):
+    """Sends the progress of the tools run by this thread to callback.
+
+    callback(fraction, media_seconds=None) gets the completed fraction of the
+    current file and, for ffmpeg, the media seconds encoded so far.
+    """
+    _reporter.callback = callback
+    try:
+        yield
+    finally:
+        _reporter.callback = None
+
+
+def report_progress(fraction, media_seconds=None):
+    callback = getattr(_reporter, "callback", None)
+    if callback:
+        callback(min(1.0, max(0.0, fraction)), media_seconds)
+
+
+def run_tool(
+    command, timeout=None, on_stdout_line=None, on_stderr_line=None, watch=None
+):
+    """Runs an external tool, streaming its output lines to the given handlers.
+
+    Behaves like subprocess.run(check=True): raises CalledProcessError or
+    TimeoutExpired (ToolStalled when watch saw no progress) carrying the last
+    lines of output, and ToolCancelled when the run was cancelled. The tool and
+    its children are terminated together. The rusage of the tool is recorded in
+    the run metrics.
+    """
+    if _cancelled.is_set():
+        raise ToolCancelled(f"Not starting {command[0]}, the conversion was cancelled")
+    watch = watch or ToolWatch(timeout)
+    start_time = time.perf_counter()
+    rusage = None
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+        bufsize=1,
+        **_session_options(),
+    )
+    exited = threading.Event()
+    running = (process, exited)
+    with _running_lock:
+        _running.add(running)
+    stdout_lines = deque(maxlen=OUTPUT_LINES_KEPT)
+    stderr_lines = deque(maxlen=OUTPUT_LINES_KEPT)
+
+    def read_stderr():
+        for line in process.stderr:
+            stderr_lines.append(line)
+            if on_stderr_line:
+                on_stderr_line(line)
+
+    stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+    stderr_reader.start()
+    expired = []
+
+    def monitor():
+        while not exited.wait(WATCH_INTERVAL):
+            error = watch.expired(command)
+            if error is not None:
+                expired.append(error)
+                terminate_process_tree(process, exited)
+                return
+
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
+    try:
+        for line in process.stdout:
+            stdout_lines.append(line)
+            if on_stdout_line:
+                on_stdout_line(line)
+        if hasattr(os, "wait4"):
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        returncode = process.wait()
+        exited.set()
+        stderr_reader.join()
+    finally:
+        exited.set()
+        with _running_lock:
+            _running.discard(running)
+        if process.poll() is None:
+            terminate_process_tree(process)
+            process.wait()
+        metrics.record_tool(
+            os.path.basename(command[0]), time.perf_counter() - start_time, rusage
+        )
+
+    stdout = "".join(stdout_lines)
+    stderr = "".join(stderr_lines)
+    if _cancelled.is_set() and returncode:
+        raise ToolCancelled(f"{command[0]} was stopped, the conversion was cancelled")
+    if expired:
+        error = expired[0]
+        error.output, error.stderr = stdout, stderr
+        raise error
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+
+def run_ffmpeg(command, timeout=None, cost_class=None):
+    """Runs ffmpeg, reporting progress from its machine-readable -progress output.
+
+    With a cost_class the timeout follows the duration of the input, read from
+    the first lines ffmpeg prints, and the run feeds the measured throughput.
+    ffmpeg is stopped when its output time does not advance for stall_timeout.
+    """
+    command = [command[0], "-progress", "pipe:1", "-nostats"] + list(command[1:])
+    state = {"duration": None, "media_seconds": 0.0}
+    watch = ToolWatch(timeout, stall_timeout)
+
+    def on_stderr_line(line):
+        # The first Duration line is the one of the input
+        if state["duration"] is None:
+            match = _ffmpeg_duration.search(line)
+            if match:
+                hours, minutes, seconds = match.groups()
+                state["duration"] = (
+                    int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+                )
+                if cost_class and timeout is None:
+                    watch.set_timeout(tool_timeout(cost_class, state["duration"]))
+
+    def on_stdout_line(line):
+        key, _, value = line.strip().partition("=")
+        if key in ("out_time_us", "out_time_ms") and value.isdigit():
+            media_seconds = int(value) / 1_000_000
+            if media_seconds > state["media_seconds"]:
+                state["media_seconds"] = media_seconds
+                watch.progressed()
+            if state["duration"]:
+                report_progress(media_seconds / state["duration"], media_seconds)
+
+    result = run_tool(
+        command,
+        on_stdout_line=on_stdout_line,
+        on_stderr_line=on_stderr_line,
+        watch=watch,
+    )
+    record_throughput(
+        cost_class, state["duration"] or 0, time.monotonic() - watch.started
+    )
+    return result
+
+
+def run_ghostscript(command, timeout=None, cost_class=None, input_path=None):
+    """Runs Ghostscript, reporting progress from its Page lines.
+
+    With a cost_class and input_path the timeout follows the size of the input.
+    Ghostscript is stopped when no page starts for stall_timeout.
+    """
+    state = {"pages": None}
+    work = input_megabytes(input_path) if cost_class and input_path else None
+    if timeout is None and work:
+        timeout = tool_timeout(cost_class, work)
+    watch = ToolWatch(timeout, stall_timeout)
+
+    def on_stdout_line(line):
+        match = _gs_page_count.search(line)
+        if match:
+            state["pages"] = int(match.group(1))
+            return
+        match = _gs_page.match(line)
+        if match:
+            watch.progressed()
+            if state["pages"]:
+                report_progress((int(match.group(1)) - 1) / state["pages"])
+
+    result = run_tool(command, on_stdout_line=on_stdout_line, watch=watch)
+    record_throughput(cost_class, work or 0, time.monotonic() - watch.started)
+    return result
@@ -0,0 +1,206 @@
+import os
+import logging
+import threading
+
+from helpers.state import STATE_FOLDER
+from helpers.classifier import classify, is_selected
+
+
+class TreeEntry:
+    __slots__ = ("name", "is_dir", "size", "mtime_ns", "media_class", "children")
+
+    def __init__(self, name, is_dir, size=0, mtime_ns=0, media_class=None):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.media_class = media_class
+        # name -> entry, in scandir order
+        self.children = {} if is_dir else None
+
+    def is_selected(self, selected_media_types):
+        return is_selected(self.media_class, selected_media_types)
+
+
+def _scan_entry(path, name):
+    stat = os.stat(path)
+    is_dir = os.path.isdir(path)
+    entry = TreeEntry(
+        name,
+        is_dir,
+        stat.st_size,
+        stat.st_mtime_ns,
+        None if is_dir else classify(path, name).media_class,
+    )
+    if entry.is_dir and not os.path.islink(path):
+        _scan_children(entry, path)
+    return entry
+
+
+def _scan_children(folder_entry, folder_path):
+    folders = [(folder_entry, folder_path)]
+    while folders:
+        parent, path = folders.pop()
+        with os.scandir(path) as entries:
+            for item in entries:
+                is_dir = item.is_dir()
+                if is_dir and item.name == STATE_FOLDER:
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    # Dangling link, listed like os.walk lists it
+                    stat = item.stat(follow_symlinks=False)
+                entry = TreeEntry(
+                    item.name,
+                    is_dir,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    None if is_dir else classify(item.path, item.name).media_class,
+                )
+                parent.children[item.name] = entry
+                # Links to folders are listed but not followed, as in os.walk
+                if is_dir and not item.is_symlink():
+                    folders.append((entry, item.path))
+
+
+class TreeIndex:
+    """Type, size, mtime and media class of every entry of a tree, scanned once.
+
+    The stages of a conversion walk the index instead of the filesystem and
+    tell it about the entries they rename, create and remove. The state
+    folder is left out. Safe to update from the conversion workers.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self._root_entry = TreeEntry(os.path.basename(self.root), True)
+        _scan_children(self._root_entry, self.root)
+
+    def _parts(self, path):
+        relative_path = os.path.relpath(os.path.abspath(path), self.root)
+        if relative_path == os.curdir:
+            return []
+        if relative_path.startswith(os.pardir):
+            raise ValueError(f"{path} is not in {self.root}")
+        return relative_path.split(os.sep)
+
+    def get(self, path):
+        """The entry of path, None when the index does not hold it."""
+        with self._lock:
+            entry = self._root_entry
+            for part in self._parts(path):
+                if not entry.is_dir or part not in entry.children:
+                    return None
+                entry = entry.children[part]
+            return entry
+
+    def _parent(self, path):
+        parts = self._parts(path)
+        if not parts:
+            raise ValueError("The root of the index has no parent")
+        parent = self.get(os.path.dirname(os.path.abspath(path)))
+        return parent, parts[-1]
+
+    def walk(self, top=None, topdown=True):
+        """Yields (root, dirs, files) like os.walk, from the index.
+
+        Pruning dirs works as with os.walk when walking top-down. The lists
+        are copies, entries can be renamed or removed while walking.
+        """
+        top = os.path.abspath(top) if top else self.root
+        entry = self.get(top)
+        if entry is None or not entry.is_dir:
+            return
+        yield from self._walk(top, entry, topdown)
+
+    def _walk(self, path, entry, topdown):
+        with self._lock:
+            dirs = [name for name, child in entry.children.items() if child.is_dir]
+            files = [
+                name for name, child in entry.children.items() if not child.is_dir
+            ]
+        if topdown:
+            yield path, dirs, files
+        for name in dirs:
+            with self._lock:
+                child = entry.children.get(name)
+            if child is not None and child.is_dir:
+                yield from self._walk(os.path.join(path, name), child, topdown)
+        if not topdown:
+            yield path, dirs, files
+
+    def count(self, folder=None, selected_media_types=None):
+        """Number of files (of the selected media types) and folders under folder."""
+        total_files = 0
+        total_folders = 0
+        for root, dirs, files in self.walk(folder):
+            total_folders += len(dirs)
+            if selected_media_types is None:
+                total_files += len(files)
+                continue
+            entries = self.get(root).children
+            total_files += sum(
+                1
+                for name in files
+                if name in entries and entries[name].is_selected(selected_media_types)
+            )
+        return total_files, total_folders
+
+    def size(self, path):
+        """Bytes of a file, or of all files of a folder, 0 when unknown."""
+        entry = self.get(path)
+        if entry is None:
+            return 0
+        if not entry.is_dir:
+            return entry.size
+        with self._lock:
+            total = 0
+            entries = [entry]
+            while entries:
+                for child in entries.pop().children.values():
+                    if child.is_dir:
+                        entries.append(child)
+                    else:
+                        total += child.size
+            return total
+
+    def rename(self, old_path, new_path):
+        """Moves the entry of old_path, with what it holds, to new_path."""
+        with self._lock:
+            old_parent, old_name = self._parent(old_path)
+            new_parent, new_name = self._parent(new_path)
+            if old_parent is None or old_name not in old_parent.children:
+                return
+            entry = old_parent.children.pop(old_name)
+            entry.name = new_name
+            if new_parent is not None:
+                new_parent.children[new_name] = entry
+
+    def remove(self, path):
+        with self._lock:
+            parent, name = self._parent(path)
+            if parent is not None:
+                parent.children.pop(name, None)
+
+    def refresh(self, path):
+        """Brings the entry of path in line with the filesystem after a change.
+
+        Missing parent folders are added, a path that no longer exists is
+        removed from the index.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if not os.path.lexists(path):
+                self.remove(path)
+                return
+            parent, name = self._parent(path)
+            if parent is None:
+                self.refresh(os.path.dirname(path))
+                return
+            try:
+                parent.children[name] = _scan_entry(path, name)
+            except OSError as e:
+                logging.warning(f"Could not index {path}: {e}")
+                parent.children.pop(name, None)
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import socket
+import random
+import logging
+
+QUEUE_NAME = "queue.json"
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+WORKERS = "workers"
+FINISHED_MARKER = "finished"
+
+# A worker that has not beaten for this long is considered dead, its jobs go back
+# to the queue. It must be well above the heartbeat interval and the clock skew
+# between the NAS and the hosts.
+DEFAULT_LEASE_SECONDS = 120
+# A job that killed this many workers is failed instead of requeued again
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Separates the job id from the worker id in the name of a lease
+_LEASE_SEPARATOR = "@"
+
+
+def default_worker_id():
+    host = socket.gethostname().split(".")[0] or "worker"
+    return f"{host}-{os.getpid()}".replace(_LEASE_SEPARATOR, "_")
+
+
+def _write_json(path, content):
+    # Readers on other hosts must never see a half-written file
+    temp_path = f"{path}.{default_worker_id()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as json_file:
+        json.dump(content, json_file)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+class SharedQueue:
+    """Conversion jobs shared by workers on several hosts through a folder.
+
+    The folder lives on the filesystem all the hosts mount and only relies on
+    atomic renames, which NFS and SMB provide:
+
+        queue.json              the conversion: destination, type, media types
+        pending/<lane>/<id>     jobs waiting for a worker
+        leased/<id>@<worker>    jobs a worker claimed, by renaming them here
+        done/<id>, failed/<id>  finished jobs
+        workers/<worker>        heartbeat of every live worker
+
+    A lease holds while its worker heartbeat is fresh. Heartbeat ages are
+    measured against the modification time of a file the checking worker just
+    wrote, so only the clock of the file server counts.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.meta = _read_json(os.path.join(folder, QUEUE_NAME))
+        self.lease_seconds = self.meta.get("lease_seconds", DEFAULT_LEASE_SECONDS)
+        self.max_attempts = self.meta.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+        self._pending_names = {}
+
+    @staticmethod
+    def exists(folder):
+        return os.path.exists(os.path.join(folder, QUEUE_NAME))
+
+    @classmethod
+    def create(
+        cls,
+        folder,
+        jobs,
+        lease_seconds=DEFAULT_LEASE_SECONDS,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        **meta,
+    ):
+        """Writes a new queue holding jobs (dicts with root, name, lane, cores).
+
+        Workers claim the jobs of a lane in the given order.
+        """
+        if cls.exists(folder):
+            raise ValueError(f"{folder} already holds a conversion queue")
+        for state in (LEASED, DONE, FAILED, WORKERS):
+            os.makedirs(os.path.join(folder, state), exist_ok=True)
+        for index, job in enumerate(jobs):
+            lane_folder = os.path.join(folder, PENDING, job["lane"])
+            os.makedirs(lane_folder, exist_ok=True)
+            job_id = f"{index:08d}"
+            _write_json(
+                os.path.join(lane_folder, job_id),
+                {
+                    "id": job_id,
+                    "root": job["root"],
+                    "name": job["name"],
+                    "lane": job["lane"],
+                    "cores": job["cores"],
+                    "media_type": job.get("media_type"),
+                    "estimated_seconds": job.get("estimated_seconds"),
+                    "attempts": 0,
+                },
+            )
+        # Written last, workers only start on a complete queue
+        _write_json(
+            os.path.join(folder, QUEUE_NAME),
+            dict(
+                meta,
+                jobs=len(jobs),
+                lease_seconds=lease_seconds,
+                max_attempts=max_attempts,
+                created=time.time(),
+            ),
+        )
+        return cls(folder)
+
+    def _path(self, *parts):
+        return os.path.join(self.folder, *parts)
+
+    def lanes(self):
+        try:
+            return sorted(os.listdir(self._path(PENDING)))
+        except FileNotFoundError:
+            return []
+
+    def claim(self, lane, worker_id):
+        """Leases the next pending job of a lane, None when the lane is empty.
+
+        The listing of the lane is kept between calls, listing a large folder on
+        a NAS is slow. A job another worker renamed first is simply skipped.
+        """
+        for _ in range(2):
+            names = self._pending_names.get(lane)
+            if not names:
+                try:
+                    names = sorted(os.listdir(self._path(PENDING, lane)), reverse=True)
+                except FileNotFoundError:
+                    return None
+                names = [name for name in names if not name.endswith(".tmp")]
+                self._pending_names[lane] = names
+            while names:
+                job_id = names.pop()
+                lease_path = self._path(
+                    LEASED, f"{job_id}{_LEASE_SEPARATOR}{worker_id}"
+                )
+                try:
+                    os.rename(self._path(PENDING, lane, job_id), lease_path)
+                except FileNotFoundError:
+                    continue
+                job = _read_json(lease_path)
+                job["lease"] = lease_path
+                return job
+        return None
+
+    def complete(self, job, error=None):
+        """Moves a leased job to done, or failed with its error."""
+        job = dict(job)
+        lease_path = job.pop("lease")
+        job["error"] = error
+        job["finished"] = time.time()
+        target = self._path(FAILED if error else DONE, job["id"])
+        _write_json(target, job)
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            # Reclaimed while this worker was presumed dead, the job runs twice
+            logging.warning(f"Lease of {job['name']} was reclaimed before completion")
+
+    def release(self, job):
+        """Puts a leased job back in the queue untouched, for a worker that stops."""
+        job = dict(job)
+        lease_path = job.pop("lease")
+        os.makedirs(self._path(PENDING, job["lane"]), exist_ok=True)
+        try:
+            _write_json(lease_path, job)
+            os.rename(lease_path, self._path(PENDING, job["lane"], job["id"]))
+        except FileNotFoundError:
+            # Already reclaimed by another worker
+            return
+        self._pending_names.pop(job["lane"], None)
+
+    def heartbeat(self, worker_id, **status):
+        _write_json(
+            self._path(WORKERS, worker_id),
+            dict(status, worker=worker_id, host=socket.gethostname(), pid=os.getpid()),
+        )
+
+    def leave(self, worker_id):
+        for name in (worker_id, f".clock_{worker_id}"):
+            try:
+                os.remove(self._path(WORKERS, name))
+            except FileNotFoundError:
+                pass
+
+    def shared_now(self, worker_id):
+        """Current time of the file server, as the mtime of a freshly written file."""
+        clock_path = self._path(WORKERS, f".clock_{worker_id}")
+        with open(clock_path, "w") as clock_file:
+            clock_file.write(str(time.time()))
+        return os.stat(clock_path).st_mtime
+
+    def _worker_is_alive(self, worker_id, now):
+        try:
+            last_beat = os.stat(self._path(WORKERS, worker_id)).st_mtime
+        except FileNotFoundError:
+            return False
+        return now - last_beat < self.lease_seconds
+
+    def reclaim_expired(self, worker_id, on_reclaim=None):
+        """Puts the jobs of dead workers back in the queue, returns their number.
+
+        on_reclaim(job) runs before a job is requeued, to clean up what the dead
+        worker left behind. Jobs past max_attempts are failed instead.
+        """
+        now = self.shared_now(worker_id)
+        reclaimed = 0
+        for lease_name in os.listdir(self._path(LEASED)):
+            job_id, _, owner = lease_name.partition(_LEASE_SEPARATOR)
+            if lease_name.endswith(".tmp") or not owner:
+                continue
+            if self._worker_is_alive(owner, now):
+                continue
+            # Taking the lease over first means only one of the workers
+            # reclaiming at the same time goes on with the job
+            own_lease = self._path(LEASED, f"{job_id}{_LEASE_SEPARATOR}{worker_id}")
+            try:
+                os.rename(self._path(LEASED, lease_name), own_lease)
+                job = _read_json(own_lease)
+            except FileNotFoundError:
+                continue
+            job["attempts"] = job.get("attempts", 0) + 1
+            if job["attempts"] >= self.max_attempts:
+                job["lease"] = own_lease
+                self.complete(job, f"Worker {owner} stopped while converting it")
+                continue
+            if on_reclaim:
+                on_reclaim(job)
+            _write_json(own_lease, job)
+            os.makedirs(self._path(PENDING, job["lane"]), exist_ok=True)
+            os.rename(own_lease, self._path(PENDING, job["lane"], job_id))
+            self._pending_names.pop(job["lane"], None)
+            reclaimed += 1
+            logging.warning(f"Requeued {job['name']} from dead worker {owner}")
+        for name in os.listdir(self._path(WORKERS)):
+            if not name.startswith(".") and not self._worker_is_alive(name, now):
+                self.leave(name)
+        return reclaimed
+
+    def counts(self):
+        counts = {
+            PENDING: sum(
+                len(os.listdir(self._path(PENDING, lane))) for lane in self.lanes()
+            )
+        }
+        for state in (LEASED, DONE, FAILED):
+            counts[state] = len(os.listdir(self._path(state)))
+        counts["workers"] = len(
+            [
+                name
+                for name in os.listdir(self._path(WORKERS))
+                if not name.startswith(".") and not name.endswith(".tmp")
+            ]
+        )
+        return counts
+
+    def is_drained(self):
+        counts = self.counts()
+        return not counts[PENDING] and not counts[LEASED]
+
+    def mark_finished(self):
+        """True for the single worker that gets to finalize the drained queue."""
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        try:
+            os.close(os.open(self._path(FINISHED_MARKER), flags))
+            return True
+        except FileExistsError:
+            return False
+
+    def poll_interval(self):
+        # Spread the polls of idle workers so they do not list the NAS together
+        return random.uniform(0.5, 1.5) * min(5.0, self.lease_seconds / 10)
@@ -1,19 +1,36 @@
 from rich import print
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
 import os
-from helpers.bagit import create_bag_info, create_bagit_txt
+from helpers.bagit import make_bag
 import bagit
 import csv
 from datetime import datetime
 from helpers.bagit import update_bag_info
+from helpers.state import set_aside_state, STATE_FOLDER
+from helpers.digests import recorded_digests
+from helpers.metrics import metrics, format_stage_stats
 
 
 def apply_bag(destination_folder):
+    metrics.reset()
+    with metrics.stage("apply_bag") as stage_counts:
+        stage_counts["files"] = create_bags(destination_folder)
+    for line in format_stage_stats(metrics.summary()):
+        print(f"[bold cyan]Stage:[/bold cyan] {line}")
+    # The folder holding the bags is not a destination, nothing of the
+    # converter is written next to the bags
+    for folder in metrics.write():
+        print(f"[bold cyan]Metrics:[/bold cyan] {folder}")
+
+
+def create_bags(destination_folder):
+    """Turns every sub folder into a bag, or updates it, and returns their number."""
     print("[bold yellow]Creating BagIt structure...[/bold yellow]")
     items = [
         item
         for item in os.listdir(destination_folder)
-        if os.path.isdir(os.path.join(destination_folder, item)) and item != ".DS_Store"
+        if os.path.isdir(os.path.join(destination_folder, item))
+        and item not in (".DS_Store", STATE_FOLDER)
     ]
     with Progress(
         SpinnerColumn(),
@@ -50,6 +67,8 @@ def apply_bag(destination_folder):
                         # Gather all data file paths relative to item_path
                         relative_file_paths = []
                         for root, dirs, files in os.walk(item_path):
+                            if STATE_FOLDER in dirs:
+                                dirs.remove(STATE_FOLDER)
                             for file in files:
                                 if file == ".DS_Store":
                                     continue
@@ -64,7 +83,9 @@ def apply_bag(destination_folder):
                                 abs_path = os.path.join(root, file)
                                 rel_path = os.path.relpath(abs_path, item_path)
                                 relative_file_paths.append(rel_path)
-                        update_bag_info(item_path, relative_file_paths)
+                        digests = recorded_digests(item_path)
+                        with set_aside_state(item_path):
+                            update_bag_info(item_path, relative_file_paths, digests)
                     else:
                         print(
                             f"[bold green]Bag at {item_path} is valid. Skipping...[/bold green]"
@@ -82,16 +103,16 @@ def apply_bag(destination_folder):
                 )
                 continue
 
-            bagit.make_bag(item_path, checksums=["sha256"])
-            create_bagit_txt(item_path)
-            create_bag_info(item_path)
-
-            bag = bagit.Bag(item_path)
-            bag.save(manifests=True)
+            # Digests recorded while cloning and converting, read before the
+            # state folder is set aside
+            digests = recorded_digests(item_path)
+            with set_aside_state(item_path):
+                make_bag(item_path, digests)
 
             progress.advance(task)
 
     print("[bold green]:heavy_check_mark: BagIt structure created![/bold green]")
+    return len(items)
 
 
 def check_bag_integrity(destination_folder):
@@ -99,7 +120,8 @@ def check_bag_integrity(destination_folder):
     items = [
         item
         for item in os.listdir(destination_folder)
-        if os.path.isdir(os.path.join(destination_folder, item)) and item != ".DS_Store"
+        if os.path.isdir(os.path.join(destination_folder, item))
+        and item not in (".DS_Store", STATE_FOLDER)
     ]
 
     all_valid = True  # Track overall validity
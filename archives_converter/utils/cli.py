@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+from rich import print
+
+from utils.convert import convert_folder, convert_folders, resume_conversion
+from utils.plan import plan_conversion, execute_plan, convert_direct
+from utils.clone import clone_folder
+from utils.rename import rename_files_and_folders, undo_renames
+from utils.apply_bag import apply_bag, check_bag_integrity
+from utils.worker import submit_folder, run_worker
+from helpers.metrics import metrics
+from helpers.conversion_cache import configure_conversion_cache, parse_size
+from helpers.classifier import configure_sniffing
+
+MEDIA_TYPES = ["audio", "video", "image", "text", "dvd"]
+DEFAULT_CONVERT_MEDIA_TYPES = ["audio", "video", "image", "text"]
+CONVERT_TYPES = ["AIP", "DIP"]
+
+
+def parse_media_types(value):
+    media_types = [media_type.strip() for media_type in value.split(",")]
+    unknown = [media_type for media_type in media_types if media_type not in MEDIA_TYPES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown media type(s) {', '.join(unknown)}, "
+            f"choose from {', '.join(MEDIA_TYPES)}"
+        )
+    return media_types
+
+
+def existing_folder(value):
+    if not os.path.isdir(value):
+        raise argparse.ArgumentTypeError(f"{value} is not a folder")
+    return os.path.abspath(value)
+
+
+def load_job_file(path):
+    """Reads a JSON job file queuing several SIP folders.
+
+    {
+        "cores": 32,
+        "jobs": [
+            {"source": "/nas/SIP_a", "type": "AIP", "media_types": ["audio", "video"]},
+            {"source": "/nas/SIP_b", "type": "DIP", "destination": "/nas/out/DIP_b"}
+        ]
+    }
+
+    A plain list of jobs is accepted as well. Relative paths are resolved against
+    the folder of the job file.
+    """
+    with open(path, encoding="utf-8") as job_file:
+        content = json.load(job_file)
+    if isinstance(content, list):
+        content = {"jobs": content}
+
+    base_folder = os.path.dirname(os.path.abspath(path))
+    folder_jobs = []
+    for index, job in enumerate(content.get("jobs", []), start=1):
+        if "source" not in job:
+            raise ValueError(f"Job {index} of {path} has no source folder")
+        source_folder = os.path.join(base_folder, job["source"])
+        if not os.path.isdir(source_folder):
+            raise ValueError(f"Job {index}: {source_folder} is not a folder")
+        convert_type = job.get("type", "AIP")
+        if convert_type not in CONVERT_TYPES:
+            raise ValueError(f"Job {index}: invalid convert type {convert_type}")
+        media_types = job.get("media_types", DEFAULT_CONVERT_MEDIA_TYPES)
+        unknown = [
+            media_type for media_type in media_types if media_type not in MEDIA_TYPES
+        ]
+        if unknown:
+            raise ValueError(f"Job {index}: unknown media types {', '.join(unknown)}")
+        destination_folder = job.get("destination")
+        if destination_folder:
+            destination_folder = os.path.join(base_folder, destination_folder)
+        folder_jobs.append(
+            {
+                "source_folder": os.path.normpath(source_folder),
+                "convert_type": convert_type,
+                "selected_media_types": media_types,
+                "destination_folder": destination_folder,
+            }
+        )
+    return folder_jobs, content.get("cores")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="archives_converter",
+        description="Convert, clone, rename and bag archive folders. "
+        "Run without arguments for the interactive menu.",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        help="also write the run metrics (metrics.json, metrics.prom) to this folder",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="reuse the outputs of identical inputs converted before, kept in this folder",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=parse_size,
+        help="size of the conversion cache, such as 200G (default: 500G)",
+    )
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="classify files by their first bytes as well, not only by extension",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_cores(command_parser):
+        command_parser.add_argument(
+            "--cores",
+            type=int,
+            help="CPU cores the converters may use at once (default: all)",
+        )
+
+    convert = subparsers.add_parser(
+        "convert", help="clone/update and convert a folder"
+    )
+    convert.add_argument("source", type=existing_folder)
+    convert.add_argument("--type", choices=CONVERT_TYPES, default="AIP")
+    convert.add_argument(
+        "--media",
+        type=parse_media_types,
+        default=DEFAULT_CONVERT_MEDIA_TYPES,
+        help="comma separated media types (default: audio,video,image,text)",
+    )
+    convert.add_argument("--destination", help="destination folder")
+    convert.add_argument(
+        "--direct",
+        action="store_true",
+        help="convert from the source folder instead of a clone of it",
+    )
+    add_cores(convert)
+
+    plan = subparsers.add_parser(
+        "plan", help="compute the conversion plan without copying anything"
+    )
+    plan.add_argument("source", type=existing_folder)
+    plan.add_argument("--type", choices=CONVERT_TYPES, default="AIP")
+    plan.add_argument(
+        "--media", type=parse_media_types, default=DEFAULT_CONVERT_MEDIA_TYPES
+    )
+    plan.add_argument("--destination", help="destination folder")
+    plan.add_argument(
+        "--output",
+        help="plan file to write (.json or .csv, default: next to the source folder)",
+    )
+    add_cores(plan)
+
+    execute = subparsers.add_parser(
+        "execute", help="run a conversion from a plan file"
+    )
+    execute.add_argument("plan_file")
+    execute.add_argument(
+        "--direct",
+        action="store_true",
+        help="convert from the source folder instead of a clone of it",
+    )
+    add_cores(execute)
+
+    resume = subparsers.add_parser("resume", help="resume an interrupted conversion")
+    resume.add_argument("destination", type=existing_folder)
+    add_cores(resume)
+
+    jobs = subparsers.add_parser(
+        "jobs", help="convert all SIP folders queued in a JSON job file"
+    )
+    jobs.add_argument("job_file")
+    add_cores(jobs)
+
+    submit = subparsers.add_parser(
+        "submit", help="clone a folder and queue its conversion for workers"
+    )
+    submit.add_argument("source", type=existing_folder)
+    submit.add_argument("--type", choices=CONVERT_TYPES, default="AIP")
+    submit.add_argument(
+        "--media", type=parse_media_types, default=DEFAULT_CONVERT_MEDIA_TYPES
+    )
+    submit.add_argument("--destination", help="destination folder")
+    submit.add_argument(
+        "--queue",
+        help="shared queue folder (default: the state folder of the destination)",
+    )
+    submit.add_argument(
+        "--lease-seconds",
+        type=int,
+        help="seconds without heartbeat before the jobs of a worker are reclaimed",
+    )
+
+    worker = subparsers.add_parser(
+        "worker", help="convert files from a shared queue until it is empty"
+    )
+    worker.add_argument("queue", type=existing_folder)
+    worker.add_argument("--worker-id", help="default: host name and process id")
+    add_cores(worker)
+
+    clone = subparsers.add_parser("clone", help="clone a folder")
+    clone.add_argument("source", type=existing_folder)
+    clone.add_argument("--media", type=parse_media_types, default=MEDIA_TYPES)
+    clone.add_argument("--destination", help="destination folder")
+
+    rename = subparsers.add_parser("rename", help="rename a folder to snake_case")
+    rename.add_argument("folder", type=existing_folder)
+    rename.add_argument("--media", type=parse_media_types, default=MEDIA_TYPES)
+    rename.add_argument(
+        "--undo",
+        action="store_true",
+        help="give back the names changed by the last rename of the folder",
+    )
+
+    bag = subparsers.add_parser("bag", help="apply the BagIt format to sub folders")
+    bag.add_argument("folder", type=existing_folder)
+
+    check = subparsers.add_parser("check", help="check the integrity of bags")
+    check.add_argument("folder", type=existing_folder)
+
+    return parser
+
+
+def run_cli(argv):
+    """Runs one non-interactive command and returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    metrics.output_folder = args.metrics_dir
+    if args.cache_dir:
+        configure_conversion_cache(args.cache_dir, args.cache_size)
+    if args.sniff:
+        configure_sniffing()
+
+    try:
+        if args.command == "convert" and args.direct:
+            convert_direct(
+                args.source, args.type, args.media, args.destination, args.cores
+            )
+        elif args.command == "convert":
+            convert_folder(
+                args.source, args.type, args.media, args.destination, args.cores
+            )
+        elif args.command == "plan":
+            plan_conversion(
+                args.source,
+                args.type,
+                args.media,
+                args.cores,
+                args.destination,
+                args.output,
+            )
+        elif args.command == "execute":
+            execute_plan(args.plan_file, args.cores, args.direct)
+        elif args.command == "resume":
+            if not resume_conversion(args.destination, args.cores):
+                return 1
+        elif args.command == "jobs":
+            folder_jobs, cores = load_job_file(args.job_file)
+            convert_folders(folder_jobs, args.cores or cores)
+        elif args.command == "submit":
+            submit_folder(
+                args.source,
+                args.type,
+                args.media,
+                args.destination,
+                args.queue,
+                args.lease_seconds,
+            )
+        elif args.command == "worker":
+            if not run_worker(args.queue, args.cores, args.worker_id):
+                return 1
+        elif args.command == "clone":
+            clone_folder(args.source, "clone", args.media, args.destination)
+        elif args.command == "rename":
+            if args.undo:
+                undo_renames(args.folder)
+            else:
+                rename_files_and_folders(args.folder, args.media)
+        elif args.command == "bag":
+            apply_bag(args.folder)
+        elif args.command == "check":
+            if not check_bag_integrity(args.folder):
+                return 1
+    except (ValueError, OSError) as e:
+        print(f"[bold red]An error occurred: {e}[/bold red]")
+        return 2
+    except KeyboardInterrupt:
+        # Tools were stopped and their partial outputs removed, resume goes on
+        print("[bold yellow]Cancelled.[/bold yellow]")
+        return 130
+    return 0
@@ -1,11 +1,17 @@
 import os
+import time
 from helpers.folders import copy_folder_with_progress
 from rich import print
-import shutil
-from helpers.to_snake_case import to_snake_case
+from helpers.clone_engine import copy_files, format_clone_stats
+from helpers.event_log import EventLog
+from helpers.state import state_path
+from helpers.clone_index import CloneIndex, payload_root, scan_source, diff_source
+from helpers.digests import DigestStore
+from helpers.to_snake_case import to_snake_case, snake_case_names
 from helpers.folders import should_copy_file
 from helpers.name_identifier import predict_name_based_on_extension
 from config.formats import text_files_to_ignore
+from config.resources import hash_while_copying
 
 
 def clone_folder(
@@ -15,59 +21,303 @@ def clone_folder(
 
     # If no destination folder is provided, determine it based on clone_type
     if destination_folder is None:
-        base_name = os.path.basename(source_folder)
+        destination_folder = default_destination_folder(source_folder, clone_type)
 
-        if base_name.startswith("SIP_"):
-            base_name = base_name[4:]
-
-        if clone_type == "AIP":
-            destination_folder = os.path.join(
-                os.path.dirname(source_folder), f"AIP_{base_name}"
+    # If destination exists, only clone changes; otherwise, copy the whole folder
+    if os.path.exists(destination_folder):
+        event_log = clone_event_log(destination_folder)
+        digests = clone_digest_store(destination_folder)
+        if CloneIndex.exists(destination_folder):
+            stats = cloning_indexed_changes(
+                source_folder,
+                destination_folder,
+                selected_media_types,
+                clone_type,
+                event_log,
+                digests,
             )
-        elif clone_type == "DIP":
-            destination_folder = os.path.join(
-                os.path.dirname(source_folder), f"DIP_{base_name}"
+        else:
+            stats = cloning_changes_to_folder(
+                source_folder,
+                destination_folder,
+                selected_media_types,
+                clone_type,
+                event_log,
+                digests,
             )
-        elif clone_type == "clone":
-            destination_folder = os.path.join(
-                os.path.dirname(source_folder), f"CLONE_{base_name}"
+            # Cloned before the index existed, the next updates use it
+            index_clone(
+                source_folder,
+                destination_folder,
+                selected_media_types,
+                clone_type,
+                stats["failed_files"],
             )
-        else:
-            raise ValueError(f"Invalid clone type: {clone_type}")
-
-    # If destination exists, only clone changes; otherwise, copy the whole folder
-    if os.path.exists(destination_folder):
-        cloning_changes_to_folder(
-            source_folder, destination_folder, selected_media_types, clone_type
-        )
     else:
         print("[bold yellow]Cloning source folder...[/bold yellow]")
-        copy_folder_with_progress(
-            source_folder, destination_folder, selected_media_types
+        os.makedirs(destination_folder)
+        event_log = clone_event_log(destination_folder)
+        digests = clone_digest_store(destination_folder)
+        # Copied to their snake_case names, the renaming has nothing left to do
+        stats = copy_folder_with_progress(
+            source_folder,
+            destination_folder,
+            selected_media_types,
+            event_log=event_log,
+            digests=digests,
+            snake_case=True,
+        )
+        index_clone(
+            source_folder,
+            destination_folder,
+            selected_media_types,
+            clone_type,
+            stats["failed_files"],
+            stats["clones"],
         )
         print("[bold green]Cloned source folder[/bold green]")
+    event_log.close()
+    if digests is not None:
+        digests.close()
+    # The copy method of every file is in the clone events
+    print(f"[bold cyan]Clone:[/bold cyan] {format_clone_stats(stats)}")
 
     return destination_folder
 
 
+def clone_event_log(destination_folder):
+    timestamp = time.strftime("%Y%m%d-%H%M")
+    return EventLog(state_path(destination_folder, f"clone_{timestamp}.jsonl"))
+
+
+def clone_digest_store(destination_folder):
+    """Where copies record their digests for the bag, None when they do not hash."""
+    return DigestStore(destination_folder) if hash_while_copying else None
+
+
+def predicted_output(clone_path, clone_type):
+    return predict_name_based_on_extension(clone_path, clone_type)
+
+
+def index_clone(
+    source_folder,
+    destination_folder,
+    selected_media_types,
+    clone_type,
+    failed_files,
+    clones=None,
+):
+    """Records the files of the source in the clone index of the destination.
+
+    clones maps source files to their copies, files missing from it were
+    cloned to the snake_case of their path.
+    """
+    source_root = payload_root(source_folder)
+    destination_root = payload_root(destination_folder)
+    clones = clones or {}
+    failed = set(failed_files)
+    rows = []
+    for relative_path, (size, mtime_ns) in scan_source(
+        source_folder, selected_media_types
+    ).items():
+        source_file = os.path.join(source_root, relative_path)
+        if source_file in failed:
+            continue
+        if source_file in clones:
+            clone_path = os.path.relpath(clones[source_file], destination_root)
+        else:
+            clone_path = to_snake_case(relative_path)
+        rows.append(
+            (
+                relative_path,
+                size,
+                mtime_ns,
+                predicted_output(clone_path, clone_type),
+                clone_path,
+            )
+        )
+    index = CloneIndex(destination_folder)
+    index.record(rows)
+    index.close()
+
+
+def clone_path_of(relative_path, entry):
+    return entry[3] or to_snake_case(relative_path)
+
+
+def assign_clone_paths(relative_paths, indexed, destination_root):
+    """Clone paths of source files new to the index, under the renaming rules.
+
+    Folders cloned before keep their clone. In every folder the names of the
+    files there and of the clones indexed there are taken, new names are
+    numbered around them as the renaming would.
+    """
+    # Source folder -> its clone, relative paths, "" for the root
+    folder_clones = {"": ""}
+    # Clone folder -> names taken in it
+    taken = {}
+    for relative_path, entry in indexed.items():
+        clone_path = clone_path_of(relative_path, entry)
+        taken.setdefault(os.path.dirname(clone_path), set()).add(
+            os.path.basename(clone_path)
+        )
+        source_parts = os.path.dirname(relative_path).split(os.sep)
+        clone_parts = os.path.dirname(clone_path).split(os.sep)
+        if len(source_parts) == len(clone_parts):
+            for depth in range(1, len(source_parts) + 1):
+                folder_clones.setdefault(
+                    os.sep.join(source_parts[:depth]), os.sep.join(clone_parts[:depth])
+                )
+
+    def names_taken(clone_folder):
+        if clone_folder not in taken:
+            taken[clone_folder] = set()
+        folder = os.path.join(destination_root, clone_folder)
+        if os.path.isdir(folder):
+            taken[clone_folder].update(os.listdir(folder))
+        return taken[clone_folder]
+
+    def clone_of_folder(source_folder):
+        if source_folder not in folder_clones:
+            parent, name = os.path.split(source_folder)
+            clone_parent = clone_of_folder(parent)
+            existing = os.path.join(clone_parent, to_snake_case(name))
+            if os.path.isdir(os.path.join(destination_root, existing)):
+                # Same folder, cloned empty or before the index had clones
+                folder_clones[source_folder] = existing
+            else:
+                renames = snake_case_names([], [name], names_taken(clone_parent))
+                new_name = renames.get(name, name)
+                names_taken(clone_parent).add(new_name)
+                folder_clones[source_folder] = os.path.join(clone_parent, new_name)
+        return folder_clones[source_folder]
+
+    by_folder = {}
+    for relative_path in relative_paths:
+        folder, name = os.path.split(relative_path)
+        by_folder.setdefault(folder, []).append(name)
+    clone_paths = {}
+    for folder, names in sorted(by_folder.items()):
+        clone_folder = clone_of_folder(folder)
+        new_names = snake_case_names(names, [], names_taken(clone_folder))
+        for name in names:
+            new_name = new_names.get(name, name)
+            names_taken(clone_folder).add(new_name)
+            clone_paths[os.path.join(folder, name)] = os.path.join(
+                clone_folder, new_name
+            )
+    return clone_paths
+
+
+def cloning_indexed_changes(
+    source_folder,
+    destination_folder,
+    selected_media_types,
+    clone_type,
+    event_log=None,
+    digests=None,
+):
+    """Clones the source files added or changed since the destination was cloned.
+
+    One scan of the source is diffed against the clone index, the destination
+    is not looked at for the files that did not change.
+    """
+    print("[bold yellow]Cloning changes to folder...[/bold yellow]")
+    index = CloneIndex(destination_folder)
+    indexed = index.entries()
+    scanned = scan_source(source_folder, selected_media_types)
+    added, changed, removed = diff_source(scanned, indexed)
+    print(
+        f"[bold cyan]Source changes:[/bold cyan] {len(added)} added, "
+        f"{len(changed)} changed, {len(removed)} removed, "
+        f"{len(scanned) - len(added) - len(changed)} unchanged"
+    )
+
+    source_root = payload_root(source_folder)
+    # Files of a bagged destination live in its data folder
+    destination_root = payload_root(destination_folder)
+    # Changed files are cloned where they were, added ones get new names
+    clone_paths = {
+        relative_path: clone_path_of(relative_path, indexed[relative_path])
+        for relative_path in changed
+    }
+    clone_paths.update(assign_clone_paths(added, indexed, destination_root))
+    for relative_path in changed:
+        # The clone and the output of the previous content are outdated
+        stale_paths = {clone_paths[relative_path], indexed[relative_path][2]}
+        for stale_path in filter(None, stale_paths):
+            stale_file = os.path.join(destination_root, stale_path)
+            if os.path.isfile(stale_file):
+                os.remove(stale_file)
+                print(
+                    f"[bold salmon1]Source changed, replacing:[/bold salmon1] {stale_path}"
+                )
+    for relative_path in removed:
+        print(f"[bold orange]Removed from source, kept: {relative_path}[/bold orange]")
+
+    pairs = [
+        (
+            os.path.join(source_root, relative_path),
+            os.path.join(destination_root, clone_paths[relative_path]),
+        )
+        for relative_path in added + changed
+    ]
+    stats = copy_files(
+        pairs,
+        event_log=event_log,
+        description="Copying changes...",
+        digests=digests,
+    )
+    failed = set(stats["failed_files"])
+    index.record(
+        (
+            relative_path,
+            *scanned[relative_path],
+            predicted_output(clone_paths[relative_path], clone_type),
+            clone_paths[relative_path],
+        )
+        for relative_path in added + changed
+        if os.path.join(source_root, relative_path) not in failed
+    )
+    index.close()
+    return stats
+
+
+def default_destination_folder(source_folder, clone_type):
+    base_name = os.path.basename(source_folder)
+
+    if base_name.startswith("SIP_"):
+        base_name = base_name[4:]
+
+    if clone_type == "AIP":
+        return os.path.join(os.path.dirname(source_folder), f"AIP_{base_name}")
+    elif clone_type == "DIP":
+        return os.path.join(os.path.dirname(source_folder), f"DIP_{base_name}")
+    elif clone_type == "clone":
+        return os.path.join(os.path.dirname(source_folder), f"CLONE_{base_name}")
+    else:
+        raise ValueError(f"Invalid clone type: {clone_type}")
+
+
 def cloning_changes_to_folder(
-    source_folder, destination_folder, selected_media_types, clone_type
+    source_folder,
+    destination_folder,
+    selected_media_types,
+    clone_type,
+    event_log=None,
+    digests=None,
 ):
     print("[bold yellow]Cloning changes to folder...[/bold yellow]")
+    # destination -> source of the files to copy, copied together at the end
+    pending = {}
     destination_files = False  # Flag to check if destination has BagIt 'data' files
 
     bagit_data_dir = None  # Will hold path to BagIt data dir in source if found
 
-    # --- Check if destination is a BagIt folder by looking for 'bagit.txt' ---
-    for root, dirs, files in os.walk(destination_folder):
-        for file in files:
-            if file == "bagit.txt":
-                data_dir = os.path.join(root, "data")
-                if os.path.exists(data_dir):
-                    # If 'data' dir exists, set flag to True
-                    for data_root, data_dirs, data_files in os.walk(data_dir):
-                        for data_file in data_files:
-                            destination_files = True
+    # --- Check if destination is a BagIt folder holding files in 'data' ---
+    if payload_root(destination_folder) != destination_folder:
+        with os.scandir(os.path.join(destination_folder, "data")) as entries:
+            destination_files = any(True for _ in entries)
 
     # --- Check if source is a BagIt folder by looking for 'bagit.txt' ---
     for root, dirs, files in os.walk(source_folder):
@@ -109,13 +359,11 @@ def cloning_changes_to_folder(
                 dst_file = os.path.join(dst_dir, os.path.basename(relative_path))
 
                 # Only copy if file does not already exist in destination (with extension prediction)
-                if not os.path.exists(
+                if dst_file not in pending and not os.path.exists(
                     predict_name_based_on_extension(dst_file, clone_type)
                 ):
-                    if should_copy_file(data_file, selected_media_types):
-                        # Ensure destination directory exists
-                        os.makedirs(os.path.dirname(dst_dir), exist_ok=True)
-                        shutil.copy2(src_file, dst_file)  # Copy file with metadata
+                    if should_copy_file(data_file, selected_media_types, src_file):
+                        pending[dst_file] = src_file
                 else:
                     print(
                         f"[bold salmon1]File already exists in data: {relative_path}[/bold salmon1]"
@@ -156,14 +404,20 @@ def cloning_changes_to_folder(
             dst_file = os.path.join(dst_dir, os.path.basename(relative_path))
 
             # Only copy if file does not already exist in destination (with extension prediction)
-            if not os.path.exists(
+            if dst_file not in pending and not os.path.exists(
                 predict_name_based_on_extension(dst_file, clone_type)
             ):
-                if should_copy_file(file, selected_media_types):
-                    # Ensure destination directory exists
-                    os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-                    shutil.copy2(src_file, dst_file)  # Copy file with metadata
+                if should_copy_file(file, selected_media_types, src_file):
+                    pending[dst_file] = src_file
             else:
                 print(
                     f"[bold orange]File already exists: {relative_path}[/bold orange]"
                 )
+
+    # Destination folders are created by the copy
+    return copy_files(
+        [(src_file, dst_file) for dst_file, src_file in pending.items()],
+        event_log=event_log,
+        description="Copying changes...",
+        digests=digests,
+    )
@@ -1,41 +1,55 @@
 import os
-import concurrent.futures
-import csv
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
 from rich.console import Console
 from rich import print
 
-from helpers.converters.mkv import convert_dvd_to_mkv, convert_dvd_to_mp4
-from helpers.converters.images import convert_tiff, convert_jpg
-from helpers.converters.audio import convert_wav, convert_mp3
-from helpers.converters.videos import convert_ffv1, convert_mp4
-from helpers.converters.text import convert_pdfa
+from helpers.converters.registry import find_converter, run_converter
+from helpers.converters.image_pool import ImageEngine, batch_image_jobs
 from helpers.delete_empty_folders import delete_empty_folders
-from helpers.folders import count_files_and_folders
+from helpers.tree_index import TreeIndex
+from helpers.scheduler import collect_jobs, run_jobs, format_scheduler_stats
+from helpers.estimates import estimate_jobs
+from helpers.journal import ConversionJournal, RUNNING, DONE, FAILED
+from helpers.atomic_output import remove_stale_outputs
+from helpers.converters.errors import ConversionError
+from helpers.tool_runner import ToolCancelled
+from helpers.event_log import EventLog, SKIPPED, write_error_report
+from helpers.conversion_progress import ConversionProgress, input_size
+from helpers.metrics import metrics, format_stage_stats
+from helpers.conversion_cache import (
+    get_conversion_cache,
+    stats_since,
+    format_cache_stats,
+)
+from helpers.state import state_path
 from utils.clone import clone_folder
 from utils.rename import rename_files_and_folders
-from config.formats import text_files_to_ignore
 from config.formats import converted_suffixes
+from config.resources import (
+    job_cores,
+    converter_lanes,
+    default_core_budget,
+    image_batch_size,
+)
 import time
 
 console = Console()
 
 
-def initialize_error_log(destination_folder):
-    timestamp = time.strftime("%Y%m%d-%H%M")
-    error_log_path = os.path.join(
-        destination_folder, f"conversion_errors_{timestamp}.csv"
+def log_error(event_log, file_path, error, converter=None, duration=None):
+    exit_code = stderr = None
+    if isinstance(error, ConversionError):
+        exit_code, stderr = error.exit_code, error.stderr
+    event_log.emit(
+        file_path,
+        "convert",
+        FAILED,
+        converter,
+        duration,
+        exit_code=exit_code,
+        stderr=stderr,
+        error=str(error),
     )
-    with open(error_log_path, mode="w", newline="") as error_file:
-        writer = csv.writer(error_file)
-        writer.writerow(["File", "Error"])
-    return error_log_path
-
-
-def log_error(error_log_path, file_path, error_message):
-    with open(error_log_path, mode="a", newline="") as error_file:
-        writer = csv.writer(error_file)
-        writer.writerow([file_path, error_message])
 
 
 def process_file(
@@ -43,11 +57,14 @@ def process_file(
     destination_folder,
     file,
     root,
-    progress,
-    task,
+    tracker,
     selected_media_types,
-    error_log_path,
+    event_log,
+    threads=0,
+    tree=None,
+    output_path=None,
 ):
+    """Converts one file, in place or from the source folder to output_path."""
     if file == ".DS_Store":
         return
 
@@ -64,142 +81,537 @@ def process_file(
         print(
             f"[bold yellow]Skipping already converted file:[/bold yellow] [link=file://{parent_folder}]{file_path}[/link]"
         )
+        event_log.emit(file_path, "convert", SKIPPED)
         return
 
-    progress.update(task, current_file=f"Converting {file}")
+    converter = find_converter(file, selected_media_types, convert_type, file_path)
+    if converter is None:
+        return
 
-    conversion_performed = False
+    tracker.set_current(f"Converting {file}")
+
+    input_bytes = input_size(file_path)
+    start_time = time.perf_counter()
+    cpu_time = time.thread_time()
+    converted = error = None
     try:
-        if "image" in selected_media_types:
-            if convert_type == "AIP":
-                conversion_performed = (
-                    convert_tiff([file], root) or conversion_performed
-                )
-            elif convert_type == "DIP":
-                conversion_performed = convert_jpg([file], root) or conversion_performed
-        if "audio" in selected_media_types:
-            if convert_type == "AIP":
-                conversion_performed = convert_wav([file], root) or conversion_performed
-            elif convert_type == "DIP":
-                conversion_performed = convert_mp3([file], root) or conversion_performed
-        if "video" in selected_media_types:
-            if convert_type == "AIP":
-                conversion_performed = (
-                    convert_ffv1([file], root) or conversion_performed
-                )
-            elif convert_type == "DIP":
-                conversion_performed = convert_mp4([file], root) or conversion_performed
-        if "text" in selected_media_types and file.lower() not in text_files_to_ignore:
-            if convert_type == "AIP":
-                conversion_performed = (
-                    convert_pdfa([file], root) or conversion_performed
-                )
-            elif convert_type == "DIP":
-                conversion_performed = (
-                    convert_pdfa([file], root) or conversion_performed
-                )
-        if "dvd" in selected_media_types and file == "VIDEO_TS":
-            video_ts_folder = os.path.join(root, "VIDEO_TS")
-            progress.update(task, current_file="VIDEO_TS")
-            if convert_type == "AIP":
-                convert_dvd_to_mkv([root], root)
-            elif convert_type == "DIP":
-                convert_dvd_to_mp4([root], root)
-            print(f"[bold green]Converted VIDEO_TS:[/bold green] {root}")
-            video_ts_files = len(
-                [f for f in os.listdir(video_ts_folder) if f != ".DS_Store"]
-            )
-            progress.update(
-                task, advance=video_ts_files, current_file=f"Completed VIDEO_TS: {root}"
+        with tracker.tracking(file_path), metrics.converter(converter["name"]):
+            converted = run_converter(
+                converter, file_path, threads=threads, output_path=output_path
             )
-            return
+    except ToolCancelled:
+        # Not a failure, the journal keeps the file to convert on resume
+        raise
+    except Exception as e:
+        error = e
+    duration = time.perf_counter() - start_time
+    if tree:
+        if converter["output_extension"] is None:
+            # Folder converters write their outputs next to the folder
+            tree.refresh(parent_folder)
+        else:
+            update_tree(tree, file_path, converted)
+    metrics.record_conversion(
+        converter["name"],
+        duration,
+        time.thread_time() - cpu_time,
+        input_bytes,
+        os.path.getsize(converted) if isinstance(converted, str) else 0,
+        failed=error is not None
+        or (not converted and converter["output_extension"] is not None),
+    )
+
+    if error is not None:
+        log_error(event_log, file_path, error, converter["name"], duration)
+        print(f"Exception caught: {error}")
+        return str(error)
 
-        if conversion_performed:
+    if converter["output_extension"] is None:
+        # Folder converters (VIDEO_TS) remove the folder once converted
+        event_log.emit(file_path, "convert", DONE, converter["name"], duration)
+        print(f"[bold green]Converted {file}:[/bold green] {root}")
+        tracker.set_current(f"Completed {file}: {root}")
+    elif converted:
+        event_log.emit(file_path, "convert", DONE, converter["name"], duration)
+        print(
+            f"[bold green]:heavy_check_mark: Converted file:[/bold green] [link=file://{parent_folder}]{file_path}[/link]"
+        )
+        tracker.set_current(f"Completed [link=file://{parent_folder}]{file}[/link]")
+    else:
+        log_error(
+            event_log, file_path, "File was not converted", converter["name"], duration
+        )
+
+
+def update_tree(tree, file_path, output_path=None):
+    """Tells the tree index about a converted input and its output."""
+    tree.refresh(file_path)
+    if isinstance(output_path, str):
+        tree.refresh(output_path)
+
+
+def process_image_batch(
+    engine,
+    job,
+    convert_type,
+    selected_media_types,
+    tracker,
+    event_log,
+    journal=None,
+    tree=None,
+):
+    """Converts an image batch on the engine, returns the error of every path."""
+    tracker.set_current(f"Converting {job['name']}")
+    for file_path in job["paths"]:
+        tracker.start(file_path)
+    if journal:
+        journal.mark(job["paths"], RUNNING)
+    results = engine.convert_batch(
+        job["paths"], convert_type, selected_media_types, job.get("outputs")
+    )
+    outputs = dict(zip(job["paths"], job.get("outputs") or []))
+    errors = {}
+    for result in results:
+        file_path = result["path"]
+        error = result["error"]
+        if not error and result["converter"] and not result["converted"]:
+            error = "File was not converted"
+        errors[file_path] = error
+        if tree:
+            update_tree(tree, file_path, result.get("output_path"))
+        if result["converter"]:
+            metrics.record_conversion(
+                result["converter"],
+                result["duration"],
+                result["cpu_time"],
+                result["input_bytes"],
+                result.get("output_bytes", 0),
+                failed=bool(error),
+            )
+        parent_folder = os.path.dirname(file_path)
+        tracker.complete(file_path)
+        if journal:
+            record_job_state(
+                journal, file_path, "pillow", error, outputs.get(file_path)
+            )
+        if error:
+            event_log.emit(
+                file_path,
+                "convert",
+                FAILED,
+                result["converter"],
+                result["duration"],
+                exit_code=result.get("exit_code"),
+                stderr=result.get("stderr"),
+                error=error,
+            )
+            print(f"Exception caught: {error}")
+        elif result["converted"]:
+            event_log.emit(
+                file_path, "convert", DONE, result["converter"], result["duration"]
+            )
             print(
                 f"[bold green]:heavy_check_mark: Converted file:[/bold green] [link=file://{parent_folder}]{file_path}[/link]"
             )
-            progress.update(
-                task,
-                advance=1,
-                current_file=f"Completed [link=file://{parent_folder}]{file}[/link]",
+            tracker.set_current(
+                f"Completed [link=file://{parent_folder}]{os.path.basename(file_path)}[/link]"
             )
-    except Exception as e:
-        error_message = str(e)
-        log_error(error_log_path, file_path, error_message)
-        print(f"Exception caught: {error_message}")
+    return errors
 
 
-def convert_files(destination_folder, convert_type, selected_media_types):
-    print("[bold cyan]Starting conversion[/bold cyan] :gear:")
+def job_error(file_path, lane, error, output_path=None):
+    # Converters only remove their input once the output is in place, so a
+    # convertible input that is still there was not converted. Inputs read
+    # from the source stay, their output must be there instead.
+    if not error and lane != "other" and os.path.basename(file_path) != "VIDEO_TS":
+        if output_path is not None:
+            if not os.path.exists(output_path):
+                return "File was not converted"
+        elif os.path.exists(file_path):
+            return "File was not converted"
+    return error
+
+
+def record_job_state(journal, file_path, lane, error, output_path=None):
+    error = job_error(file_path, lane, error, output_path)
+    journal.mark(file_path, FAILED if error else DONE, error)
+
+
+def converter_name(job):
+    conversion = job["conversion"]
+    converter = find_converter(
+        job["name"],
+        conversion["selected_media_types"],
+        conversion["convert_type"],
+        os.path.join(job["root"], job["name"]),
+    )
+    return converter["name"] if converter else job["lane"]
+
+
+def assign_lane(job, selected_media_types, convert_type, path=None):
+    """Sets the media type, lane and cores of a job from its converter.
+
+    path is the file to sniff, the job's own path by default.
+    """
+    name = job["name"]
+    if path is None and "root" in job:
+        path = os.path.join(job["root"], name)
+    already_converted = any(
+        os.path.splitext(name)[0].lower().endswith(suffix)
+        for suffix in converted_suffixes
+    )
+    converter = None
+    if not already_converted:
+        converter = find_converter(name, selected_media_types, convert_type, path)
 
-    error_log_path = initialize_error_log(destination_folder)
+    if converter is None:
+        media_type, lane = "other", "other"
+    else:
+        media_type, lane = converter["cost_class"], converter["lane"]
+
+    job["media_type"] = media_type
+    job["lane"] = lane
+    job["cores"] = job_cores.get(media_type, 1)
+    return job
+
+
+def prepare_conversion(
+    destination_folder,
+    convert_type,
+    selected_media_types,
+    journal=None,
+    jobs=None,
+    tree=None,
+):
+    """Collects the jobs of one destination folder, unless they are given (resume, plan).
+
+    The jobs are collected from the tree index when one is given, and the
+    conversion keeps it up to date.
+    """
+    if jobs is None:
+        jobs = [
+            assign_lane(job, selected_media_types, convert_type)
+            for job in collect_jobs(destination_folder, selected_media_types, tree)
+        ]
+        if tree:
+            for job in jobs:
+                if job["lane"] != "other":
+                    job["bytes"] = tree.size(os.path.join(job["root"], job["name"]))
+        if journal:
+            journal.start_run(
+                jobs,
+                destination_folder=destination_folder,
+                convert_type=convert_type,
+                selected_media_types=selected_media_types,
+            )
+    # Events go to the state folder, the error CSV is written next to the files
+    timestamp = time.strftime("%Y%m%d-%H%M")
+    state_root = journal.root if journal else destination_folder
+    conversion = {
+        "destination_folder": destination_folder,
+        "convert_type": convert_type,
+        "selected_media_types": selected_media_types,
+        "journal": journal,
+        "jobs": jobs,
+        "tree": tree,
+        "event_log": EventLog(state_path(state_root, f"events_{timestamp}.jsonl")),
+        "error_log_path": os.path.join(
+            destination_folder, f"conversion_errors_{timestamp}.csv"
+        ),
+    }
+    for job in jobs:
+        job["conversion"] = conversion
+    return conversion
+
+
+def run_conversions(conversions, core_budget=None):
+    """Runs the jobs of all prepared conversions through one shared scheduler."""
+    print("[bold cyan]Starting conversion[/bold cyan] :gear:")
+    cache = get_conversion_cache()
+    cache_before = cache.stats() if cache else None
 
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
         BarColumn(),
         TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TextColumn("[progress.files] {task.completed}/{task.total} :file_folder:"),
+        TextColumn("{task.fields[throughput]}"),
+        TextColumn("ETA {task.fields[eta]}"),
         TextColumn("{task.fields[current_file]}"),
     ) as progress:
-        total_files, _ = count_files_and_folders(
-            destination_folder, selected_media_types
-        )
+        jobs = [job for conversion in conversions for job in conversion["jobs"]]
         convert_task = progress.add_task(
             "[bold blue]Converting files...[/bold blue]",
-            total=total_files,
+            total=None,
             current_file="",
+            throughput="",
+            eta="--:--",
+        )
+        # Estimates order the jobs longest first and predict the makespan
+        estimate_jobs(jobs, lambda job: job["conversion"]["convert_type"])
+        # Progress is weighted by the input bytes of the files to convert
+        converted_jobs = [job for job in jobs if job["lane"] != "other"]
+        tracker = ConversionProgress(
+            progress,
+            convert_task,
+            [
+                (os.path.join(job["root"], job["name"]), converter_name(job))
+                for job in converted_jobs
+            ],
+            {
+                os.path.join(job["root"], job["name"]): job["bytes"]
+                for job in converted_jobs
+                if job.get("bytes") is not None
+            },
         )
+        jobs = batch_image_jobs(jobs, image_batch_size)
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for root, dirs, files in os.walk(destination_folder):
-                file_tasks = [
-                    executor.submit(
-                        process_file,
-                        convert_type,
-                        destination_folder,
-                        file,
-                        root,
-                        progress,
-                        convert_task,
-                        selected_media_types,
-                        error_log_path,
-                    )
-                    for file in files + dirs
-                    if file != ".DS_Store"
-                ]
-                concurrent.futures.wait(file_tasks)
+        def run_job(job):
+            conversion = job["conversion"]
+            journal = conversion["journal"]
+            if "paths" in job:
+                process_image_batch(
+                    image_engine,
+                    job,
+                    conversion["convert_type"],
+                    conversion["selected_media_types"],
+                    tracker,
+                    conversion["event_log"],
+                    journal,
+                    conversion["tree"],
+                )
+                return
+            file_path = os.path.join(job["root"], job["name"])
+            if journal:
+                journal.mark(file_path, RUNNING)
+            error = process_file(
+                conversion["convert_type"],
+                conversion["destination_folder"],
+                job["name"],
+                job["root"],
+                tracker,
+                conversion["selected_media_types"],
+                conversion["event_log"],
+                threads=job["cores"],
+                tree=conversion["tree"],
+                output_path=job.get("output"),
+            )
+            if journal:
+                record_job_state(
+                    journal, file_path, job["lane"], error, job.get("output")
+                )
+
+        # Pillow holds the GIL, images are converted on worker processes instead
+        with metrics.stage("convert_files") as stage_counts:
+            with ImageEngine(core_budget or default_core_budget) as image_engine:
+                lanes = dict(
+                    converter_lanes, pillow={"max_jobs": image_engine.workers}
+                )
+                stats = run_jobs(jobs, run_job, core_budget=core_budget, lanes=lanes)
+            stage_counts["files"] = sum(
+                converter["files"] for converter in tracker.converters.values()
+            )
 
         final_completed = progress.tasks[convert_task].completed
         progress.update(convert_task, total=final_completed, completed=final_completed)
 
-    # Check if the error log is empty and remove it if so
-    if os.path.exists(error_log_path):
-        with open(error_log_path, mode="r") as error_file:
-            lines = error_file.readlines()
-            if len(lines) <= 1:
-                os.remove(error_log_path)
-                print(
-                    "[bold green]No errors logged. Empty error log file removed.[/bold green]"
-                )
+    for conversion in conversions:
+        event_log = conversion["event_log"]
+        event_log.close()
+        # The CSV report only lists the failures of the event stream
+        failures = write_error_report(event_log.path, conversion["error_log_path"])
+        if failures:
+            print(
+                f"[bold red]{failures} errors logged:[/bold red] {conversion['error_log_path']}"
+            )
+        else:
+            print("[bold green]No errors logged.[/bold green]")
+        print(f"[bold cyan]Events:[/bold cyan] {event_log.path}")
 
+    print(f"[bold cyan]Scheduler:[/bold cyan] {format_scheduler_stats(stats)}")
+    for line in image_engine.format_worker_stats():
+        print(f"[bold cyan]Image engine:[/bold cyan] {line}")
+    for line in tracker.format_converter_stats():
+        print(f"[bold cyan]Throughput:[/bold cyan] {line}")
+    if cache:
+        # Image workers share the index, their hits are counted as well
+        cache_stats = stats_since(cache_before, cache.stats())
+        metrics.record_cache(cache_stats)
+        print(f"[bold cyan]Cache:[/bold cyan] {format_cache_stats(cache_stats)}")
 
-def convert_folder(
-    source_folder, convert_type, selected_media_types, destination_folder=None
+
+def convert_files(
+    destination_folder,
+    convert_type,
+    selected_media_types,
+    core_budget=None,
+    journal=None,
+    jobs=None,
 ):
-    destination_folder = clone_folder(
-        source_folder, convert_type, selected_media_types, destination_folder
+    """Converts every file of the tree, or only the given jobs when resuming."""
+    conversion = prepare_conversion(
+        destination_folder, convert_type, selected_media_types, journal, jobs
     )
+    run_conversions([conversion], core_budget)
+
 
-    # Check if bagit.txt exists and update destination_folder to use the 'data' folder
-    if os.path.exists(os.path.join(destination_folder, "bagit.txt")):
-        destination_folder = os.path.join(destination_folder, "data")
+def convert_folders(folder_jobs, core_budget=None):
+    """Clones, renames and converts several SIP folders through one shared worker pool.
+
+    Each item of folder_jobs holds source_folder, convert_type, selected_media_types
+    and optionally destination_folder.
+    """
+    metrics.reset()
+    conversions = []
+    try:
+        for folder_job in folder_jobs:
+            with metrics.stage("clone_folder"):
+                destination_root = clone_folder(
+                    folder_job["source_folder"],
+                    folder_job["convert_type"],
+                    folder_job["selected_media_types"],
+                    folder_job.get("destination_folder"),
+                )
+            destination_folder = destination_root
+
+            # Check if bagit.txt exists and update destination_folder to use the 'data' folder
+            if os.path.exists(os.path.join(destination_folder, "bagit.txt")):
+                destination_folder = os.path.join(destination_folder, "data")
+
+            # Scanned once, the following stages walk and update the index
+            with metrics.stage("scan_tree"):
+                tree = TreeIndex(destination_folder)
+            with metrics.stage("rename_files_and_folders"):
+                rename_files_and_folders(
+                    destination_folder, folder_job["selected_media_types"], tree
+                )
+            conversion = prepare_conversion(
+                destination_folder,
+                folder_job["convert_type"],
+                folder_job["selected_media_types"],
+                journal=ConversionJournal(destination_root),
+                tree=tree,
+            )
+            # These stages went over the files the conversion just collected
+            for stage in ("clone_folder", "scan_tree", "rename_files_and_folders"):
+                metrics.add_stage_files(stage, len(conversion["jobs"]))
+            conversions.append(conversion)
+
+        run_conversions(conversions, core_budget)
+        for conversion in conversions:
+            print_journal_summary(conversion["journal"])
+    finally:
+        for conversion in conversions:
+            conversion["journal"].close()
 
-    rename_files_and_folders(destination_folder, selected_media_types)
-    convert_files(destination_folder, convert_type, selected_media_types)
     print("[bold magenta2]Cleaning up...[/bold magenta2]")
-    delete_empty_folders(destination_folder)
+    with metrics.stage("delete_empty_folders"):
+        for conversion in conversions:
+            delete_empty_folders(
+                conversion["destination_folder"], tree=conversion["tree"]
+            )
+    report_metrics([conversion["journal"].root for conversion in conversions])
 
     console.print(
         "[bold green]:heavy_check_mark: Conversion completed![/bold green] :sparkles:"
     )
+
+
+def convert_folder(
+    source_folder,
+    convert_type,
+    selected_media_types,
+    destination_folder=None,
+    core_budget=None,
+):
+    convert_folders(
+        [
+            {
+                "source_folder": source_folder,
+                "convert_type": convert_type,
+                "selected_media_types": selected_media_types,
+                "destination_folder": destination_folder,
+            }
+        ],
+        core_budget,
+    )
+
+
+def resume_conversion(destination_root, core_budget=None):
+    """Finishes an interrupted conversion from its journal, without re-walking the tree."""
+    if not ConversionJournal.exists(destination_root):
+        print(
+            f"[bold red]No conversion journal found in {destination_root}. Nothing to resume.[/bold red]"
+        )
+        return False
+
+    metrics.reset()
+    journal = ConversionJournal(destination_root)
+    try:
+        meta = journal.meta()
+        jobs = []
+        interrupted_roots = set()
+        for job in journal.unfinished_jobs():
+            file_path = os.path.join(job["root"], job["name"])
+            output_path = job["output"]
+            if job["state"] == RUNNING:
+                interrupted_roots.add(
+                    os.path.dirname(output_path) if output_path else job["root"]
+                )
+            if output_path is not None and os.path.exists(output_path):
+                # Outputs are committed whole, the source input stays
+                journal.mark(file_path, DONE)
+                continue
+            if not os.path.exists(file_path):
+                if output_path is not None:
+                    journal.mark(file_path, FAILED, "Source file is missing")
+                    continue
+                # Inputs are only removed once their output is in place
+                journal.mark(file_path, DONE)
+                continue
+            # The journal keeps no media type, the estimates need it
+            jobs.append(
+                assign_lane(job, meta["selected_media_types"], meta["convert_type"])
+            )
+        for root in interrupted_roots:
+            remove_stale_outputs(root)
+
+        print(f"[bold cyan]Resuming conversion:[/bold cyan] {len(jobs)} files left")
+        if jobs:
+            convert_files(
+                meta["destination_folder"],
+                meta["convert_type"],
+                meta["selected_media_types"],
+                core_budget,
+                journal=journal,
+                jobs=jobs,
+            )
+        print_journal_summary(journal)
+    finally:
+        journal.close()
+
+    print("[bold magenta2]Cleaning up...[/bold magenta2]")
+    with metrics.stage("delete_empty_folders"):
+        delete_empty_folders(meta["destination_folder"])
+    report_metrics([destination_root])
+    console.print(
+        "[bold green]:heavy_check_mark: Conversion resumed and completed![/bold green] :sparkles:"
+    )
+    return True
+
+
+def report_metrics(destination_roots):
+    """Prints the stage metrics and writes the run metrics of each destination."""
+    for line in format_stage_stats(metrics.summary()):
+        print(f"[bold cyan]Stage:[/bold cyan] {line}")
+    for destination_root in destination_roots:
+        for folder in metrics.write(destination_root):
+            print(f"[bold cyan]Metrics:[/bold cyan] {folder}")
+
+
+def print_journal_summary(journal):
+    counts = journal.counts()
+    print(
+        f"[bold cyan]Journal:[/bold cyan] {counts.get(DONE, 0)} done, "
+        f"{counts.get(FAILED, 0)} failed ({journal.path})"
+    )
@@ -1,5 +1,6 @@
 import inquirer
-from utils.convert import convert_folder
+from utils.convert import convert_folder, resume_conversion
+from utils.plan import plan_conversion, execute_plan
 from utils.clone import clone_folder
 from utils.rename import rename_files_and_folders
 import tkinter as tk
@@ -32,7 +33,7 @@ def reset_terminal():
             pass
 
 
-def select_folder():
+def select_folder(ask=None, title="Select Source Folder"):
     # Save terminal state before using tkinter
     if sys.stdin.isatty():
         try:
@@ -45,7 +46,7 @@ def select_folder():
     root.withdraw()
     folder = None
     try:
-        folder = filedialog.askdirectory(title="Select Source Folder")
+        folder = (ask or filedialog.askdirectory)(title=title)
     finally:
         root.destroy()
         tk._default_root = None  # Ensure the default root is cleared
@@ -59,6 +60,10 @@ def select_folder():
     return folder
 
 
+def select_file(title):
+    return select_folder(ask=filedialog.askopenfilename, title=title)
+
+
 def select_format_type():
     convert_type_options = [
         inquirer.List(
@@ -150,6 +155,9 @@ def dialog():
                     message="What do you want to do today?",
                     choices=[
                         "Clone/update and convert directory",
+                        "Resume interrupted conversion",
+                        "Plan conversion (dry run)",
+                        "Convert from plan file",
                         "apply Bagit format",
                         "Check Bag integrity",
                         "Clone directory",
@@ -172,6 +180,26 @@ def dialog():
                 source_folder, convert_type, selected_media_types = select_format_type()
                 convert_folder(source_folder, convert_type, selected_media_types)
                 continue
+            elif action == "Plan conversion (dry run)":
+                source_folder, convert_type, selected_media_types = select_format_type()
+                if not source_folder:
+                    continue
+                plan_conversion(source_folder, convert_type, selected_media_types)
+                continue
+            elif action == "Convert from plan file":
+                plan_path = select_file("Select Plan File")
+                if not plan_path:
+                    print("[bold red]No plan selected. Please try again.[/bold red]")
+                    continue
+                execute_plan(plan_path)
+                continue
+            elif action == "Resume interrupted conversion":
+                destination_folder = select_folder()
+                if not destination_folder:
+                    print("[bold red]No folder selected. Please try again.[/bold red]")
+                    continue
+                resume_conversion(destination_folder)
+                continue
             elif action == "Clone directory":
                 conversion_options = [
                     inquirer.Checkbox(
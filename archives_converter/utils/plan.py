@@ -0,0 +1,435 @@
+import os
+import csv
+import json
+import time
+import concurrent.futures
+from rich import print
+
+from helpers.folders import clone_tree
+from helpers.classifier import classify
+from helpers.clone_engine import copy_files, format_clone_stats
+from helpers.to_snake_case import to_snake_case
+from helpers.probe import probe_duration
+from helpers.estimates import estimate_seconds
+from helpers.journal import ConversionJournal
+from helpers.delete_empty_folders import delete_empty_folders
+from helpers.bagit import format_bag_size
+from helpers.converters.registry import find_converter, output_path_for
+from helpers.metrics import metrics
+from utils.clone import default_destination_folder, clone_digest_store
+from utils.convert import (
+    assign_lane,
+    convert_files,
+    print_journal_summary,
+    report_metrics,
+)
+from config.resources import default_core_budget
+from config.estimates import output_size_ratios, media_speed, copy_speed
+
+PLAN_FIELDS = [
+    "source",
+    "clone",
+    "output",
+    "action",
+    "media_type",
+    "converter",
+    "lane",
+    "cores",
+    "bytes",
+    "duration",
+    "estimated_output_bytes",
+    "estimated_seconds",
+]
+
+
+def dvd_output_name(video_ts_parent, convert_type, working_folder):
+    # Same name as the merged output of convert_dvd_to_format
+    output_format = "mkv" if convert_type == "AIP" else "mp4"
+    output_suffix = "ffv1" if output_format == "mkv" else output_format
+    base_name = os.path.basename(video_ts_parent or working_folder)
+    return os.path.join(video_ts_parent, f"{base_name}_{output_suffix}.{output_format}")
+
+
+def plan_entry(
+    source_folder,
+    working_folder,
+    source_path,
+    convert_type,
+    media_types,
+    clone_path=None,
+):
+    if clone_path is None:
+        clone_path = to_snake_case(os.path.relpath(source_path, source_folder))
+    clone_root, clone_name = os.path.split(clone_path)
+
+    if "dvd" in media_types and os.path.basename(clone_root) == "VIDEO_TS":
+        name = "VIDEO_TS"
+        job = assign_lane({"name": name}, media_types, convert_type)
+        output_path = dvd_output_name(
+            os.path.dirname(clone_root), convert_type, working_folder
+        )
+    else:
+        name = clone_name
+        # The clone is not there yet, its source is sniffed instead
+        job = assign_lane({"name": name}, media_types, convert_type, source_path)
+        output_path = clone_path
+
+    converter = None
+    if job["media_type"] != "other":
+        converter = find_converter(name, media_types, convert_type, source_path)
+        if converter["output_extension"]:
+            output_path = output_path_for(
+                clone_path, converter, classify(source_path, name).extension
+            )
+
+    if os.path.exists(os.path.join(working_folder, output_path)):
+        action = "skip"
+    elif job["media_type"] == "other":
+        action = "copy"
+    else:
+        action = "convert"
+
+    return {
+        "source": os.path.relpath(source_path, source_folder),
+        "clone": clone_path,
+        "output": output_path,
+        "action": action,
+        "media_type": job["media_type"],
+        "converter": converter["name"] if converter else "",
+        "lane": job["lane"],
+        "cores": job["cores"],
+        "bytes": os.path.getsize(source_path),
+        "duration": None,
+    }
+
+
+def estimate_entry(entry, convert_type):
+    media_type = entry["media_type"]
+    entry["estimated_output_bytes"] = int(
+        entry["bytes"] * output_size_ratios[convert_type].get(media_type, 1.0)
+    )
+
+    seconds = estimate_seconds(
+        media_type, convert_type, entry["bytes"], entry["duration"]
+    )
+    entry["estimated_seconds"] = round(seconds, 2)
+
+
+def summarize_plan(entries, core_budget):
+    pending = [entry for entry in entries if entry["action"] != "skip"]
+    converted = [entry for entry in pending if entry["action"] == "convert"]
+
+    input_bytes = sum(entry["bytes"] for entry in pending)
+    core_seconds = sum(
+        entry["estimated_seconds"] * max(1, min(entry["cores"], core_budget))
+        for entry in converted
+    )
+    longest_job = max((entry["estimated_seconds"] for entry in converted), default=0)
+    # LibreOffice documents are converted one at a time
+    document_time = sum(
+        entry["estimated_seconds"]
+        for entry in converted
+        if entry["media_type"] == "document"
+    )
+    conversion_seconds = max(core_seconds / core_budget, longest_job, document_time)
+    copy_seconds = input_bytes / copy_speed
+
+    media_types = {}
+    for entry in pending:
+        media_types[entry["media_type"]] = media_types.get(entry["media_type"], 0) + 1
+
+    return {
+        "files": len(entries),
+        "skipped_files": len(entries) - len(pending),
+        "copied_files": len(pending) - len(converted),
+        "converted_files": len(converted),
+        "media_types": media_types,
+        "input_bytes": input_bytes,
+        "media_duration": round(sum(entry["duration"] or 0 for entry in pending), 2),
+        "estimated_output_bytes": sum(
+            entry["estimated_output_bytes"] for entry in pending
+        ),
+        "estimated_copy_seconds": round(copy_seconds, 2),
+        "estimated_conversion_seconds": round(conversion_seconds, 2),
+        "estimated_wall_seconds": round(copy_seconds + conversion_seconds, 2),
+    }
+
+
+def build_plan(
+    source_folder,
+    convert_type,
+    selected_media_types,
+    destination_folder=None,
+    core_budget=None,
+):
+    """Computes what convert_folder would do, without copying or converting anything."""
+    print("[bold cyan]Planning conversion[/bold cyan] :mag:")
+    core_budget = core_budget or default_core_budget
+    if destination_folder is None:
+        destination_folder = default_destination_folder(source_folder, convert_type)
+    working_folder = destination_folder
+    if os.path.exists(os.path.join(destination_folder, "bagit.txt")):
+        working_folder = os.path.join(destination_folder, "data")
+
+    entries = []
+    # Clone paths as clone_folder would copy them
+    _, files = clone_tree(source_folder, selected_media_types)
+    for source_path, clone_path in files:
+        if os.path.basename(source_path) == ".DS_Store":
+            continue
+        entries.append(
+            plan_entry(
+                source_folder,
+                working_folder,
+                source_path,
+                convert_type,
+                selected_media_types,
+                clone_path,
+            )
+        )
+
+    # Durations only come from container metadata, probe them concurrently
+    to_probe = [
+        entry
+        for entry in entries
+        if entry["action"] == "convert"
+        and entry["media_type"] in media_speed[convert_type]
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        durations = executor.map(
+            lambda entry: probe_duration(os.path.join(source_folder, entry["source"])),
+            to_probe,
+        )
+        for entry, duration in zip(to_probe, durations):
+            entry["duration"] = duration
+
+    for entry in entries:
+        estimate_entry(entry, convert_type)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source_folder": source_folder,
+        "destination_folder": destination_folder,
+        "working_folder": working_folder,
+        "convert_type": convert_type,
+        "selected_media_types": selected_media_types,
+        "core_budget": core_budget,
+        "totals": summarize_plan(entries, core_budget),
+        "entries": entries,
+    }
+
+
+def write_plan(plan, path):
+    """Writes the plan as JSON, or its entries as CSV when the path ends in .csv."""
+    if path.lower().endswith(".csv"):
+        with open(path, mode="w", newline="", encoding="utf-8") as plan_file:
+            writer = csv.DictWriter(plan_file, fieldnames=PLAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(plan["entries"])
+    else:
+        with open(path, mode="w", encoding="utf-8") as plan_file:
+            json.dump(plan, plan_file, indent=2)
+    return path
+
+
+def load_plan(path):
+    with open(path, encoding="utf-8") as plan_file:
+        return json.load(plan_file)
+
+
+def print_plan_summary(plan):
+    totals = plan["totals"]
+    print(f"[bold cyan]Plan for[/bold cyan] {plan['source_folder']}")
+    print(f"  Destination: {plan['destination_folder']} ({plan['convert_type']})")
+    print(
+        f"  Files: {totals['files']} ({totals['converted_files']} to convert, "
+        f"{totals['copied_files']} to copy, {totals['skipped_files']} already done)"
+    )
+    for media_type, count in sorted(totals["media_types"].items()):
+        print(f"    {media_type}: {count}")
+    print(f"  Input size: {format_bag_size(totals['input_bytes'])}")
+    print(f"  Media duration: {totals['media_duration'] / 3600:.2f} h")
+    print(
+        f"  Estimated output size: {format_bag_size(totals['estimated_output_bytes'])}"
+    )
+    print(
+        f"  Estimated wall time: {totals['estimated_wall_seconds'] / 3600:.2f} h "
+        f"(copy {totals['estimated_copy_seconds'] / 3600:.2f} h, "
+        f"conversion {totals['estimated_conversion_seconds'] / 3600:.2f} h "
+        f"on {plan['core_budget']} cores)"
+    )
+
+
+def plan_conversion(
+    source_folder,
+    convert_type,
+    selected_media_types,
+    core_budget=None,
+    destination_folder=None,
+    output_path=None,
+):
+    """Builds the plan and exports it, by default as JSON and CSV next to the source."""
+    plan = build_plan(
+        source_folder,
+        convert_type,
+        selected_media_types,
+        destination_folder,
+        core_budget,
+    )
+    if output_path:
+        output_paths = [write_plan(plan, output_path)]
+    else:
+        timestamp = time.strftime("%Y%m%d-%H%M")
+        base_path = os.path.join(
+            os.path.dirname(source_folder),
+            f"plan_{os.path.basename(source_folder)}_{timestamp}",
+        )
+        output_paths = [
+            write_plan(plan, f"{base_path}.json"),
+            write_plan(plan, f"{base_path}.csv"),
+        ]
+    print_plan_summary(plan)
+    print(f"[bold blue]Plan saved to {' and '.join(output_paths)}[/bold blue]")
+    return plan
+
+
+def converted_from_source(entry, direct):
+    # DVD converters work in their VIDEO_TS folder, it is cloned first
+    return direct and entry["action"] == "convert" and entry["media_type"] != "dvd"
+
+
+def execute_plan(plan, core_budget=None, direct=False):
+    """Runs a conversion straight from a plan: no walk, rename or re-check of the tree.
+
+    With direct, files are converted from the source folder into the
+    destination and only the files that are not converted are copied.
+    """
+    if isinstance(plan, str):
+        plan = load_plan(plan)
+    source_folder = plan["source_folder"]
+    working_folder = plan["working_folder"]
+    convert_type = plan["convert_type"]
+    selected_media_types = plan["selected_media_types"]
+    entries = [entry for entry in plan["entries"] if entry["action"] != "skip"]
+    metrics.reset()
+
+    cloned = [entry for entry in entries if not converted_from_source(entry, direct)]
+    print("[bold yellow]Cloning planned files...[/bold yellow]")
+    os.makedirs(plan["destination_folder"], exist_ok=True)
+    digests = clone_digest_store(plan["destination_folder"])
+    with metrics.stage("clone_folder") as stage_counts:
+        stats = copy_files(
+            [
+                (
+                    os.path.join(source_folder, entry["source"]),
+                    os.path.join(working_folder, entry["clone"]),
+                )
+                for entry in cloned
+            ],
+            description="Copying planned files...",
+            digests=digests,
+        )
+        stage_counts["files"] = len(cloned)
+    if digests is not None:
+        digests.close()
+    print(f"[bold cyan]Clone:[/bold cyan] {format_clone_stats(stats)}")
+
+    jobs = []
+    video_ts_jobs = {}
+    output_folders = set()
+    for entry in entries:
+        if entry["action"] != "convert":
+            continue
+        if converted_from_source(entry, direct):
+            source_root, source_name = os.path.split(
+                os.path.join(source_folder, entry["source"])
+            )
+            output_path = os.path.join(working_folder, entry["output"])
+            if os.path.dirname(output_path) not in output_folders:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                output_folders.add(os.path.dirname(output_path))
+            jobs.append(
+                {
+                    "root": source_root,
+                    "name": source_name,
+                    "media_type": entry["media_type"],
+                    "lane": entry["lane"],
+                    "cores": entry["cores"],
+                    "estimated_seconds": entry["estimated_seconds"],
+                    "output": output_path,
+                }
+            )
+            continue
+        clone_root, clone_name = os.path.split(
+            os.path.join(working_folder, entry["clone"])
+        )
+        if entry["media_type"] == "dvd":
+            # The whole VIDEO_TS folder is a single conversion job
+            if clone_root in video_ts_jobs:
+                video_ts_jobs[clone_root]["estimated_seconds"] += entry[
+                    "estimated_seconds"
+                ]
+                continue
+            video_ts_folder = clone_root
+            clone_root, clone_name = os.path.split(clone_root)
+        jobs.append(
+            {
+                "root": clone_root,
+                "name": clone_name,
+                "media_type": entry["media_type"],
+                "lane": entry["lane"],
+                "cores": entry["cores"],
+                "estimated_seconds": entry["estimated_seconds"],
+            }
+        )
+        if entry["media_type"] == "dvd":
+            video_ts_jobs[video_ts_folder] = jobs[-1]
+
+    journal = ConversionJournal(plan["destination_folder"])
+    try:
+        journal.start_run(
+            jobs,
+            destination_folder=working_folder,
+            convert_type=convert_type,
+            selected_media_types=selected_media_types,
+        )
+        convert_files(
+            working_folder,
+            convert_type,
+            selected_media_types,
+            core_budget or plan.get("core_budget"),
+            journal=journal,
+            jobs=jobs,
+        )
+        print_journal_summary(journal)
+    finally:
+        journal.close()
+
+    print("[bold magenta2]Cleaning up...[/bold magenta2]")
+    with metrics.stage("delete_empty_folders"):
+        delete_empty_folders(working_folder)
+    report_metrics([plan["destination_folder"]])
+    print("[bold green]:heavy_check_mark: Conversion completed![/bold green] :sparkles:")
+
+
+def convert_direct(
+    source_folder,
+    convert_type,
+    selected_media_types,
+    destination_folder=None,
+    core_budget=None,
+):
+    """Converts a SIP folder into its destination without cloning it first.
+
+    The clone is only planned: converters read the source files and write
+    their outputs under snake_case names, the other files are copied.
+    """
+    plan = build_plan(
+        source_folder,
+        convert_type,
+        selected_media_types,
+        destination_folder,
+        core_budget,
+    )
+    print_plan_summary(plan)
+    execute_plan(plan, core_budget, direct=True)
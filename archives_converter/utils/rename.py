@@ -1,6 +1,8 @@
 import os
-from helpers.to_snake_case import to_snake_case
-from helpers.folders import count_files_and_folders
+import json
+import glob
+import time
+from helpers.to_snake_case import to_snake_case, snake_case_names
 from rich.progress import (
     Progress,
     BarColumn,
@@ -9,11 +11,94 @@ from rich.progress import (
     SpinnerColumn,
 )
 from rich import print
-from config.formats import text_files_to_ignore
+from helpers.state import STATE_FOLDER, state_path, state_root
 
+# Renames written to the undo journal, and made durable, before they are applied
+RENAME_BATCH = 1000
+RENAME_JOURNAL_PREFIX = "rename_"
+UNDONE_PREFIX = "undone_"
 
-def rename_files_and_folders(folder, selected_media_types):
+
+def plan_renames(folder, tree=None):
+    """Every rename of the tree as (folder, old name, new name), deepest first.
+
+    A folder is renamed after what it holds, so the folder of every rename is
+    still its path from before the renaming.
+    """
+    walk = tree.walk(folder, topdown=False) if tree else os.walk(folder, topdown=False)
+    renames = []
+    for root, dirs, files in walk:
+        # The bookkeeping of the converter keeps its names
+        if STATE_FOLDER in os.path.relpath(root, folder).split(os.sep):
+            continue
+        for old_name, new_name in snake_case_names(files, dirs).items():
+            renames.append((root, old_name, new_name))
+    return renames
+
+
+def rename_journal_path(folder):
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    return state_path(state_root(folder), f"{RENAME_JOURNAL_PREFIX}{timestamp}.jsonl")
+
+
+def apply_renames(renames, journal_path, on_rename=None, tree=None):
+    """Applies planned renames in batches, each written to the undo journal first.
+
+    Paths in the journal are relative to the folder holding it. A rename whose
+    target appeared since the planning is left out. Returns the number applied.
+    """
+    journal_root = os.path.dirname(os.path.dirname(journal_path))
+    applied = 0
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        for start in range(0, len(renames), RENAME_BATCH):
+            batch = renames[start : start + RENAME_BATCH]
+            for root, old_name, new_name in batch:
+                entry = {
+                    "old": os.path.relpath(os.path.join(root, old_name), journal_root),
+                    "new": os.path.relpath(os.path.join(root, new_name), journal_root),
+                }
+                journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+            for root, old_name, new_name in batch:
+                old_path = os.path.join(root, old_name)
+                new_path = os.path.join(root, new_name)
+                if os.path.lexists(new_path):
+                    print(
+                        f"[bold orange]Not renamed, {new_name} already exists: "
+                        f"{old_path}[/bold orange]"
+                    )
+                else:
+                    os.rename(old_path, new_path)
+                    if tree:
+                        tree.rename(old_path, new_path)
+                    applied += 1
+                if on_rename:
+                    on_rename()
+    return applied
+
+
+def rename_files_and_folders(folder, selected_media_types=None, tree=None):
+    """Renames the tree to snake_case, bottom-up.
+
+    The whole mapping is planned first, collisions included, then applied
+    with an undo journal in the state folder (see undo_renames). Every name
+    is renamed, selected_media_types is kept for the callers passing it. With
+    a tree index the index is walked and kept up to date instead of the
+    filesystem.
+    """
     print("[bold cyan]Starting renaming files and folders[/bold cyan] :pencil2:")
+    renames = plan_renames(folder, tree)
+    for root, old_name, new_name in renames:
+        if new_name != to_snake_case(old_name):
+            print(
+                f"[bold salmon1]Name taken, renamed {old_name} to {new_name} "
+                f"in {root}[/bold salmon1]"
+            )
+    if not renames:
+        print("[bold green]Nothing to rename[/bold green]")
+        return 0
 
     with Progress(
         SpinnerColumn(),
@@ -22,34 +107,51 @@ def rename_files_and_folders(folder, selected_media_types):
         TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
         TimeRemainingColumn(),
     ) as progress:
-        total_files, total_folders = count_files_and_folders(
-            folder, selected_media_types
-        )
-        total_items = total_files + total_folders
         rename_task = progress.add_task(
-            "[bold blue]Renaming items...[/bold blue]", total=total_items
+            "[bold blue]Renaming items...[/bold blue]", total=len(renames)
+        )
+        applied = apply_renames(
+            renames,
+            rename_journal_path(folder),
+            lambda: progress.advance(rename_task),
+            tree,
         )
+    print(f"[bold cyan]Renamed:[/bold cyan] {applied} of {len(renames)} items")
+    return applied
+
+
+def latest_rename_journal(folder):
+    journals = glob.glob(
+        os.path.join(
+            state_root(folder), STATE_FOLDER, f"{RENAME_JOURNAL_PREFIX}*.jsonl"
+        )
+    )
+    return max(journals) if journals else None
+
+
+def undo_renames(folder, journal_path=None):
+    """Gives back their names to the entries of the last rename of folder.
+
+    Entries renamed since, or converted away, are left as they are. The
+    journal is kept, marked undone. Returns the number of names given back.
+    """
+    journal_path = journal_path or latest_rename_journal(folder)
+    if journal_path is None:
+        print(f"[bold red]No rename to undo in {folder}[/bold red]")
+        return 0
+    journal_root = os.path.dirname(os.path.dirname(journal_path))
+    with open(journal_path, encoding="utf-8") as journal:
+        entries = [json.loads(line) for line in journal if line.strip()]
 
-        for root, dirs, files in os.walk(folder, topdown=False):
-            # Rename files
-            for file in files:
-                if (
-                    file == ".DS_Store"
-                    or file.startswith(".")
-                    or file in text_files_to_ignore
-                ):  # Skip .DS_Store files and hidden files
-                    continue
-                new_name = to_snake_case(file)
-                os.rename(os.path.join(root, file), os.path.join(root, new_name))
-                progress.advance(rename_task)
-
-            # Rename folders
-            for dir in dirs:
-                if dir == "VIDEO_TS" or file.startswith("."):  # Skip VIDEO_TS folders
-                    progress.advance(rename_task)
-                    continue
-                new_name = to_snake_case(dir)
-                os.rename(os.path.join(root, dir), os.path.join(root, new_name))
-                progress.advance(rename_task)
-
-        progress.update(rename_task, completed=total_items)
+    restored = 0
+    # Folders were renamed after their content, they get their names back first
+    for entry in reversed(entries):
+        old_path = os.path.join(journal_root, entry["old"])
+        new_path = os.path.join(journal_root, entry["new"])
+        if os.path.lexists(new_path) and not os.path.lexists(old_path):
+            os.rename(new_path, old_path)
+            restored += 1
+    journal_folder, journal_name = os.path.split(journal_path)
+    os.rename(journal_path, os.path.join(journal_folder, UNDONE_PREFIX + journal_name))
+    print(f"[bold cyan]Undone:[/bold cyan] {restored} of {len(entries)} names restored")
+    return restored
@@ -0,0 +1,312 @@
+import os
+import logging
+import threading
+import time
+from rich import print
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
+
+from helpers.work_queue import SharedQueue, default_worker_id, DONE, FAILED
+from helpers.scheduler import CoreBudget, collect_jobs, join_workers
+from helpers.estimates import estimate_jobs, longest_first
+from helpers.tool_runner import ToolCancelled, reset_cancellation
+from helpers.converters.image_pool import ImageEngine
+from helpers.converters.registry import find_converter, output_path_for
+from helpers.atomic_output import discard_output, temp_output_path
+from helpers.conversion_progress import ConversionProgress
+from helpers.event_log import EventLog, write_error_report
+from helpers.delete_empty_folders import delete_empty_folders
+from helpers.tree_index import TreeIndex
+from helpers.metrics import metrics, format_stage_stats
+from helpers.conversion_cache import (
+    get_conversion_cache,
+    stats_since,
+    format_cache_stats,
+)
+from helpers.state import state_path, STATE_FOLDER
+from utils.clone import clone_folder
+from utils.rename import rename_files_and_folders
+from utils.convert import assign_lane, process_file, process_image_batch, job_error
+from config.resources import converter_lanes, default_core_budget, image_batch_size
+
+QUEUE_FOLDER_NAME = "queue"
+
+
+def default_queue_folder(destination_root):
+    # The state folder of the destination is on the NAS every worker mounts
+    return os.path.join(destination_root, STATE_FOLDER, QUEUE_FOLDER_NAME)
+
+
+def submit_folder(
+    source_folder,
+    convert_type,
+    selected_media_types,
+    destination_folder=None,
+    queue_folder=None,
+    lease_seconds=None,
+):
+    """Clones and renames a SIP folder, then queues its conversion for workers.
+
+    Returns the queue folder to start the workers on.
+    """
+    destination_root = clone_folder(
+        source_folder, convert_type, selected_media_types, destination_folder
+    )
+    destination_folder = destination_root
+    if os.path.exists(os.path.join(destination_folder, "bagit.txt")):
+        destination_folder = os.path.join(destination_folder, "data")
+    # Scanned once for the renaming and the queued jobs
+    tree = TreeIndex(destination_folder)
+    rename_files_and_folders(destination_folder, selected_media_types, tree)
+
+    # Files no converter takes stay where they are, they are not queued
+    jobs = [
+        job
+        for job in (
+            assign_lane(job, selected_media_types, convert_type)
+            for job in collect_jobs(destination_folder, selected_media_types, tree)
+        )
+        if job["lane"] != "other"
+    ]
+    for job in jobs:
+        job["bytes"] = tree.size(os.path.join(job["root"], job["name"]))
+    # Workers claim in queue order, the longest files go first
+    jobs = longest_first(estimate_jobs(jobs, lambda job: convert_type))
+    queue_folder = queue_folder or default_queue_folder(destination_root)
+    options = {"lease_seconds": lease_seconds} if lease_seconds else {}
+    SharedQueue.create(
+        queue_folder,
+        jobs,
+        destination_root=destination_root,
+        destination_folder=destination_folder,
+        convert_type=convert_type,
+        selected_media_types=selected_media_types,
+        **options,
+    )
+    print(f"[bold green]Queued {len(jobs)} files:[/bold green] {queue_folder}")
+    print(f"Start workers with: python archives_converter worker {queue_folder}")
+    return queue_folder
+
+
+def discard_partial_output(job, meta):
+    """Removes the temporary output a dead worker left for a job."""
+    input_path = os.path.join(job["root"], job["name"])
+    converter = find_converter(
+        job["name"], meta["selected_media_types"], meta["convert_type"], input_path
+    )
+    if converter and converter["output_extension"]:
+        discard_output(temp_output_path(output_path_for(input_path, converter)))
+
+
+def run_worker(queue_folder, core_budget=None, worker_id=None):
+    """Converts jobs of a shared queue until it is drained.
+
+    Several workers, on one host or on several hosts mounting the queue, can
+    run at once. Each claims jobs lane by lane within its own core budget and
+    beats every quarter of the lease so its jobs are not reclaimed.
+    """
+    if not SharedQueue.exists(queue_folder):
+        print(f"[bold red]No conversion queue found in {queue_folder}.[/bold red]")
+        return False
+
+    metrics.reset()
+    reset_cancellation()
+    queue = SharedQueue(queue_folder)
+    meta = queue.meta
+    worker_id = worker_id or default_worker_id()
+    budget = CoreBudget(core_budget or default_core_budget)
+    timestamp = time.strftime("%Y%m%d-%H%M")
+    # One event stream and error report per worker, no file is written by two hosts
+    event_log = EventLog(
+        state_path(meta["destination_root"], f"events_{timestamp}_{worker_id}.jsonl")
+    )
+    error_log_path = os.path.join(
+        meta["destination_folder"], f"conversion_errors_{timestamp}_{worker_id}.csv"
+    )
+    cache = get_conversion_cache()
+    cache_before = cache.stats() if cache else None
+    counts = {DONE: 0, FAILED: 0}
+    counts_lock = threading.Lock()
+    stop = threading.Event()
+
+    def reclaim():
+        queue.reclaim_expired(worker_id, lambda job: discard_partial_output(job, meta))
+
+    def beat():
+        while not stop.wait(queue.lease_seconds / 4):
+            # A NAS hiccup must not stop the beats, the leases would expire
+            # and other workers would convert the claimed jobs again
+            try:
+                with counts_lock:
+                    queue.heartbeat(worker_id, **counts)
+                reclaim()
+                queue_counts = queue.counts()
+            except OSError as e:
+                logging.warning(f"Worker {worker_id} could not reach the queue: {e}")
+                continue
+            progress.update(
+                convert_task,
+                total=meta["jobs"],
+                completed=queue_counts[DONE] + queue_counts[FAILED],
+                workers=queue_counts["workers"],
+            )
+
+    def finish(job, error):
+        queue.complete(job, error)
+        with counts_lock:
+            counts[FAILED if error else DONE] += 1
+        progress.advance(convert_task)
+
+    def claim(lane):
+        if lane != "pillow":
+            job = queue.claim(lane, worker_id)
+            return [job] if job else []
+        jobs = []
+        while len(jobs) < image_batch_size:
+            job = queue.claim(lane, worker_id)
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def convert(lane, jobs):
+        todo = []
+        for job in jobs:
+            path = os.path.join(job["root"], job["name"])
+            if os.path.exists(path):
+                todo.append((job, path))
+            else:
+                # Reclaimed from a worker presumed dead that converted it after all
+                finish(job, None)
+        if not todo:
+            return
+        if lane == "pillow":
+            batch = {"name": f"{len(todo)} images", "paths": [path for _, path in todo]}
+            granted = budget.acquire(
+                1, sum(job.get("estimated_seconds") or 0.0 for job, _ in todo)
+            )
+            try:
+                errors = process_image_batch(
+                    image_engine,
+                    batch,
+                    meta["convert_type"],
+                    meta["selected_media_types"],
+                    tracker,
+                    event_log,
+                )
+            finally:
+                budget.release(granted)
+            for job, path in todo:
+                finish(job, job_error(path, lane, errors.get(path)))
+            return
+        job, path = todo[0]
+        granted = budget.acquire(job["cores"], job.get("estimated_seconds"))
+        try:
+            error = process_file(
+                meta["convert_type"],
+                meta["destination_folder"],
+                job["name"],
+                job["root"],
+                tracker,
+                meta["selected_media_types"],
+                event_log,
+                threads=granted,
+            )
+        finally:
+            budget.release(granted)
+        finish(job, job_error(path, lane, error))
+
+    def drain(lane):
+        while not stop.is_set():
+            jobs = claim(lane)
+            if not jobs:
+                # Jobs of dead workers may come back to any lane until the end
+                if queue.is_drained():
+                    return
+                time.sleep(queue.poll_interval())
+                continue
+            try:
+                convert(lane, jobs)
+            except ToolCancelled:
+                # Stopped by Ctrl-C, the other workers take the jobs over
+                for job in jobs:
+                    if os.path.exists(job["lease"]):
+                        queue.release(job)
+                return
+            except Exception as e:
+                for job in jobs:
+                    if os.path.exists(job["lease"]):
+                        finish(job, str(e))
+
+    queue.heartbeat(worker_id, **counts)
+    reclaim()
+    print(f"[bold cyan]Worker {worker_id}[/bold cyan] converting from {queue_folder}")
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TextColumn("{task.fields[workers]} workers"),
+        TextColumn("{task.fields[current_file]}"),
+    ) as progress:
+        convert_task = progress.add_task(
+            "[bold blue]Converting queue...[/bold blue]",
+            total=None,
+            current_file="",
+            workers=1,
+        )
+        # Files are claimed as the run goes, progress follows the queue counts
+        tracker = ConversionProgress(progress, convert_task, [])
+        progress.update(convert_task, total=meta["jobs"], completed=0)
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        with metrics.stage("convert_files") as stage_counts:
+            with ImageEngine(budget.total) as image_engine:
+                lanes = dict(
+                    converter_lanes, pillow={"max_jobs": image_engine.workers}
+                )
+                threads = []
+                for lane in queue.lanes():
+                    lane_config = lanes.get(lane, lanes["other"])
+                    max_jobs = lane_config.get("max_jobs") or budget.total
+                    for _ in range(max(1, min(max_jobs, budget.total))):
+                        threads.append(
+                            threading.Thread(target=drain, args=(lane,), daemon=True)
+                        )
+                for thread in threads:
+                    thread.start()
+                try:
+                    join_workers(threads, stop)
+                except KeyboardInterrupt:
+                    queue.leave(worker_id)
+                    raise
+            stage_counts["files"] = counts[DONE] + counts[FAILED]
+        stop.set()
+        heartbeat.join()
+
+    queue.leave(worker_id)
+    event_log.close()
+    failures = write_error_report(event_log.path, error_log_path)
+    if failures:
+        print(f"[bold red]{failures} errors logged:[/bold red] {error_log_path}")
+    print(
+        f"[bold cyan]Worker {worker_id}:[/bold cyan] {counts[DONE]} done, "
+        f"{counts[FAILED]} failed"
+    )
+
+    # The last worker out cleans up once for everybody
+    if queue.is_drained() and queue.mark_finished():
+        delete_empty_folders(meta["destination_folder"])
+        queue_counts = queue.counts()
+        print(
+            f"[bold green]:heavy_check_mark: Queue completed:[/bold green] "
+            f"{queue_counts[DONE]} done, {queue_counts[FAILED]} failed"
+        )
+    if cache:
+        # Shared with the other workers of the cache, counts theirs too
+        cache_stats = stats_since(cache_before, cache.stats())
+        metrics.record_cache(cache_stats)
+        print(f"[bold cyan]Cache:[/bold cyan] {format_cache_stats(cache_stats)}")
+    for line in format_stage_stats(metrics.summary()):
+        print(f"[bold cyan]Stage:[/bold cyan] {line}")
+    metrics.write(meta["destination_root"], f"metrics_{worker_id}")
+    return True
@@ -0,0 +1,334 @@
+"""Benchmarks every registered converter on the synthetic corpus.
+
+Each converter runs in both the AIP and DIP profiles, in a fresh process so
+its peak RSS is its own. Results are written as JSON with sorted keys and no
+timestamps, two runs diff cleanly:
+
+    python benchmarks/bench_converters.py --output results.json
+    python benchmarks/bench_converters.py compare old.json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+sys.path.insert(0, os.path.join(REPOSITORY_FOLDER, "archives_converter"))
+
+from corpus import DEFAULT_SEED, load_corpus  # noqa: E402
+
+PROFILES = ["AIP", "DIP"]
+MEDIA_TYPES = ["image", "audio", "video", "dvd", "text"]
+TOOLS = {
+    "ffmpeg": ["ffmpeg", "-version"],
+    "gs": ["gs", "--version"],
+    "unoconv": ["unoconv", "--version"],
+    "exiftool": ["exiftool", "-ver"],
+}
+DEFAULT_CORPUS = os.path.join(tempfile.gettempdir(), "archives_converter_corpus")
+
+
+def benchmark_key(converter):
+    # convert_pdfa is registered twice, for PDFs and for office documents
+    return f"{converter['name']}:{converter['cost_class']}"
+
+
+def _rusage():
+    import resource
+
+    return (
+        resource.getrusage(resource.RUSAGE_SELF),
+        resource.getrusage(resource.RUSAGE_CHILDREN),
+    )
+
+
+def _cpu_seconds(rusages):
+    return sum(rusage.ru_utime + rusage.ru_stime for rusage in rusages)
+
+
+def _folder_size(folder):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(folder)
+        for name in files
+    )
+
+
+def _input_kind(path):
+    # Extension of a file input, name of a folder input (VIDEO_TS)
+    return os.path.splitext(path)[1].lower() or os.path.basename(path)
+
+
+def _convert_once(converter, input_path, scratch_folder, threads):
+    """Converts input_path once, returns (seconds, output bytes, error)."""
+    if converter["output_extension"] is None:
+        # Folder converters (DVDs) consume their input, convert a copy of the disc
+        disc_folder = os.path.join(
+            scratch_folder, os.path.basename(os.path.dirname(input_path))
+        )
+        shutil.copytree(os.path.dirname(input_path), disc_folder)
+        input_path = os.path.join(disc_folder, os.path.basename(input_path))
+        output_path = None
+    else:
+        from helpers.converters.registry import output_path_for
+
+        output_path = output_path_for(
+            os.path.join(scratch_folder, os.path.basename(input_path)), converter
+        )
+
+    start_time = time.perf_counter()
+    try:
+        converted = converter["convert"](input_path, output_path, threads=threads)
+        error = None if converted else "no output"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start_time
+
+    if output_path is None:
+        output_bytes = _folder_size(disc_folder) - _folder_size(input_path)
+    elif os.path.exists(output_path):
+        output_bytes = os.path.getsize(output_path)
+    else:
+        output_bytes = 0
+    return seconds, output_bytes, error
+
+
+def run_benchmark(profile, key, inputs, repeat, threads):
+    """Runs one converter on its inputs repeat times, in a dedicated process."""
+    from helpers.converters.registry import registered_converters
+    from helpers.metrics import max_rss_bytes
+
+    converter = next(
+        converter
+        for converter in registered_converters()
+        if converter["convert_type"] == profile and benchmark_key(converter) == key
+    )
+    before = _rusage()
+    extensions = {}
+    errors = {}
+    for input_path, input_bytes in inputs:
+        stats = extensions.setdefault(
+            _input_kind(input_path),
+            {"files": 0, "input_bytes": 0, "output_bytes": 0, "runs": []},
+        )
+        stats["files"] += 1
+        stats["input_bytes"] += input_bytes
+        seconds = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory(prefix="bench_") as scratch_folder:
+                run_seconds, output_bytes, error = _convert_once(
+                    converter, input_path, scratch_folder, threads
+                )
+            seconds.append(run_seconds)
+            if error:
+                errors[os.path.basename(input_path)] = error
+        stats["output_bytes"] += output_bytes
+        stats["runs"].append(seconds)
+    after = _rusage()
+
+    return {
+        "extensions": extensions,
+        "errors": errors,
+        "cpu_seconds": (_cpu_seconds(after) - _cpu_seconds(before)) / repeat,
+        "peak_rss_bytes": max(max_rss_bytes(rusage) for rusage in after),
+    }
+
+
+def _rates(files, input_bytes, output_bytes, seconds):
+    return {
+        "files": files,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "seconds": round(seconds, 3),
+        "files_per_second": round(files / seconds, 3) if seconds else None,
+        "mb_per_second": round(input_bytes / seconds / 1e6, 3) if seconds else None,
+        "output_ratio": round(output_bytes / input_bytes, 4) if input_bytes else None,
+    }
+
+
+def summarize(measurement):
+    """Median seconds of every input over the repetitions, totalled per extension."""
+    extensions = {}
+    totals = {"files": 0, "input_bytes": 0, "output_bytes": 0, "seconds": 0.0}
+    for extension, stats in measurement["extensions"].items():
+        seconds = sum(statistics.median(runs) for runs in stats["runs"])
+        extensions[extension] = _rates(
+            stats["files"], stats["input_bytes"], stats["output_bytes"], seconds
+        )
+        for key in ("files", "input_bytes", "output_bytes"):
+            totals[key] += stats[key]
+        totals["seconds"] += seconds
+    result = _rates(**totals)
+    result.update(
+        {
+            "extensions": extensions,
+            "errors": measurement["errors"],
+            "cpu_seconds": round(measurement["cpu_seconds"], 3),
+            "peak_rss_bytes": measurement["peak_rss_bytes"],
+        }
+    )
+    return result
+
+
+def tool_versions():
+    versions = {}
+    for tool, command in TOOLS.items():
+        try:
+            output = subprocess.run(
+                command, capture_output=True, text=True, timeout=30
+            ).stdout
+            versions[tool] = output.strip().splitlines()[0] if output.strip() else None
+        except (OSError, subprocess.TimeoutExpired):
+            versions[tool] = None
+    return versions
+
+
+def plan_benchmarks(corpus_folder, manifest, profiles, only=None):
+    """Groups the corpus inputs by profile and converter key."""
+    from helpers.converters.registry import find_converter
+
+    plan = {}
+    inputs = sorted(manifest["files"].items())
+    for profile in profiles:
+        for relative_path, entry in inputs:
+            path = os.path.join(corpus_folder, relative_path)
+            name = os.path.basename(path)
+            if name.upper().endswith(".VOB"):
+                # The DVD is converted as a whole from its VIDEO_TS folder
+                path = os.path.dirname(path)
+                name = os.path.basename(path)
+            converter = find_converter(name, MEDIA_TYPES, profile)
+            if converter is None:
+                continue
+            key = benchmark_key(converter)
+            if only and converter["name"] not in only and key not in only:
+                continue
+            group = plan.setdefault(profile, {}).setdefault(key, {})
+            group[path] = group.get(path, 0) + entry["bytes"]
+    return plan
+
+
+def run_benchmarks(
+    corpus_folder, profiles, repeat, threads, only=None, seed=DEFAULT_SEED
+):
+    manifest = load_corpus(corpus_folder, seed)
+    plan = plan_benchmarks(corpus_folder, manifest, profiles, only)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for profile, groups in sorted(plan.items()):
+        for key, inputs in sorted(groups.items()):
+            print(f"{profile} {key}: {len(inputs)} inputs x {repeat}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                measurement = executor.submit(
+                    run_benchmark,
+                    profile,
+                    key,
+                    sorted(inputs.items()),
+                    repeat,
+                    threads,
+                ).result()
+            result = summarize(measurement)
+            results.setdefault(profile, {})[key] = result
+            print(
+                f"  {result['files_per_second']} files/s, "
+                f"{result['mb_per_second']} MB/s, "
+                f"{result['peak_rss_bytes'] / 1e6:.0f} MB peak RSS, "
+                f"output ratio {result['output_ratio']}, "
+                f"{len(result['errors'])} errors"
+            )
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tools": tool_versions(),
+        },
+        "corpus": {
+            "seed": manifest["seed"],
+            "digest": manifest["digest"],
+            "files": len(manifest["files"]),
+            "bytes": manifest["bytes"],
+            "skipped": sorted(manifest["skipped"]),
+        },
+        "repeat": repeat,
+        "threads": threads,
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    """Prints the throughput change of every converter between two result files."""
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    if old["corpus"]["digest"] != new["corpus"]["digest"]:
+        print("Warning: the results were measured on different corpora")
+    for profile, results in sorted(new["results"].items()):
+        for key, result in sorted(results.items()):
+            previous = old["results"].get(profile, {}).get(key)
+            if not previous or not previous["mb_per_second"]:
+                print(f"{profile} {key}: new")
+                continue
+            change = (result["mb_per_second"] or 0) / previous["mb_per_second"] - 1
+            print(
+                f"{profile} {key}: {previous['mb_per_second']} -> "
+                f"{result['mb_per_second']} MB/s ({change:+.1%}), peak RSS "
+                f"{previous['peak_rss_bytes'] / 1e6:.0f} -> "
+                f"{result['peak_rss_bytes'] / 1e6:.0f} MB"
+            )
+
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if arguments[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="bench_converters.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        options = parser.parse_args(arguments[1:])
+        compare(options.old, options.new)
+        return 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the converters")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="corpus folder")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="0 lets tools pick")
+    parser.add_argument(
+        "--profiles", default=",".join(PROFILES), help="comma separated"
+    )
+    parser.add_argument(
+        "--converters",
+        default="",
+        help="comma separated converter names (convert_tiff, convert_pdfa:pdf...)",
+    )
+    options = parser.parse_args(arguments)
+
+    only = {name.strip() for name in options.converters.split(",") if name.strip()}
+    report = run_benchmarks(
+        options.corpus,
+        [profile.strip().upper() for profile in options.profiles.split(",")],
+        max(1, options.repeat),
+        options.threads,
+        only,
+        options.seed,
+    )
+    with open(options.output, "w") as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+        output_file.write("\n")
+    print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""Benchmarks the non-media stages on large synthetic trees.
+
+Deep and wide trees of small files are built in tmpfs and on disk. The
+stages of a conversion that only walk and copy the tree (counting, clone,
+rename, empty folder cleanup and bagging) are timed one by one, each in a
+child process. A second pass counts their system calls with strace, or with
+Python audit hooks where strace is missing or not permitted:
+
+    python benchmarks/bench_filesystem.py --files 1000000 --output fs.json
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from collections import Counter
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+sys.path.insert(0, os.path.join(REPOSITORY_FOLDER, "archives_converter"))
+
+DEFAULT_SEED = 20240501
+MEDIA_TYPES = ["image", "audio", "video", "dvd", "text"]
+SHAPES = ["deep", "wide"]
+STAGES = [
+    "count_files_and_folders",
+    "clone",
+    "rename",
+    "delete_empty_folders",
+    "apply_bag",
+]
+# Baseline stage, the interpreter start-up calls it measures are subtracted
+NOOP_STAGE = "noop"
+TMPFS_FOLDER = "/dev/shm"
+
+# Top level folders, each one becomes a bag
+COLLECTIONS = 4
+WIDE_FILES_PER_FOLDER = 2000
+DEEP_BRANCHING = 2
+DEEP_FILES_PER_FOLDER = 8
+# One folder in EMPTY_FOLDER_EVERY is left empty for delete_empty_folders
+EMPTY_FOLDER_EVERY = 50
+MAX_FILE_BYTES = 4096
+# Names with spaces and capitals, so rename has work on every item
+FILE_NAMES = ["Scan {index:06d} Final", "Letter To Board {index}", "IMG_{index:05d}"]
+FILE_EXTENSIONS = [".jpg", ".TIF", ".wav", ".pdf", ".txt", ".docx", ".xml", ".dat"]
+
+FILESYSTEM_SYSCALLS = {
+    "access",
+    "chmod",
+    "close",
+    "copy_file_range",
+    "faccessat",
+    "faccessat2",
+    "fchmod",
+    "fchmodat",
+    "fgetxattr",
+    "flistxattr",
+    "fsetxattr",
+    "fstat",
+    "fstatfs",
+    "getdents64",
+    "getxattr",
+    "lgetxattr",
+    "listxattr",
+    "llistxattr",
+    "lseek",
+    "lsetxattr",
+    "lstat",
+    "mkdir",
+    "mkdirat",
+    "newfstatat",
+    "open",
+    "openat",
+    "read",
+    "readlink",
+    "rename",
+    "renameat",
+    "renameat2",
+    "rmdir",
+    "sendfile",
+    "setxattr",
+    "stat",
+    "statx",
+    "unlink",
+    "unlinkat",
+    "utimensat",
+    "write",
+}
+# Audit events of filesystem calls, when counting without strace
+FILESYSTEM_AUDIT_EVENTS = ("open", "os.", "shutil.")
+
+
+def _folder_paths(shape, folders):
+    """Relative paths of the folders of a tree shape, in creation order."""
+    if shape == "wide":
+        return [
+            os.path.join(f"Collection {index % COLLECTIONS}", f"Box {index:05d}")
+            for index in range(folders)
+        ]
+    # A full binary tree under every collection, deep enough for the leaves
+    depth = max(8, math.ceil(math.log(max(1, folders), DEEP_BRANCHING)))
+    paths = []
+    for index in range(folders):
+        digits = []
+        value = index
+        for _ in range(depth):
+            value, digit = divmod(value, DEEP_BRANCHING)
+            digits.append(f"Level {len(digits)} Part {digit}")
+        paths.append(os.path.join(f"Collection {index % COLLECTIONS}", *digits))
+    return paths
+
+
+def build_tree(root, shape, files, seed=DEFAULT_SEED):
+    """Builds a tree of small files, returns its file and folder counts."""
+    rng = random.Random(f"{seed}:{shape}")
+    files_per_folder = (
+        WIDE_FILES_PER_FOLDER if shape == "wide" else DEEP_FILES_PER_FOLDER
+    )
+    folder_paths = _folder_paths(shape, max(1, math.ceil(files / files_per_folder)))
+    written = 0
+    for folder_index, folder_path in enumerate(folder_paths):
+        folder = os.path.join(root, folder_path)
+        os.makedirs(folder, exist_ok=True)
+        if folder_index % EMPTY_FOLDER_EVERY == 0:
+            os.makedirs(os.path.join(folder, "Empty Folder"), exist_ok=True)
+        for _ in range(min(files_per_folder, files - written)):
+            name = rng.choice(FILE_NAMES).format(index=written)
+            extension = FILE_EXTENSIONS[written % len(FILE_EXTENSIONS)]
+            with open(os.path.join(folder, name + extension), "wb") as tree_file:
+                tree_file.write(rng.randbytes(rng.randint(0, MAX_FILE_BYTES)))
+            written += 1
+    folders = sum(len(dirs) for _, dirs, _ in os.walk(root))
+    return written, folders
+
+
+def filesystem_type(path):
+    """Type of the filesystem mounted on the longest prefix of path."""
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                _, mount_point, mount_type = line.split()[:3]
+                if (
+                    path == mount_point
+                    or path.startswith(mount_point.rstrip("/") + "/")
+                ) and len(mount_point) > len(best):
+                    best, best_type = mount_point, mount_type
+    except OSError:
+        return None
+    return best_type
+
+
+def _run_stage(stage, source, destination):
+    # Imported by the caller before measuring, only the stage itself is counted
+    from helpers.folders import count_files_and_folders
+    from helpers.delete_empty_folders import delete_empty_folders
+    from utils.clone import clone_folder
+    from utils.rename import rename_files_and_folders
+    from utils.apply_bag import create_bags
+
+    if stage == "count_files_and_folders":
+        count_files_and_folders(source, MEDIA_TYPES)
+    elif stage == "clone":
+        clone_folder(source, "AIP", MEDIA_TYPES, destination)
+    elif stage == "rename":
+        rename_files_and_folders(destination, MEDIA_TYPES)
+    elif stage == "delete_empty_folders":
+        delete_empty_folders(destination)
+    elif stage == "apply_bag":
+        create_bags(destination)
+
+
+def stage_main(arguments):
+    """Child process entry point: runs one stage and writes its measures."""
+    parser = argparse.ArgumentParser(prog="bench_filesystem.py stage")
+    parser.add_argument("stage")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("report")
+    parser.add_argument("--audit", action="store_true")
+    options = parser.parse_args(arguments)
+
+    import utils.clone  # noqa: F401
+    import utils.rename  # noqa: F401
+    import utils.apply_bag  # noqa: F401
+    import helpers.delete_empty_folders  # noqa: F401
+    from helpers.metrics import metrics
+
+    events = Counter()
+    if options.audit:
+        # Audit hooks cannot be removed, the process ends with the stage
+        sys.addaudithook(lambda event, _: events.update((event,)))
+    with metrics.stage(options.stage):
+        if options.stage != NOOP_STAGE:
+            _run_stage(options.stage, options.source, options.destination)
+    stats = metrics.summary()["stages"][options.stage]
+    if options.audit:
+        stats["syscalls"] = dict(events)
+    with open(options.report, "w") as report_file:
+        json.dump(stats, report_file)
+    return 0
+
+
+def parse_strace_summary(path):
+    """Calls per system call from the table strace -c writes."""
+    calls = {}
+    with open(path) as summary_file:
+        for line in summary_file:
+            parts = line.split()
+            # % time, seconds, usecs/call, calls, [errors,] syscall
+            if len(parts) >= 5 and parts[0][0].isdigit() and parts[3].isdigit():
+                calls[parts[-1]] = calls.get(parts[-1], 0) + int(parts[3])
+    return calls
+
+
+def run_stage(stage, source, destination, scratch_folder, syscalls=None):
+    """Runs a stage in a child process; syscalls is None, "strace" or "audit"."""
+    report = os.path.join(scratch_folder, f"{stage}.json")
+    command = [sys.executable, os.path.abspath(__file__), "stage", stage]
+    command += [source, destination, report]
+    if syscalls == "audit":
+        command.append("--audit")
+    elif syscalls == "strace":
+        strace_summary = os.path.join(scratch_folder, f"{stage}.strace")
+        command = ["strace", "-f", "-c", "-o", strace_summary] + command
+    subprocess.run(
+        command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    with open(report) as report_file:
+        stats = json.load(report_file)
+    if syscalls == "strace":
+        stats["syscalls"] = parse_strace_summary(strace_summary)
+    return stats
+
+
+def strace_available(scratch_folder):
+    """strace is installed and allowed to trace (containers often forbid ptrace)."""
+    if not shutil.which("strace"):
+        return False
+    try:
+        run_stage(NOOP_STAGE, scratch_folder, scratch_folder, scratch_folder, "strace")
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+
+def _syscall_summary(calls, baseline):
+    calls = {
+        name: count - baseline.get(name, 0)
+        for name, count in calls.items()
+        if count - baseline.get(name, 0) > 0
+    }
+    return {
+        "total": sum(calls.values()),
+        "filesystem": sum(
+            count
+            for name, count in calls.items()
+            if name in FILESYSTEM_SYSCALLS or name.startswith(FILESYSTEM_AUDIT_EVENTS)
+        ),
+        "calls": calls,
+    }
+
+
+def _last_line(stderr):
+    lines = (stderr or b"").decode(errors="replace").strip().splitlines()
+    return lines[-1] if lines else "failed"
+
+
+def _stage_result(stats, items):
+    wall_seconds = stats["wall_seconds"]
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(stats["cpu_seconds"], 3),
+        "read_bytes": stats["read_bytes"],
+        "write_bytes": stats["write_bytes"],
+        "items_per_second": round(items / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+def benchmark_location(location, shapes, files, count_syscalls, seed):
+    """Builds every tree shape under location and measures the stages on it."""
+    results = {}
+    bench_folder = tempfile.mkdtemp(prefix="archives_converter_fs_", dir=location)
+    try:
+        scratch_folder = os.path.join(bench_folder, "reports")
+        os.makedirs(scratch_folder)
+        syscalls = None
+        if count_syscalls:
+            syscalls = "strace" if strace_available(scratch_folder) else "audit"
+        baseline = {}
+        if syscalls:
+            baseline = run_stage(
+                NOOP_STAGE, scratch_folder, scratch_folder, scratch_folder, syscalls
+            )["syscalls"]
+
+        for shape in shapes:
+            source = os.path.join(bench_folder, f"SIP_{shape}")
+            destination = os.path.join(bench_folder, f"AIP_{shape}")
+            print(f"{location}: building the {shape} tree of {files} files...")
+            tree_files, tree_folders = build_tree(source, shape, files, seed)
+            items = tree_files + tree_folders
+            stages = {}
+            for stage in STAGES:
+                try:
+                    stats = run_stage(stage, source, destination, scratch_folder)
+                except subprocess.CalledProcessError as e:
+                    stages[stage] = {"error": _last_line(e.stderr)}
+                    print(f"  {stage} failed: {stages[stage]['error']}")
+                    continue
+                stages[stage] = _stage_result(stats, items)
+                print(f"  {stage}: {stages[stage]['wall_seconds']}s")
+            if syscalls:
+                # Counting slows the stages down, it is a pass of its own
+                shutil.rmtree(destination, ignore_errors=True)
+                for stage in STAGES:
+                    if "error" in stages[stage]:
+                        continue
+                    try:
+                        stats = run_stage(
+                            stage, source, destination, scratch_folder, syscalls
+                        )
+                    except subprocess.CalledProcessError as e:
+                        stages[stage]["syscalls"] = {"error": _last_line(e.stderr)}
+                        continue
+                    stages[stage]["syscalls"] = _syscall_summary(
+                        stats["syscalls"], baseline
+                    )
+            results[shape] = {
+                "files": tree_files,
+                "folders": tree_folders,
+                "stages": stages,
+            }
+            shutil.rmtree(source)
+            shutil.rmtree(destination, ignore_errors=True)
+    finally:
+        shutil.rmtree(bench_folder, ignore_errors=True)
+    return results, syscalls
+
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if arguments[:1] == ["stage"]:
+        return stage_main(arguments[1:])
+
+    parser = argparse.ArgumentParser(description="Benchmark the filesystem stages")
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="comma separated")
+    parser.add_argument("--tmpfs", default=TMPFS_FOLDER, help="tmpfs folder")
+    parser.add_argument(
+        "--disk", default=tempfile.gettempdir(), help="folder on a disk filesystem"
+    )
+    parser.add_argument("--no-syscalls", action="store_true")
+    parser.add_argument("--output", default="filesystem_benchmark_results.json")
+    options = parser.parse_args(arguments)
+
+    shapes = [shape.strip() for shape in options.shapes.split(",") if shape.strip()]
+    locations = {}
+    for name, folder in (("tmpfs", options.tmpfs), ("disk", options.disk)):
+        if not os.path.isdir(folder) or not os.access(folder, os.W_OK):
+            print(f"Skipping {name}: {folder} is not a writable folder")
+            continue
+        fs_type = filesystem_type(folder)
+        if (name == "tmpfs") != (fs_type == "tmpfs"):
+            print(f"Warning: {folder} is on {fs_type}, not on {name}")
+        results, syscalls = benchmark_location(
+            folder, shapes, options.files, not options.no_syscalls, options.seed
+        )
+        locations[name] = {
+            "folder": folder,
+            "filesystem": fs_type,
+            "syscall_counter": syscalls,
+            "shapes": results,
+        }
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "files": options.files,
+        "seed": options.seed,
+        "locations": locations,
+    }
+    with open(options.output, "w") as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+        output_file.write("\n")
+    print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""Deterministic media corpus for the converter benchmarks.
+
+Everything is generated offline from fixed seeds: Pillow images, ffmpeg lavfi
+tones, noise and test patterns, a fake DVD and office documents. Generating
+twice with the same seed gives the same corpus, its manifest (corpus.json)
+lists the size and sha256 of every file.
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import hashlib
+import zipfile
+import argparse
+import subprocess
+
+DEFAULT_SEED = 20240501
+MANIFEST_NAME = "corpus.json"
+
+IMAGE_SIZES = [(256, 256), (1024, 768), (1920, 1080), (4096, 3072)]
+IMAGE_FORMATS = {
+    ".jpg": ("JPEG", {"quality": 92}),
+    ".png": ("PNG", {}),
+    ".tif": ("TIFF", {"compression": "tiff_lzw"}),
+    ".bmp": ("BMP", {}),
+    ".gif": ("GIF", {}),
+    ".webp": ("WEBP", {"quality": 90}),
+    ".heic": ("HEIF", {"quality": 90}),
+}
+
+AUDIO_SECONDS = 20
+# lavfi sources: a pure tone and seeded pink noise
+AUDIO_SOURCES = {
+    "tone": "sine=frequency=440:sample_rate=48000:duration={seconds}",
+    "noise": "anoisesrc=color=pink:sample_rate=48000:seed={seed}:duration={seconds}",
+}
+AUDIO_CODECS = {
+    ".wav": ["-c:a", "pcm_s16le"],
+    ".mp3": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    ".aac": ["-c:a", "aac", "-b:a", "192k", "-f", "adts"],
+    ".m4a": ["-c:a", "aac", "-b:a", "192k"],
+    ".flac": ["-c:a", "flac"],
+    ".ogg": ["-c:a", "libvorbis", "-q:a", "5"],
+    ".aif": ["-c:a", "pcm_s16be", "-f", "aiff"],
+    ".aiff": ["-c:a", "pcm_s16be", "-f", "aiff"],
+}
+
+VIDEO_SECONDS = 10
+VIDEO_SIZE = "640x360"
+# Every container gets codecs it accepts, preferring encoders built into ffmpeg
+# 3GP only takes the H.263 frame sizes and narrowband audio
+THREE_GP_CODECS = ["-s", "352x288", "-c:v", "h263", "-c:a", "aac", "-ac", "1"]
+# Every container gets codecs it accepts, preferring encoders built into ffmpeg
+VIDEO_CODECS = {
+    ".mp4": ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "aac"],
+    ".m4v": ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "aac"],
+    ".mov": ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "aac"],
+    ".mkv": ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "flac"],
+    ".avi": ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "pcm_s16le"],
+    ".wmv": ["-c:v", "wmv2", "-q:v", "4", "-c:a", "wmav2", "-f", "asf"],
+    ".flv": ["-c:v", "flv1", "-q:v", "4", "-c:a", "adpcm_swf", "-ar", "44100"],
+    ".webm": ["-c:v", "libvpx", "-b:v", "1M", "-c:a", "libvorbis"],
+    ".mpeg": ["-c:v", "mpeg2video", "-q:v", "4", "-c:a", "mp2", "-f", "mpeg"],
+    ".mpg": ["-c:v", "mpeg2video", "-q:v", "4", "-c:a", "mp2", "-f", "mpeg"],
+    ".3gp": THREE_GP_CODECS + ["-ar", "8000"],
+    ".3g2": THREE_GP_CODECS + ["-ar", "8000"],
+}
+
+# A menu shorter than the 5 seconds convert_vob_to_output skips, then two titles
+DVD_VOBS = [("VIDEO_TS.VOB", 3), ("VTS_01_1.VOB", 12), ("VTS_01_2.VOB", 12)]
+DVD_IFOS = ["VIDEO_TS.IFO", "VIDEO_TS.BUP", "VTS_01_0.IFO", "VTS_01_0.BUP"]
+
+DOCUMENT_PARAGRAPHS = 60
+# Fixed zip entry dates keep the office files byte identical between runs
+ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+RTF_HEADER = "{\\rtf1\\ansi\\deff0{\\fonttbl{\\f0 Times New Roman;}}\\f0\\fs24\n"
+ODF_NAMESPACE = "urn:oasis:names:tc:opendocument:xmlns"
+ODT_MIMETYPE = "application/vnd.oasis.opendocument.text"
+
+LOREM = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua archive fonds series dossier item "
+    "provenance accession retention appraisal"
+).split()
+
+# ffmpeg flags keeping the outputs free of version strings and timestamps
+BITEXACT = ["-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact"]
+
+
+def _ffmpeg(arguments):
+    subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + arguments,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _paragraphs(rng, count):
+    return [
+        " ".join(rng.choice(LOREM) for _ in range(rng.randint(40, 120))).capitalize()
+        + "."
+        for _ in range(count)
+    ]
+
+
+def _rewrite_zip(path, first_entry=None):
+    """Rewrites a zip with fixed entry dates, first_entry stored uncompressed first."""
+    with zipfile.ZipFile(path) as source:
+        entries = [(info.filename, source.read(info)) for info in source.infolist()]
+    if first_entry:
+        entries.sort(key=lambda entry: entry[0] != first_entry)
+    with zipfile.ZipFile(path, "w") as target:
+        for name, data in entries:
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE)
+            info.compress_type = (
+                zipfile.ZIP_STORED if name == first_entry else zipfile.ZIP_DEFLATED
+            )
+            target.writestr(info, data)
+
+
+def generate_images(folder, rng):
+    from PIL import Image
+    import pillow_heif
+
+    pillow_heif.register_heif_opener()
+    os.makedirs(folder, exist_ok=True)
+    for width, height in IMAGE_SIZES:
+        # Upscaled random tiles over a gradient look more like scans than pure
+        # noise, which no codec can compress
+        tile = Image.frombytes(
+            "RGB",
+            (max(1, width // 16), max(1, height // 16)),
+            rng.randbytes(3 * max(1, width // 16) * max(1, height // 16)),
+        ).resize((width, height), Image.BICUBIC)
+        gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        image = Image.blend(tile, gradient, 0.35)
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            path = os.path.join(folder, f"image_{width}x{height}{extension}")
+            frame = image.convert("P") if image_format == "GIF" else image
+            frame.save(path, format=image_format, **options)
+            yield path
+
+
+def generate_audio(folder, seed):
+    os.makedirs(folder, exist_ok=True)
+    for source_name, source in AUDIO_SOURCES.items():
+        lavfi = source.format(seconds=AUDIO_SECONDS, seed=seed % 2**31)
+        for extension, codec in AUDIO_CODECS.items():
+            path = os.path.join(folder, f"{source_name}{extension}")
+            _ffmpeg(
+                ["-f", "lavfi", "-i", lavfi, "-ac", "2"]
+                + BITEXACT
+                + ["-map_metadata", "-1"]
+                + codec
+                + [path]
+            )
+            yield path
+
+
+def generate_videos(folder):
+    os.makedirs(folder, exist_ok=True)
+    for extension, codecs in VIDEO_CODECS.items():
+        path = os.path.join(folder, f"testsrc{extension}")
+        _ffmpeg(
+            [
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size={VIDEO_SIZE}:rate=25:duration={VIDEO_SECONDS}",
+                "-f",
+                "lavfi",
+                "-i",
+                f"sine=frequency=1000:sample_rate=48000:duration={VIDEO_SECONDS}",
+                "-pix_fmt",
+                "yuv420p",
+            ]
+            + BITEXACT
+            + ["-map_metadata", "-1"]
+            + codecs
+            + [path]
+        )
+        yield path
+
+
+def generate_dvd(folder, rng):
+    """A DVD folder laid out like a disc: IFO/BUP files and MPEG-2 PS VOBs."""
+    video_ts_folder = os.path.join(folder, "DVD_01", "VIDEO_TS")
+    os.makedirs(video_ts_folder, exist_ok=True)
+    for name in DVD_IFOS:
+        # Converters never read the IFOs, random bytes of a typical size will do
+        path = os.path.join(video_ts_folder, name)
+        with open(path, "wb") as ifo_file:
+            ifo_file.write(b"DVDVIDEO-VMG" + rng.randbytes(12276))
+        yield path
+    for name, seconds in DVD_VOBS:
+        path = os.path.join(video_ts_folder, name)
+        _ffmpeg(
+            [
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size=720x576:rate=25:duration={seconds}",
+                "-f",
+                "lavfi",
+                "-i",
+                f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+                "-target",
+                "pal-dvd",
+            ]
+            + BITEXACT
+            + ["-f", "vob", path]
+        )
+        yield path
+
+
+def _write_odt(path, paragraphs):
+    # The smallest package LibreOffice opens: mimetype, manifest and content
+    body = "".join(f"<text:p>{paragraph}</text:p>" for paragraph in paragraphs)
+    with zipfile.ZipFile(path, "w") as odt_file:
+        odt_file.writestr("mimetype", ODT_MIMETYPE)
+        odt_file.writestr(
+            "META-INF/manifest.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<manifest:manifest xmlns:manifest="{ODF_NAMESPACE}:manifest:1.0" '
+            'manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/" '
+            f'manifest:media-type="{ODT_MIMETYPE}"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" '
+            'manifest:media-type="text/xml"/>'
+            "</manifest:manifest>",
+        )
+        odt_file.writestr(
+            "content.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            "<office:document-content "
+            f'xmlns:office="{ODF_NAMESPACE}:office:1.0" '
+            f'xmlns:text="{ODF_NAMESPACE}:text:1.0" office:version="1.2">'
+            f"<office:body><office:text>{body}</office:text></office:body>"
+            "</office:document-content>",
+        )
+    _rewrite_zip(path, first_entry="mimetype")
+
+
+def generate_documents(folder, rng):
+    """Text, RTF, ODT, DOCX and PDF documents.
+
+    No library writes legacy .doc files, they are left out of the corpus.
+    """
+    from datetime import datetime
+
+    import docx
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+    os.makedirs(folder, exist_ok=True)
+    paragraphs = _paragraphs(rng, DOCUMENT_PARAGRAPHS)
+
+    path = os.path.join(folder, "document.txt")
+    with open(path, "w", encoding="utf-8") as text_file:
+        text_file.write("\n\n".join(paragraphs) + "\n")
+    yield path
+
+    path = os.path.join(folder, "document.rtf")
+    with open(path, "w", encoding="ascii") as rtf_file:
+        rtf_file.write(RTF_HEADER)
+        for paragraph in paragraphs:
+            rtf_file.write(f"{paragraph}\\par\n")
+        rtf_file.write("}\n")
+    yield path
+
+    path = os.path.join(folder, "document.odt")
+    _write_odt(path, paragraphs)
+    yield path
+
+    path = os.path.join(folder, "document.docx")
+    document = docx.Document()
+    document.core_properties.created = datetime(*ZIP_DATE)
+    document.core_properties.modified = datetime(*ZIP_DATE)
+    for index, paragraph in enumerate(paragraphs):
+        if index % 10 == 0:
+            document.add_heading(f"Section {index // 10 + 1}", level=1)
+        document.add_paragraph(paragraph)
+    document.save(path)
+    _rewrite_zip(path)
+    yield path
+
+    path = os.path.join(folder, "document.pdf")
+    styles = getSampleStyleSheet()
+    SimpleDocTemplate(path, pagesize=A4, invariant=1).build(
+        [Paragraph(paragraph, styles["BodyText"]) for paragraph in paragraphs]
+    )
+    yield path
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as corpus_file:
+        for chunk in iter(lambda: corpus_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def generate_corpus(folder, seed=DEFAULT_SEED):
+    """Generates the corpus in folder and returns its manifest.
+
+    A media family that cannot be generated here (missing encoder or library)
+    is reported and left out, the manifest records it under "skipped".
+    """
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    # One random stream per family, a skipped family does not shift the others
+    families = {
+        "image": lambda: generate_images(
+            os.path.join(folder, "image"), random.Random(f"{seed}:image")
+        ),
+        "audio": lambda: generate_audio(os.path.join(folder, "audio"), seed),
+        "video": lambda: generate_videos(os.path.join(folder, "video")),
+        "dvd": lambda: generate_dvd(
+            os.path.join(folder, "dvd"), random.Random(f"{seed}:dvd")
+        ),
+        "text": lambda: generate_documents(
+            os.path.join(folder, "text"), random.Random(f"{seed}:text")
+        ),
+    }
+    files = {}
+    skipped = {}
+    for family, generate in families.items():
+        try:
+            for path in generate():
+                files[os.path.relpath(path, folder)] = {
+                    "bytes": os.path.getsize(path),
+                    "sha256": _sha256(path),
+                }
+        except subprocess.CalledProcessError as e:
+            skipped[family] = (e.stderr or str(e)).strip().splitlines()[-1:]
+        except Exception as e:
+            skipped[family] = [str(e)]
+        if family in skipped:
+            print(f"Could not generate the {family} corpus: {skipped[family]}")
+
+    manifest = {
+        "seed": seed,
+        "files": files,
+        "skipped": skipped,
+        "bytes": sum(entry["bytes"] for entry in files.values()),
+        "digest": hashlib.sha256(
+            json.dumps(files, sort_keys=True).encode()
+        ).hexdigest(),
+    }
+    with open(os.path.join(folder, MANIFEST_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_corpus(folder, seed=DEFAULT_SEED):
+    """Returns the manifest of the corpus in folder, generating it when missing."""
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["seed"] == seed:
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    return generate_corpus(folder, seed)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate the benchmark corpus")
+    parser.add_argument("folder", help="folder the corpus is written to")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    options = parser.parse_args(arguments)
+    manifest = generate_corpus(options.folder, options.seed)
+    print(
+        f"{len(manifest['files'])} files, {manifest['bytes'] / 1e6:.1f} MB, "
+        f"digest {manifest['digest'][:12]}"
+    )
+    return 1 if manifest["skipped"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())